@@ -0,0 +1,111 @@
+from collections import OrderedDict
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import LimitOffsetPagination, _positive_int
+from rest_framework.response import Response
+
+from shop.counting import cached_count, estimated_count
+
+
+COUNT_MODES = ('exact', 'cached', 'estimated', 'none')
+
+
+class CountModeLimitOffsetPagination(LimitOffsetPagination):
+    """
+    LimitOffsetPagination с выбором способа подсчёта общего числа строк:
+    exact — COUNT(*) на каждой странице, cached — точное число из кеша
+    до изменения каталога, estimated — оценка по статистике БД для
+    списков без фильтров (shop.counting.estimated_count), none — без
+    подсчёта, вместо count в ответе has_next. Способ задаётся атрибутом
+    count_mode представления и может быть изменён параметром запроса
+    count.
+    """
+
+    count_mode = 'exact'
+    count_mode_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_mode = self.get_count_mode(request, view)
+        if self.count_mode != 'none':
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.offset = self.get_offset(request)
+        page = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(page) > self.limit
+        # get_next_link() сравнивает offset + limit с count.
+        self.count = self.offset + len(page)
+        return page[:self.limit]
+
+    def get_count_mode(self, request, view):
+        mode = request.query_params.get(
+            self.count_mode_query_param,
+            getattr(view, 'count_mode', self.count_mode),
+        )
+        if mode not in COUNT_MODES:
+            raise ValidationError({self.count_mode_query_param: (
+                f"Допустимые значения: {', '.join(COUNT_MODES)}."
+            )})
+        return mode
+
+    def get_count(self, queryset):
+        if self.count_mode == 'cached':
+            return cached_count(queryset)
+        if self.count_mode == 'estimated':
+            return estimated_count(queryset)
+        return super().get_count(queryset)
+
+    def get_paginated_response(self, data):
+        if self.count_mode != 'none':
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('has_next', self.has_next),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+
+class AsyncLimitOffsetPagination(LimitOffsetPagination):
+    """
+    LimitOffsetPagination для асинхронных Django-представлений:
+    работает с обычным HttpRequest и асинхронным ORM, формат ответа
+    совпадает с синхронным API.
+    """
+
+    async def apaginate_queryset(self, queryset, request):
+        self.request = request
+        self.limit = self._get_param(
+            request, self.limit_query_param, self.default_limit,
+            cutoff=self.max_limit,
+        )
+        if self.limit is None:
+            return [obj async for obj in queryset]
+        self.offset = self._get_param(request, self.offset_query_param, 0)
+        self.count = await queryset.acount()
+        if self.count == 0 or self.offset > self.count:
+            return []
+        return [
+            obj async for obj in queryset[self.offset:self.offset + self.limit]
+        ]
+
+    def get_paginated_data(self, data):
+        if self.limit is None:
+            return data
+        return {
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+
+    def _get_param(self, request, name, default, cutoff=None):
+        try:
+            return _positive_int(
+                request.GET[name], strict=name == self.limit_query_param,
+                cutoff=cutoff,
+            )
+        except (KeyError, ValueError):
+            return default
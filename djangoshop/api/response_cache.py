@@ -0,0 +1,114 @@
+"""
+Кеш ответов API со stale-while-revalidate и single-flight.
+
+Данные ответа хранятся в кеше Django вместе с версией каталога
+и временем, до которого они свежие (RESPONSE_CACHE_TIMEOUT секунд).
+Пересчитывает ответ только процесс, взявший блокировку в том же кеше
+(shop.cache_locks: в Redis это атомарный SET NX, а снимает блокировку
+только её владелец), поэтому при промахе одинаковые запросы всех
+воркеров ждут одно вычисление. Устаревшие
+данные, в том числе после изменения каталога, отдаются остальным
+запросам, пока один воркер их обновляет, но не дольше
+RESPONSE_CACHE_STALE секунд после того, как они перестали быть свежими.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from shop.cache_locks import acquire_lock, release_lock
+from shop.catalog_cache import catalog_version
+
+
+POLL_INTERVAL = 0.05
+
+
+class ResponseCache:
+
+    def __init__(self, alias=None):
+        self.alias = alias or settings.RESPONSE_CACHE_ALIAS
+        self.cache = caches[self.alias]
+
+    def get_or_compute(self, key, compute, refresh=False):
+        """
+        Значение по ключу и его состояние: fresh, stale или computed.
+        Если значение пересчитывает другой процесс, а устаревшего нет,
+        ждёт его не дольше RESPONSE_CACHE_WAIT секунд, после чего
+        вычисляет значение сам. С refresh значение вычисляется сразу.
+        """
+        if refresh:
+            return self._compute(key, compute, catalog_version()), 'computed'
+        deadline = time.monotonic() + settings.RESPONSE_CACHE_WAIT
+        while True:
+            entry = self.cache.get(key)
+            version = catalog_version()
+            now = time.time()
+            if (entry and entry['version'] == version
+                    and entry['fresh_until'] > now):
+                return entry['value'], 'fresh'
+            if token := self._lock(key):
+                try:
+                    return self._compute(key, compute, version), 'computed'
+                finally:
+                    self._unlock(key, token)
+            if entry and entry['stale_until'] > now:
+                return entry['value'], 'stale'
+            if time.monotonic() >= deadline:
+                return compute(), 'computed'
+            time.sleep(POLL_INTERVAL)
+
+    def _compute(self, key, compute, version):
+        value = compute()
+        fresh_until = time.time() + settings.RESPONSE_CACHE_TIMEOUT
+        self.cache.set(key, {
+            'value': value,
+            'version': version,
+            'fresh_until': fresh_until,
+            'stale_until': fresh_until + settings.RESPONSE_CACHE_STALE,
+        }, timeout=(settings.RESPONSE_CACHE_TIMEOUT
+                    + settings.RESPONSE_CACHE_STALE))
+        return value
+
+    def _lock(self, key):
+        return acquire_lock(
+            self.alias, f'{key}:lock', settings.RESPONSE_CACHE_LOCK_TIMEOUT,
+        )
+
+    def _unlock(self, key, token):
+        release_lock(self.alias, f'{key}:lock', token)
+
+
+class CachedResponseMixin:
+    """
+    Отдаёт list и retrieve представления каталога через ResponseCache.
+    Ключ — адрес запроса с хостом: ответ не зависит от пользователя,
+    а ссылки в нём абсолютные. Запрос сброса кеша nginx
+    (shop.gateway_cache) получает свежий ответ, а не устаревший.
+    Без RESPONSE_CACHE_TIMEOUT кеш выключен.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs,
+        )
+
+    def cached_response(self, method, request, *args, **kwargs):
+        if not settings.RESPONSE_CACHE_TIMEOUT:
+            return method(request, *args, **kwargs)
+        digest = hashlib.md5(
+            f'{request.get_host()}{request.get_full_path()}'.encode(),
+            usedforsecurity=False,
+        ).hexdigest()
+        purge_token = request.headers.get(settings.CACHE_PURGE_HEADER)
+        data, state = ResponseCache().get_or_compute(
+            f'response:{digest}',
+            lambda: method(request, *args, **kwargs).data,
+            refresh=bool(purge_token)
+            and purge_token == settings.CACHE_PURGE_TOKEN,
+        )
+        return Response(data, headers={'X-Response-Cache': state})
@@ -1,15 +1,47 @@
 from rest_framework import serializers
 
+from shop.images import variant_names
 from shop.models import (
     Category, SubCategory, Product,
-    ProductImage, Cart, ProductCart,
+    ProductImage, ProductCart,
+    Order, OrderLine, RelatedProduct,
 )
 
 
+class ImageVariantsField(serializers.Field):
+    """
+    Ссылки на уменьшенные копии изображения в виде
+    {ширина: {расширение: url}}.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = 'image'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return {}
+        request = self.context.get('request')
+        return {
+            str(width): {
+                extension: self._build_url(value.storage.url(name), request)
+                for extension, name in variants.items()
+            }
+            for width, variants in variant_names(value.name).items()
+        }
+
+    def _build_url(self, url, request):
+        if request is None:
+            return url
+        return request.build_absolute_uri(url)
+
+
 class CategorySerializer(serializers.ModelSerializer):
     name = serializers.CharField()
     slug = serializers.SlugField()
     image = serializers.ImageField()
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Category
@@ -20,6 +52,7 @@ class SubCategorySerializer(serializers.ModelSerializer):
     name = serializers.CharField()
     slug = serializers.SlugField()
     image = serializers.ImageField()
+    image_variants = ImageVariantsField()
     category = CategorySerializer()
 
     class Meta:
@@ -28,6 +61,7 @@ class SubCategorySerializer(serializers.ModelSerializer):
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = ProductImage
@@ -46,6 +80,21 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class RelatedProductSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор рекомендованного продукта без вложенных объектов,
+    чтобы рекомендации читались одним запросом.
+    """
+    id = serializers.IntegerField(source='related.id')
+    name = serializers.CharField(source='related.name')
+    slug = serializers.SlugField(source='related.slug')
+    price = serializers.FloatField(source='related.price')
+
+    class Meta:
+        model = RelatedProduct
+        fields = ('id', 'name', 'slug', 'price', 'score')
+
+
 class ProductListSerializer(serializers.ModelSerializer):
     """
     Сериализатор вывода продукта в корзине.
@@ -68,23 +117,34 @@ class ProductCartSerializer(serializers.ModelSerializer):
         fields = ('product', 'quantity')
 
 
-class CartSerializer(serializers.ModelSerializer):
-    products = ProductCartSerializer(many=True, source='productcart_set')
-    full_price = serializers.SerializerMethodField()
+class CartSerializer(serializers.BaseSerializer):
+    """
+    Сериализатор корзины по списку строк ProductCart
+    с загруженными продуктами.
+    """
+
+    def to_representation(self, lines):
+        return {
+            'products': ProductCartSerializer(lines, many=True).data,
+            'full_price': sum(
+                line.product.price * line.quantity for line in lines
+            ),
+        }
+
+
+class OrderLineSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор строки заказа с ценой на момент оформления.
+    """
+
+    class Meta:
+        model = OrderLine
+        fields = ('product', 'name', 'price', 'quantity')
+
+
+class OrderSerializer(serializers.ModelSerializer):
+    lines = OrderLineSerializer(many=True)
 
     class Meta:
-        model = Cart
-        fields = ('products', 'full_price')
-
-    def get_full_price(self, value):
-        """
-        Возвращает цену всей корзины по формуле
-        (товар * количество) + (товар * количество)...
-        """
-        products = ProductCart.objects.filter(cart=value)
-        products_list = []
-        for product_cart_obj in products:
-            product = product_cart_obj.product
-            product_price = product.price * product_cart_obj.quantity
-            products_list.append(product_price)
-        return sum(products_list)
+        model = Order
+        fields = ('id', 'idempotency_key', 'total', 'created_at', 'lines')
@@ -0,0 +1,290 @@
+"""
+Снимок каталога в файле только для чтения, общий для всех воркеров.
+
+build_snapshot() сериализует категории, подкатегории и продукты
+(вместе с изображениями) теми же сериализаторами, что и API, и пишет
+в файл готовые JSON-фрагменты, отсортированный по id массив записей
+(id, смещение, длина) и отсортированный массив slug'ов. Воркеры
+отображают файл в память через mmap: страницы лежат в общем
+page cache ОС, а чтение карточки — двоичный поиск по массиву без
+запросов к БД. Новый снимок пишется во временный файл и заменяет
+старый через os.replace, воркеры открывают его при следующей проверке.
+Снимок хранит версию каталога, из которой собран, и после изменения
+каталога не используется, пока его не пересоберут.
+
+Формат (little-endian): заголовок MAGIC, версия каталога, число
+разделов; для каждого раздела из KINDS — число записей и смещения
+массивов id и slug'ов; далее фрагменты, slug'и и сами массивы.
+"""
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import json
+
+from api.serializers.shop_serializers import (
+    CategorySerializer, SubCategorySerializer, ProductSerializer,
+)
+from shop.catalog_cache import catalog_version
+from shop.models import Category, SubCategory, Product
+
+
+MAGIC = b'DSHOPSN1'
+HEADER = struct.Struct('<8sqI')
+SECTION = struct.Struct('<QQQ')
+ID_ENTRY = struct.Struct('<qQI')
+SLUG_ENTRY = struct.Struct('<QII')
+KINDS = ('categories', 'subcategories', 'products')
+# Абсолютные ссылки на изображения зависят от хоста запроса, поэтому
+# в снимке вместо него стоит ORIGIN, заменяемый при ответе.
+ORIGIN = 'http://snapshot.origin'
+BUILD_CHUNK_SIZE = 1000
+
+
+def snapshot_sources():
+    return {
+        'categories': (Category.objects.all(), CategorySerializer),
+        'subcategories': (
+            SubCategory.objects.select_related('category'),
+            SubCategorySerializer,
+        ),
+        'products': (
+            Product.objects.select_related(
+                'category', 'subcategory__category',
+            ).prefetch_related('images'),
+            ProductSerializer,
+        ),
+    }
+
+
+class SnapshotRequest:
+    """Заменитель запроса для сериализаторов при сборке снимка."""
+
+    def build_absolute_uri(self, location):
+        if urlsplit(location).scheme:
+            return location
+        return ORIGIN + location
+
+
+def build_snapshot(path):
+    """
+    Собирает снимок каталога в path и возвращает его версию. Версия
+    берётся до чтения БД: если каталог изменится во время сборки,
+    снимок сразу окажется устаревшим.
+    """
+    version = catalog_version()
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), prefix='.snapshot-',
+    )
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(bytes(HEADER.size + SECTION.size * len(KINDS)))
+            sources = snapshot_sources()
+            sections = [_write_section(file, *sources[kind]) for kind in KINDS]
+            file.seek(0)
+            file.write(HEADER.pack(MAGIC, version, len(KINDS)))
+            for section in sections:
+                file.write(SECTION.pack(*section))
+            file.flush()
+            os.fsync(file.fileno())
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    return version
+
+
+def _write_section(file, queryset, serializer_class):
+    renderer = JSONRenderer()
+    context = {'request': SnapshotRequest()}
+    ids = []
+    slugs = []
+    for obj in queryset.order_by('pk').iterator(chunk_size=BUILD_CHUNK_SIZE):
+        fragment = renderer.render(serializer_class(obj, context=context).data)
+        ids.append((obj.pk, file.tell(), len(fragment)))
+        slugs.append((obj.slug.encode(), len(ids) - 1))
+        file.write(fragment)
+    slugs.sort()
+    slug_entries = []
+    for slug, row in slugs:
+        slug_entries.append((file.tell(), len(slug), row))
+        file.write(slug)
+    ids_offset = file.tell()
+    file.writelines(ID_ENTRY.pack(*entry) for entry in ids)
+    slugs_offset = file.tell()
+    file.writelines(SLUG_ENTRY.pack(*entry) for entry in slug_entries)
+    return len(ids), ids_offset, slugs_offset
+
+
+class CatalogSnapshot:
+    """Чтение снимка, отображённого в память."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.version, count = HEADER.unpack_from(self.mmap)
+        if magic != MAGIC or count != len(KINDS):
+            raise ValueError(f"{path} не является снимком каталога.")
+        self.sections = {
+            kind: SECTION.unpack_from(
+                self.mmap, HEADER.size + SECTION.size * number,
+            )
+            for number, kind in enumerate(KINDS)
+        }
+
+    def count(self, kind):
+        return self.sections[kind][0]
+
+    def get(self, kind, pk):
+        """JSON-фрагмент объекта по id или None."""
+        count, ids_offset, _ = self.sections[kind]
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            entry_pk, offset, length = ID_ENTRY.unpack_from(
+                self.mmap, ids_offset + ID_ENTRY.size * middle,
+            )
+            if entry_pk == pk:
+                return self.mmap[offset:offset + length]
+            if entry_pk < pk:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def get_by_slug(self, kind, slug):
+        count, _, slugs_offset = self.sections[kind]
+        slug = slug.encode()
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            offset, length, row = SLUG_ENTRY.unpack_from(
+                self.mmap, slugs_offset + SLUG_ENTRY.size * middle,
+            )
+            entry_slug = self.mmap[offset:offset + length]
+            if entry_slug == slug:
+                return self._row(kind, row)
+            if entry_slug < slug:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def page(self, kind, offset, limit):
+        """Фрагменты объектов по возрастанию id, как в списках API."""
+        count = self.count(kind)
+        return [
+            self._row(kind, row)
+            for row in range(min(offset, count), min(offset + limit, count))
+        ]
+
+    def _row(self, kind, row):
+        _, ids_offset, _ = self.sections[kind]
+        _, offset, length = ID_ENTRY.unpack_from(
+            self.mmap, ids_offset + ID_ENTRY.size * row,
+        )
+        return self.mmap[offset:offset + length]
+
+
+_current = None
+_current_key = None
+_checked_at = None
+_lock = threading.Lock()
+
+
+def get_snapshot():
+    """
+    Снимок процесса или None, если он выключен, не собран или отстал
+    от каталога. Файл проверяется не чаще раза в
+    CATALOG_SNAPSHOT_CHECK_INTERVAL секунд; новый файл открывается,
+    а старый закрывается, когда его перестанут читать текущие запросы.
+    """
+    global _current, _current_key, _checked_at
+    path = settings.CATALOG_SNAPSHOT_PATH
+    if not path:
+        return None
+    now = time.monotonic()
+    with _lock:
+        interval = settings.CATALOG_SNAPSHOT_CHECK_INTERVAL
+        if _checked_at is None or now - _checked_at >= interval:
+            _checked_at = now
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                _current = _current_key = None
+            else:
+                key = (path, stat.st_ino, stat.st_mtime_ns)
+                if key != _current_key:
+                    _current, _current_key = CatalogSnapshot(path), key
+        snapshot = _current
+    if snapshot is None or snapshot.version != catalog_version():
+        return None
+    return snapshot
+
+
+def snapshot_response(request, body):
+    origin = request.build_absolute_uri('/')[:-1]
+    return HttpResponse(
+        body.replace(ORIGIN.encode(), origin.encode()),
+        content_type='application/json',
+    )
+
+
+class SnapshotMixin:
+    """
+    Отдаёт list и retrieve из снимка каталога в формате JSON, когда
+    снимок актуален, иначе — обычным путём через ORM.
+    """
+
+    snapshot_kind = None
+
+    def list(self, request, *args, **kwargs):
+        snapshot = self._get_snapshot(request)
+        if snapshot is None or self.paginator is None:
+            return super().list(request, *args, **kwargs)
+        paginator = self.paginator
+        paginator.request = request
+        paginator.limit = paginator.get_limit(request)
+        if paginator.limit is None:
+            return super().list(request, *args, **kwargs)
+        paginator.offset = paginator.get_offset(request)
+        paginator.count = snapshot.count(self.snapshot_kind)
+        results = b','.join(snapshot.page(
+            self.snapshot_kind, paginator.offset, paginator.limit,
+        ))
+        if paginator.get_count_mode(request, self) == 'none':
+            head = {'has_next': (
+                paginator.offset + paginator.limit < paginator.count
+            )}
+        else:
+            head = {'count': paginator.count}
+        head['next'] = paginator.get_next_link()
+        head['previous'] = paginator.get_previous_link()
+        return snapshot_response(
+            request,
+            json.dumps(head)[:-1].encode() + b',"results":['
+            + results + b']}',
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        snapshot = self._get_snapshot(request)
+        fragment = None
+        if snapshot is not None and str(kwargs.get('pk', '')).isdigit():
+            fragment = snapshot.get(self.snapshot_kind, int(kwargs['pk']))
+        if fragment is None:
+            return super().retrieve(request, *args, **kwargs)
+        return snapshot_response(request, fragment)
+
+    def _get_snapshot(self, request):
+        if request.accepted_renderer.format != 'json':
+            return None
+        return get_snapshot()
@@ -0,0 +1,13 @@
+from django.urls import path
+
+from api.views import async_views
+
+
+urlpatterns = [
+    path('categories/', async_views.category_list),
+    path('subcategories/', async_views.subcategory_list),
+    path('products/', async_views.product_list),
+    path('products/<int:pk>/', async_views.product_detail),
+    path('products/<int:pk>/cart/', async_views.product_cart),
+    path('cart/', async_views.cart),
+]
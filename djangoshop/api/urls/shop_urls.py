@@ -5,15 +5,24 @@ from rest_framework.routers import DefaultRouter
 from api.views.shop_views import (
     CategoryViewSet, SubCategoryViewSet,
     ProductViewSet, CartView,
+    GuestCartView, GuestCartProductView,
+    CheckoutView, OrderViewSet,
 )
+from api.views.image_views import ImageResizeView
 
 
 router = DefaultRouter()
 router.register('categories', CategoryViewSet)
 router.register('subcategories', SubCategoryViewSet)
 router.register('products', ProductViewSet)
+router.register('orders', OrderViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
-    path('cart/', CartView.as_view())
+    path('cart/', CartView.as_view()),
+    path('checkout/', CheckoutView.as_view()),
+    path('guest-cart/', GuestCartView.as_view()),
+    path('guest-cart/products/<int:pk>/', GuestCartProductView.as_view()),
+    path('images/<str:kind>/<int:pk>/w<int:width>.<str:extension>',
+         ImageResizeView.as_view()),
 ]
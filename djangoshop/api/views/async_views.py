@@ -0,0 +1,167 @@
+"""
+Асинхронные версии чтения каталога и корзины для запуска под ASGI.
+
+Представления работают на асинхронном ORM Django и не занимают поток
+воркера, пока ждут БД или медленного клиента. Корзина читается
+и меняется через то же хранилище, что и в синхронном API, ответы
+совпадают с /api/v1/.
+"""
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse, JsonResponse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from api.pagination import AsyncLimitOffsetPagination
+from api.views.cart_input import QUANTITY_ERROR, STOCK_ERROR, parse_quantity
+from api.serializers.shop_serializers import (
+    CategorySerializer, SubCategorySerializer,
+    ProductSerializer, ProductCartSerializer,
+    CartSerializer,
+)
+from shop.cart_store import get_cart_store
+from shop.models import Category, SubCategory, Product
+from shop.popularity import record_cart_add, record_view
+from shop.stock import release, reserve, user_owner
+
+
+UNAUTHORIZED_ERROR = {
+    "detail": "Authentication credentials were not provided."
+}
+
+
+async def aget_user(request):
+    """
+    Асинхронная аутентификация по заголовку Authorization: Token <key>,
+    как в TokenAuthentication.
+    """
+    keyword, _, key = request.headers.get('Authorization', '').partition(' ')
+    if keyword != 'Token' or not key:
+        return None
+    token = await Token.objects.select_related('user').filter(
+        key=key.strip(), user__is_active=True,
+    ).afirst()
+    return token.user if token else None
+
+
+def token_required(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await aget_user(request)
+        if user is None:
+            response = JsonResponse(UNAUTHORIZED_ERROR,
+                                    status=status.HTTP_401_UNAUTHORIZED)
+            response['WWW-Authenticate'] = 'Token'
+            return response
+        request.user = user
+        return await view(request, *args, **kwargs)
+    # Аутентификация только по токену, CSRF-проверка не нужна.
+    # csrf_exempt в Django 4.2 не поддерживает асинхронные view.
+    wrapper.csrf_exempt = True
+    return wrapper
+
+
+def product_queryset():
+    return Product.objects.select_related(
+        'category', 'subcategory__category',
+    ).prefetch_related('images').order_by('pk')
+
+
+async def list_response(request, queryset, serializer_class):
+    paginator = AsyncLimitOffsetPagination()
+    objects = await paginator.apaginate_queryset(queryset, request)
+    data = serializer_class(
+        objects, many=True, context={'request': request}
+    ).data
+    return JsonResponse(paginator.get_paginated_data(data), safe=False)
+
+
+async def category_list(request):
+    return await list_response(
+        request, Category.objects.order_by('pk'), CategorySerializer
+    )
+
+
+async def subcategory_list(request):
+    return await list_response(
+        request,
+        SubCategory.objects.select_related('category').order_by('pk'),
+        SubCategorySerializer,
+    )
+
+
+async def product_list(request):
+    return await list_response(request, product_queryset(), ProductSerializer)
+
+
+async def product_detail(request, pk):
+    product = await product_queryset().filter(pk=pk).afirst()
+    if product is None:
+        raise Http404
+    data = ProductSerializer(product, context={'request': request}).data
+    record_view(product.pk)
+    return JsonResponse(data)
+
+
+@token_required
+async def cart(request):
+    store = get_cart_store()
+    if request.method == 'GET':
+        lines = await sync_to_async(store.lines)(request.user)
+        return JsonResponse(CartSerializer(lines).data)
+    if request.method == 'DELETE':
+        await sync_to_async(store.clear)(request.user)
+        await sync_to_async(release)(user_owner(request.user))
+        return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+    return HttpResponse(status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+def request_data(request):
+    """Тело запроса в JSON или из формы, как request.data в DRF."""
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return request.POST
+    return data if isinstance(data, dict) else {}
+
+
+@token_required
+async def product_cart(request, pk):
+    product = await Product.objects.filter(pk=pk).afirst()
+    if product is None:
+        raise Http404
+    store = get_cart_store()
+    owner = user_owner(request.user)
+    if request.method == 'DELETE':
+        await sync_to_async(release)(owner, [product.pk])
+        deleted = await sync_to_async(store.remove)(request.user, product)
+        return HttpResponse(status=status.HTTP_204_NO_CONTENT if deleted
+                            else status.HTTP_400_BAD_REQUEST)
+    if request.method not in ('POST', 'PATCH'):
+        return HttpResponse(status=status.HTTP_405_METHOD_NOT_ALLOWED)
+    quantity = parse_quantity(request_data(request))
+    if quantity is None:
+        return JsonResponse(QUANTITY_ERROR,
+                            status=status.HTTP_400_BAD_REQUEST)
+    if not await sync_to_async(reserve)(
+            owner, product.pk, quantity, replace=request.method == 'PATCH',
+    ):
+        return JsonResponse(STOCK_ERROR, status=status.HTTP_409_CONFLICT)
+    if request.method == 'PATCH':
+        line = await sync_to_async(store.update)(
+            request.user, product, quantity,
+        )
+        if line is None:
+            await sync_to_async(release)(owner, [product.pk])
+            return HttpResponse(status=status.HTTP_400_BAD_REQUEST)
+        response_status = status.HTTP_206_PARTIAL_CONTENT
+    else:
+        line = await sync_to_async(store.add)(
+            request.user, product, quantity,
+        )
+        record_cart_add(product.pk)
+        response_status = status.HTTP_201_CREATED
+    return JsonResponse(ProductCartSerializer(line).data,
+                        status=response_status)
@@ -0,0 +1,29 @@
+from django.conf import settings
+from rest_framework.authtoken.models import Token
+from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
+
+from api.views.shop_views import get_guest_cart_id
+from shop.cart_store import GuestCartStore
+from shop.stock import guest_owner, transfer, user_owner
+
+
+class ObtainAuthTokenView(ObtainAuthToken):
+    """
+    Выдача токена по логину и паролю. Гостевая корзина из cookie или
+    заголовка X-Guest-Cart переносится в корзину пользователя одной
+    пакетной операцией вместе с резервами на складе, cookie гостевой
+    корзины удаляется.
+    """
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        token, _ = Token.objects.get_or_create(user=user)
+        response = Response({'token': token.key})
+        if cart_id := get_guest_cart_id(request):
+            GuestCartStore().move_to_user(cart_id, user)
+            transfer(guest_owner(cart_id), user_owner(user))
+            response.delete_cookie(settings.GUEST_CART_COOKIE, samesite='Lax')
+        return response
@@ -0,0 +1,18 @@
+"""
+Разбор количества продукта и тексты ошибок корзины, общие для
+синхронного (/api/v1/) и асинхронного (/api/v1/async/) API.
+"""
+
+QUANTITY_ERROR = {
+    "error": "Не указано количество продукта или формат ввода неверный."
+}
+STOCK_ERROR = {"error": "Недостаточно продукта на складе."}
+
+
+def parse_quantity(data):
+    """Положительное целое количество из тела запроса или None."""
+    try:
+        quantity = int(data.get('quantity'))
+    except (TypeError, ValueError):
+        return None
+    return quantity if quantity > 0 else None
@@ -0,0 +1,65 @@
+from functools import partial
+
+from django.conf import settings
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from PIL import Image
+from rest_framework import views
+
+from shop.image_cache import get_image_cache
+from shop.images import VARIANT_FORMATS, render_variant
+from shop.models import Category, SubCategory, ProductImage
+
+
+IMAGE_MODELS = {
+    'categories': Category,
+    'subcategories': SubCategory,
+    'products': ProductImage,
+}
+CONTENT_TYPES = {
+    'jpg': 'image/jpeg',
+    'webp': 'image/webp',
+}
+
+
+def render_image(field_file, width, extension):
+    with field_file.storage.open(field_file.name, 'rb') as file:
+        original = Image.open(file)
+        original.load()
+    return render_variant(original, width, extension)
+
+
+class ImageResizeView(views.APIView):
+    """
+    Копия изображения категории, подкатегории или продукта
+    произвольной ширины из разрешённого списка. Результат сохраняется
+    в дисковый кэш, откуда следующие запросы отдаёт nginx.
+    """
+
+    def get(self, request, kind, pk, width, extension):
+        model = IMAGE_MODELS.get(kind)
+        if (model is None
+                or width not in settings.IMAGE_RESIZE_WIDTHS
+                or extension not in VARIANT_FORMATS):
+            raise Http404
+        obj = get_object_or_404(model.objects.only('image'), pk=pk)
+        if not obj.image:
+            raise Http404
+        cache = get_image_cache()
+        path = cache.path_for(kind, pk, width, extension)
+        render = partial(render_image, obj.image, width, extension)
+        for _ in range(2):
+            cache.get_or_create(path, render)
+            try:
+                file = open(path, 'rb')
+            except FileNotFoundError:
+                # Файл успели вытеснить между созданием и чтением.
+                continue
+            response = FileResponse(
+                file, content_type=CONTENT_TYPES[extension]
+            )
+            response['Cache-Control'] = (
+                f'public, max-age={settings.IMAGE_CACHE_MAX_AGE}'
+            )
+            return response
+        raise Http404
@@ -1,29 +1,255 @@
+import json
+from datetime import timedelta
+from itertools import chain
+
+from django.conf import settings
+from django.core import signing
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import viewsets, views, status
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
-from shop.models import Category, SubCategory, Product, Cart, ProductCart
+from api.response_cache import CachedResponseMixin
+from api.views.cart_input import QUANTITY_ERROR, STOCK_ERROR, parse_quantity
+from api.snapshot import SnapshotMixin
+from shop.cart_store import GuestCartStore, get_cart_store
+from shop.checkout import EmptyCart, checkout
+from shop.models import (
+    Category, SubCategory, DeletedProduct, Product, Order, RelatedProduct,
+)
+from shop.popularity import record_cart_add, record_view
+from shop.stock import (
+    OutOfStock, guest_owner, release, reserve, user_owner,
+)
 from api.serializers.shop_serializers import (
     CategorySerializer, SubCategorySerializer,
     ProductSerializer, ProductCartSerializer,
-    CartSerializer,
+    CartSerializer, OrderSerializer, RelatedProductSerializer,
 )
 
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+EXPORT_CHUNK_SIZE = 500
+BATCH_MAX_SIZE = 100
+GUEST_CART_SALT = 'shop.guest_cart'
+IDEMPOTENCY_KEY_MAX_LENGTH = 64
+
+
+class CategoryViewSet(SnapshotMixin, CachedResponseMixin,
+                      viewsets.ReadOnlyModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    snapshot_kind = 'categories'
 
 
-class SubCategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class SubCategoryViewSet(SnapshotMixin, CachedResponseMixin,
+                         viewsets.ReadOnlyModelViewSet):
     queryset = SubCategory.objects.all()
     serializer_class = SubCategorySerializer
+    snapshot_kind = 'subcategories'
 
 
-class ProductViewSet(viewsets.ReadOnlyModelViewSet):
+def parse_batch_keys(request):
+    """
+    Поле и список ключей пакетного запроса: ids или slugs из строки
+    запроса через запятую или из тела POST-запроса списком. Повторы
+    убираются с сохранением порядка. Возвращает (поле, ключи, ошибка).
+    """
+    source = request.data if request.method == 'POST' else {
+        field: value.split(',')
+        for field, value in request.query_params.items()
+    }
+    fields = [field for field in ('ids', 'slugs') if field in source]
+    if len(fields) != 1:
+        return None, None, "Укажите либо ids, либо slugs."
+    field, = fields
+    keys = (source.getlist(field) if hasattr(source, 'getlist')
+            else source[field])
+    if not isinstance(keys, list) or not keys:
+        return None, None, f"{field} должен быть непустым списком."
+    if field == 'ids':
+        try:
+            keys = [int(key) for key in keys]
+        except (TypeError, ValueError):
+            return None, None, "ids должны быть целыми числами."
+    else:
+        keys = [str(key).strip() for key in keys]
+    keys = list(dict.fromkeys(keys))
+    if len(keys) > BATCH_MAX_SIZE:
+        return None, None, (
+            f"Можно запросить не больше {BATCH_MAX_SIZE} продуктов."
+        )
+    return field, keys, None
+
+
+class ProductViewSet(SnapshotMixin, CachedResponseMixin,
+                     viewsets.ReadOnlyModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    snapshot_kind = 'products'
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # С cached число продуктов пересчитывается только после
+        # изменения каталога, поэтому режим зависит от общего кеша.
+        self.count_mode = settings.PRODUCT_COUNT_MODE
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        # Просмотр считается в памяти процесса (shop.popularity),
+        # в том числе для ответов из кеша Django и снимка каталога.
+        # nginx карточки продуктов не кеширует, иначе просмотры
+        # из его кеша сюда не доходили бы.
+        if response.status_code == status.HTTP_200_OK:
+            record_view(int(kwargs['pk']))
+        return response
+
+    @action(methods=['get', 'post'], detail=False, url_path='batch')
+    def batch(self, request):
+        """
+        Несколько продуктов за один запрос: ?ids=1,2,3 или ?slugs=a,b
+        либо POST с {"ids": [...]} или {"slugs": [...]}. Продукты
+        возвращаются в порядке запроса за постоянное число запросов
+        к БД, ненайденные ключи перечисляются в not_found.
+        """
+
+        field, keys, error = parse_batch_keys(request)
+        if error:
+            return Response(
+                data={"error": error}, status=status.HTTP_400_BAD_REQUEST
+            )
+        lookup = 'pk' if field == 'ids' else 'slug'
+        products = {
+            getattr(product, lookup): product
+            for product in Product.objects.select_related(
+                'category', 'subcategory__category',
+            ).prefetch_related('images').filter(**{f'{lookup}__in': keys})
+        }
+        serializer = self.get_serializer(
+            [products[key] for key in keys if key in products], many=True,
+        )
+        return Response({
+            'results': serializer.data,
+            'not_found': [key for key in keys if key not in products],
+        }, status=status.HTTP_200_OK)
+
+    @action(methods=['get'], detail=True, url_path='related')
+    def related(self, request, pk=None):
+        """
+        Продукты, которые чаще всего лежат в корзинах вместе с этим,
+        из таблицы RelatedProduct (команда build_related_products).
+        Читаются одним запросом по индексу (product, rank), для
+        неизвестного продукта возвращается пустой список.
+        """
+
+        if not str(pk).isdigit():
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        related = RelatedProduct.objects.filter(
+            product_id=pk,
+        ).select_related('related').order_by('rank')
+        return Response(
+            RelatedProductSerializer(related, many=True).data,
+            status=status.HTTP_200_OK,
+        )
+
+    @action(methods=['get'], detail=False, url_path='popular')
+    def popular(self, request):
+        """
+        Продукты по убыванию популярности с постраничным выводом.
+        Порядок берётся из рейтинга PopularProduct, который пересобирает
+        команда build_popular_products, поэтому запрос страницы идёт
+        по индексу rank без сортировки статистики.
+        """
+
+        # Рейтинг меняется без изменения каталога, и число продуктов
+        # в нём из кеша устарело бы.
+        self.count_mode = 'exact'
+        queryset = Product.objects.filter(
+            popularity__isnull=False,
+        ).select_related(
+            'category', 'subcategory__category',
+        ).prefetch_related('images').order_by('popularity__rank')
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @action(methods=['get'], detail=False, url_path='export')
+    def export(self, request):
+        """
+        Потоковая выгрузка каталога в формате NDJSON: один продукт на
+        строку. Продукты читаются серверным курсором пачками по
+        EXPORT_CHUNK_SIZE с подгрузкой связей для каждой пачки, поэтому
+        потребление памяти не зависит от размера каталога.
+        Параметр since отдаёт только продукты, изменённые не раньше
+        указанного времени (изменение изображений и (под)категорий
+        тоже обновляет updated_at продукта), а перед ними строки
+        {"id": ..., "deleted": true} удалённых с тех пор продуктов.
+        Удаления хранятся EXPORT_DELETED_DAYS дней, более ранний since
+        отклоняется.
+        Заголовок X-Export-Started-At содержит значение since для
+        следующей выгрузки: время начала минус EXPORT_SINCE_MARGIN
+        секунд, чтобы не пропустить строки, зафиксированные позже
+        с более ранним updated_at.
+        """
+
+        started_at = timezone.now()
+        deleted = DeletedProduct.objects.none()
+        queryset = Product.objects.select_related(
+            'category', 'subcategory__category',
+        ).prefetch_related('images').order_by('pk')
+        if since := request.query_params.get('since'):
+            try:
+                since = parse_datetime(since)
+            except ValueError:
+                since = None
+            if since is None:
+                return Response(
+                    data={"error": "Некорректный формат параметра since."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+            if since < started_at - timedelta(
+                    days=settings.EXPORT_DELETED_DAYS):
+                return Response(
+                    data={"error": "Удаления хранятся "
+                                   f"{settings.EXPORT_DELETED_DAYS} дней, "
+                                   "нужна полная выгрузка."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            queryset = queryset.filter(updated_at__gte=since)
+            deleted = DeletedProduct.objects.filter(deleted_at__gte=since)
+        context = self.get_serializer_context()
+        # Удаления идут первыми: id удалённого продукта в SQLite может
+        # достаться новому, и его строка должна быть последней.
+        lines = chain((
+            json.dumps({'id': product_id, 'deleted': True}) + '\n'
+            for product_id in deleted.order_by('pk').values_list(
+                'product_id', flat=True,
+            ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        ), (
+            json.dumps(
+                ProductSerializer(product, context=context).data,
+                ensure_ascii=False,
+            ) + '\n'
+            for product in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        ))
+        response = StreamingHttpResponse(
+            lines, content_type='application/x-ndjson'
+        )
+        next_since = started_at - timedelta(
+            seconds=settings.EXPORT_SINCE_MARGIN,
+        )
+        response['X-Export-Started-At'] = next_since.strftime(
+            '%Y-%m-%dT%H:%M:%S.%fZ'
+        )
+        return response
 
     @action(methods=['post'], detail=True, url_path='cart',
             permission_classes=[IsAuthenticated])
@@ -32,36 +258,21 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
         Кастомный action для управления корзиной с методами POST, PATCH
         и DELETE. При нескольких POST-запросах на одинаковый продукт
         складывает количества существующего и введённого.
+        Корзина хранится в хранилище из settings.CART_STORE.
+        Добавленное количество резервируется на складе (shop.stock).
         """
 
-        quantity = request.data.get('quantity')
-        if not quantity and not isinstance(quantity, int):
+        if (quantity := parse_quantity(request.data)) is None:
             return Response(
-                data={"error": "Не указано количество продукта"
-                               " или формат ввода неверный."},
-                status=status.HTTP_400_BAD_REQUEST
+                data=QUANTITY_ERROR, status=status.HTTP_400_BAD_REQUEST
             )
         product = self.get_object()
-        if Cart.objects.filter(user=request.user):
-            cart = request.user.cart
-        else:
-            cart = Cart.objects.create(user=request.user)
-        if obj_list := ProductCart.objects.filter(product=product, cart=cart):
-            obj = obj_list[0]
-            obj.quantity += int(quantity)
-            obj.save()
-        else:
-            obj = ProductCart.objects.create(
-                cart=cart,
-                product=product,
-                quantity=quantity,
-            )
-        try:
-            serializer = ProductCartSerializer(obj)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        except Exception:
-            obj.delete()
-            return Response(status=status.HTTP_400_BAD_REQUEST)
+        if not reserve(user_owner(request.user), product.pk, quantity):
+            return Response(data=STOCK_ERROR, status=status.HTTP_409_CONFLICT)
+        obj = get_cart_store().add(request.user, product, quantity)
+        record_cart_add(product.pk)
+        serializer = ProductCartSerializer(obj)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @add_to_cart.mapping.patch
     def update_product_quantity(self, request, pk=None):
@@ -70,23 +281,21 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
         количество на указанное в теле запроса.
         """
 
-        quantity = request.data.get('quantity')
-        if not quantity and not isinstance(quantity, int):
+        if (quantity := parse_quantity(request.data)) is None:
             return Response(
-                data={"error": "Не указано количество продукта"
-                               " или формат ввода неверный."},
-                status=status.HTTP_400_BAD_REQUEST
+                data=QUANTITY_ERROR, status=status.HTTP_400_BAD_REQUEST
             )
         product = self.get_object()
-        cart = request.user.cart
-        if obj := ProductCart.objects.filter(product=product, cart=cart)[0]:
-            obj.quantity = quantity
-            obj.save()
+        owner = user_owner(request.user)
+        if not reserve(owner, product.pk, quantity, replace=True):
+            return Response(data=STOCK_ERROR, status=status.HTTP_409_CONFLICT)
+        if obj := get_cart_store().update(request.user, product, quantity):
             serializer = ProductCartSerializer(obj)
             return Response(
                 serializer.data, status=status.HTTP_206_PARTIAL_CONTENT
             )
         else:
+            release(owner, [product.pk])
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
     @add_to_cart.mapping.delete
@@ -96,16 +305,10 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
         """
 
         product = self.get_object()
-        cart = request.user.cart
-        try:
-            if obj := ProductCart.objects.filter(
-                    product=product, cart=cart
-            )[0]:
-                obj.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            else:
-                return Response(status=status.HTTP_400_BAD_REQUEST)
-        except Exception:
+        release(user_owner(request.user), [product.pk])
+        if get_cart_store().remove(request.user, product):
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        else:
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -113,18 +316,153 @@ class CartView(views.APIView):
     permission_classes = [IsAuthenticated, ]
 
     def get(self, request):
-        if cart := Cart.objects.filter(user=request.user):
-            serializer = CartSerializer(cart[0])
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        else:
-            cart = Cart.objects.create(user=request.user)
-            serializer = CartSerializer(cart)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+        serializer = CartSerializer(get_cart_store().lines(request.user))
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
     def delete(self, request):
-        if cart := Cart.objects.filter(user=request.user)[0]:
-            for product in ProductCart.objects.filter(cart=cart):
-                product.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        else:
+        get_cart_store().clear(request.user)
+        release(user_owner(request.user))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class CheckoutView(views.APIView):
+    """
+    Оформление заказа из корзины. Заголовок Idempotency-Key обязателен:
+    повтор запроса с тем же ключом возвращает тот же заказ со статусом
+    200 вместо нового заказа.
+    """
+    permission_classes = [IsAuthenticated, ]
+
+    def post(self, request):
+        key = request.headers.get('Idempotency-Key', '').strip()
+        if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return Response(data={"error": (
+                "Укажите заголовок Idempotency-Key длиной не больше "
+                f"{IDEMPOTENCY_KEY_MAX_LENGTH} символов."
+            )}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            order, created = checkout(request.user, key)
+        except EmptyCart:
+            return Response(data={"error": "Корзина пуста."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        except OutOfStock as error:
+            return Response(
+                data={**STOCK_ERROR, "products": error.args[0]},
+                status=status.HTTP_409_CONFLICT,
+            )
+        order = Order.objects.prefetch_related('lines').get(pk=order.pk)
+        return Response(
+            OrderSerializer(order).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+
+class OrderViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = Order.objects.all()
+    serializer_class = OrderSerializer
+    permission_classes = [IsAuthenticated, ]
+
+    def get_queryset(self):
+        return super().get_queryset().filter(
+            user=self.request.user,
+        ).prefetch_related('lines').order_by('-pk')
+
+
+def get_guest_cart_id(request):
+    """
+    Идентификатор гостевой корзины из заголовка X-Guest-Cart или cookie.
+    Значение подписано SECRET_KEY, поддельное или испорченное
+    игнорируется.
+    """
+    value = (request.headers.get(settings.GUEST_CART_HEADER)
+             or request.COOKIES.get(settings.GUEST_CART_COOKIE))
+    if not value:
+        return None
+    try:
+        return signing.Signer(salt=GUEST_CART_SALT).unsign(value)
+    except signing.BadSignature:
+        return None
+
+
+def remember_guest_cart(response, cart_id):
+    value = signing.Signer(salt=GUEST_CART_SALT).sign(cart_id)
+    response[settings.GUEST_CART_HEADER] = value
+    response.set_cookie(
+        settings.GUEST_CART_COOKIE, value,
+        max_age=settings.GUEST_CART_TIMEOUT, httponly=True, samesite='Lax',
+    )
+
+
+class GuestCartView(views.APIView):
+    """
+    Корзина анонимного покупателя. Хранится в кеше и переносится
+    в корзину пользователя при получении токена.
+    """
+    permission_classes = [AllowAny, ]
+
+    def get(self, request):
+        cart_id = get_guest_cart_id(request)
+        lines = GuestCartStore().lines(cart_id) if cart_id else []
+        return Response(CartSerializer(lines).data, status=status.HTTP_200_OK)
+
+    def delete(self, request):
+        if cart_id := get_guest_cart_id(request):
+            GuestCartStore().clear(cart_id)
+            release(guest_owner(cart_id))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class GuestCartProductView(views.APIView):
+    """
+    Добавление, изменение количества и удаление продукта в гостевой
+    корзине. Первое добавление создаёт корзину и возвращает её
+    идентификатор в cookie и заголовке X-Guest-Cart.
+    """
+    permission_classes = [AllowAny, ]
+
+    def post(self, request, pk):
+        if (quantity := parse_quantity(request.data)) is None:
+            return Response(
+                data=QUANTITY_ERROR, status=status.HTTP_400_BAD_REQUEST
+            )
+        product = get_object_or_404(Product, pk=pk)
+        store = GuestCartStore()
+        cart_id = get_guest_cart_id(request) or store.new_id()
+        if not reserve(guest_owner(cart_id), product.pk, quantity):
+            return Response(data=STOCK_ERROR, status=status.HTTP_409_CONFLICT)
+        obj = store.add(cart_id, product, quantity)
+        record_cart_add(product.pk)
+        response = Response(
+            ProductCartSerializer(obj).data, status=status.HTTP_201_CREATED
+        )
+        remember_guest_cart(response, cart_id)
+        return response
+
+    def patch(self, request, pk):
+        if (quantity := parse_quantity(request.data)) is None:
+            return Response(
+                data=QUANTITY_ERROR, status=status.HTTP_400_BAD_REQUEST
+            )
+        product = get_object_or_404(Product, pk=pk)
+        cart_id = get_guest_cart_id(request)
+        if not cart_id:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        owner = guest_owner(cart_id)
+        if not reserve(owner, product.pk, quantity, replace=True):
+            return Response(data=STOCK_ERROR, status=status.HTTP_409_CONFLICT)
+        if obj := GuestCartStore().update(cart_id, product, quantity):
+            return Response(
+                ProductCartSerializer(obj).data,
+                status=status.HTTP_206_PARTIAL_CONTENT,
+            )
+        release(owner, [product.pk])
+        return Response(status=status.HTTP_400_BAD_REQUEST)
+
+    def delete(self, request, pk):
+        product = get_object_or_404(Product, pk=pk)
+        cart_id = get_guest_cart_id(request)
+        if cart_id:
+            release(guest_owner(cart_id), [product.pk])
+        if cart_id and GuestCartStore().remove(cart_id, product):
             return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response(status=status.HTTP_400_BAD_REQUEST)
@@ -49,6 +49,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'shop.middleware.replica_pinning_middleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -59,6 +60,8 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'djangoshop.urls'
 
+TEST_RUNNER = 'shop.test_runner.ShopTestRunner'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -81,22 +84,178 @@ WSGI_APPLICATION = 'djangoshop.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    # Default sqlite database
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite3')
+
+# DB_POOLER=pgbouncer: connections go through pgbouncer in transaction
+# pooling mode, which does not support server-side cursors.
+DB_POOLER = os.getenv('DB_POOLER', '')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'django'),
+            'USER': os.getenv('POSTGRES_USER', 'django'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', ''),
+            'PORT': os.getenv('DB_PORT', 5432),
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': bool(os.getenv('DB_CONN_HEALTH_CHECKS', 1)),
+            'DISABLE_SERVER_SIDE_CURSORS': DB_POOLER == 'pgbouncer',
+        }
     }
-    # Default postgres database
-    # 'default': {
-    #     'ENGINE': 'django.db.backends.postgresql',
-    #     'NAME': os.getenv('POSTGRES_DB', 'django'),
-    #     'USER': os.getenv('POSTGRES_USER', 'django'),
-    #     'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
-    #     'HOST': os.getenv('DB_HOST', ''),
-    #     'POST': os.getenv('DB_PORT', 5432)
-    # }
-}
+else:
+    # WAL and BEGIN IMMEDIATE let several gunicorn workers write
+    # to the same file without "database is locked" errors.
+    DATABASES = {
+        'default': {
+            'ENGINE': 'shop.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 0)),
+            'CONN_HEALTH_CHECKS': bool(os.getenv('DB_CONN_HEALTH_CHECKS', '')),
+            'OPTIONS': {
+                'timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 20)),
+                'transaction_mode': os.getenv(
+                    'SQLITE_TRANSACTION_MODE', 'IMMEDIATE'
+                ),
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    f"PRAGMA mmap_size={os.getenv('SQLITE_MMAP_SIZE', 2**28)};"
+                    f"PRAGMA cache_size={os.getenv('SQLITE_CACHE_SIZE', -20000)};"
+                    'PRAGMA temp_store=MEMORY;'
+                ),
+            },
+        }
+    }
+
+# Catalog reads go to read replicas listed as "host=weight" pairs, e.g.
+# DB_REPLICAS="replica1=3 replica2=1" (file paths for SQLite).
+
+DATABASE_ROUTERS = ['shop.db_router.CatalogReplicaRouter']
+DATABASE_REPLICAS = []
+for number, replica in enumerate(os.getenv('DB_REPLICAS', '').split(), start=1):
+    replica_host, _, replica_weight = replica.partition('=')
+    replica_alias = f'replica_{number}'
+    DATABASES[replica_alias] = {
+        **DATABASES['default'],
+        'HOST' if DB_ENGINE == 'postgresql' else 'NAME': replica_host,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append((replica_alias, int(replica_weight or 1)))
+DATABASE_REPLICA_STRATEGY = os.getenv('DB_REPLICA_STRATEGY', 'weighted')
+DATABASE_REPLICA_RETRY_SECONDS = int(os.getenv('DB_REPLICA_RETRY_SECONDS', 30))
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Cart storage: "database" or "cache" (live carts in the cache,
+# written to the database in batches by a write-behind flush that a
+# background thread of each worker runs every CART_FLUSH_INTERVAL
+# seconds; 0 leaves it to flush_carts).
+
+CART_STORE = os.getenv('CART_STORE', 'database')
+CART_CACHE_ALIAS = 'default'
+CART_FLUSH_INTERVAL = int(os.getenv('CART_FLUSH_INTERVAL', 5))
+CART_FLUSH_BATCH_SIZE = int(os.getenv('CART_FLUSH_BATCH_SIZE', 500))
+CART_LOCK_TIMEOUT = 5
+
+# Carts unchanged for CART_ABANDONED_DAYS days are emptied by
+# clear_abandoned_carts in batches of CART_CLEANUP_BATCH_SIZE carts.
+# Cart.last_activity is rewritten at most once per
+# CART_ACTIVITY_RESOLUTION seconds, not on every cart change.
+
+CART_ABANDONED_DAYS = int(os.getenv('CART_ABANDONED_DAYS', 30))
+CART_CLEANUP_BATCH_SIZE = int(os.getenv('CART_CLEANUP_BATCH_SIZE', 1000))
+CART_ACTIVITY_RESOLUTION = 3600
+
+# Guest carts of anonymous shoppers live only in the cache and are
+# addressed by a signed id from a cookie or the X-Guest-Cart header.
+
+GUEST_CART_TIMEOUT = int(os.getenv('GUEST_CART_TIMEOUT', 14 * 24 * 3600))
+GUEST_CART_COOKIE = 'guest_cart'
+GUEST_CART_HEADER = 'X-Guest-Cart'
+
+# Products with a Stock row have limited stock. Adding to a cart reserves
+# the quantity for STOCK_RESERVATION_TIMEOUT seconds since the last cart
+# change; release_reservations returns expired ones in batches.
+
+STOCK_RESERVATION_TIMEOUT = int(os.getenv('STOCK_RESERVATION_TIMEOUT', 900))
+STOCK_RELEASE_BATCH_SIZE = int(os.getenv('STOCK_RELEASE_BATCH_SIZE', 1000))
+
+# "Frequently bought together": build_related_products keeps the
+# RELATED_PRODUCTS_TOP products most often sharing a cart with each
+# product, ignoring carts with more than RELATED_MAX_CART_SIZE lines.
+
+RELATED_PRODUCTS_TOP = int(os.getenv('RELATED_PRODUCTS_TOP', 10))
+RELATED_MAX_CART_SIZE = int(os.getenv('RELATED_MAX_CART_SIZE', 50))
+
+# Product views and adds to cart are counted in memory by each worker and
+# written to ProductStats every POPULARITY_FLUSH_INTERVAL seconds by a
+# background thread (0 disables it). Popularity halves every
+# POPULARITY_HALF_LIFE seconds, an add to cart weighs as much as
+# POPULARITY_CART_WEIGHT views; build_popular_products ranks the
+# POPULAR_PRODUCTS_TOP most popular products.
+
+POPULARITY_FLUSH_INTERVAL = float(os.getenv('POPULARITY_FLUSH_INTERVAL', 10))
+POPULARITY_HALF_LIFE = int(os.getenv('POPULARITY_HALF_LIFE', 7 * 24 * 3600))
+POPULARITY_CART_WEIGHT = float(os.getenv('POPULARITY_CART_WEIGHT', 5))
+POPULAR_PRODUCTS_TOP = int(os.getenv('POPULAR_PRODUCTS_TOP', 1000))
+
+# The incremental catalog export (/api/v1/products/export/?since=...)
+# returns a next since value EXPORT_SINCE_MARGIN seconds before the export
+# started, so rows committed later with an earlier updated_at are not
+# missed; rows in the overlap are exported twice. Deleted products are
+# reported for EXPORT_DELETED_DAYS days; older since values are rejected
+# and need a full export.
+
+EXPORT_SINCE_MARGIN = int(os.getenv('EXPORT_SINCE_MARGIN', 60))
+EXPORT_DELETED_DAYS = int(os.getenv('EXPORT_DELETED_DAYS', 30))
+
+# Django refreshes the gateway micro-cache (gateway/nginx.conf) when the
+# catalog changes by requesting cached URLs with the purge token.
+
+CACHE_PURGE_URL = os.getenv('CACHE_PURGE_URL', '')
+CACHE_PURGE_HOST = os.getenv('CACHE_PURGE_HOST', '')
+CACHE_PURGE_TOKEN = os.getenv('CACHE_PURGE_TOKEN', '')
+CACHE_PURGE_HEADER = 'X-Cache-Purge'
+CACHE_PURGE_TIMEOUT = 2
+CACHE_PURGE_ASYNC = bool(os.getenv('CACHE_PURGE_ASYNC', 1))
+
+# Catalog API responses are cached for RESPONSE_CACHE_TIMEOUT seconds
+# (0 disables the cache). Stale responses are served for at most
+# RESPONSE_CACHE_STALE more seconds while one worker recomputes them,
+# concurrent misses wait up to RESPONSE_CACHE_WAIT seconds for it.
+
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 0))
+RESPONSE_CACHE_STALE = int(os.getenv('RESPONSE_CACHE_STALE', 30))
+RESPONSE_CACHE_WAIT = int(os.getenv('RESPONSE_CACHE_WAIT', 5))
+RESPONSE_CACHE_LOCK_TIMEOUT = 30
+
+# Read-only catalog snapshot (api.snapshot) built by build_catalog_snapshot
+# and memory-mapped by every worker. An empty path disables it; workers
+# look for a rebuilt file every CATALOG_SNAPSHOT_CHECK_INTERVAL seconds.
+
+CATALOG_SNAPSHOT_PATH = os.getenv('CATALOG_SNAPSHOT_PATH', '')
+CATALOG_SNAPSHOT_CHECK_INTERVAL = float(
+    os.getenv('CATALOG_SNAPSHOT_CHECK_INTERVAL', 1)
+)
 
 
 # Password validation
@@ -140,6 +299,45 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Store uploaded images by content hash, deduplicating identical files
+
+MEDIA_CONTENT_ADDRESSED = bool(os.getenv('MEDIA_CONTENT_ADDRESSED', 1))
+MEDIA_GC_GRACE_SECONDS = int(os.getenv('MEDIA_GC_GRACE_SECONDS', 3600))
+
+# Resized copies of uploaded images
+
+IMAGE_VARIANT_WIDTHS = [int(width) for width in os.getenv('IMAGE_VARIANT_WIDTHS', '200 400 800').split()]
+IMAGE_VARIANT_QUALITY = int(os.getenv('IMAGE_VARIANT_QUALITY', 80))
+IMAGE_VARIANT_WORKERS = int(os.getenv('IMAGE_VARIANT_WORKERS', 2))
+IMAGE_VARIANTS_ASYNC = bool(os.getenv('IMAGE_VARIANTS_ASYNC', 1))
+
+# On-demand resized images, cached on disk under MEDIA_ROOT/IMAGE_CACHE_DIR
+# up to IMAGE_CACHE_MAX_BYTES across all workers, least recently used
+# (by atime, relatime granularity) files evicted first
+
+IMAGE_RESIZE_WIDTHS = [int(width) for width in os.getenv('IMAGE_RESIZE_WIDTHS', '100 150 200 300 400 600 800 1200').split()]
+IMAGE_CACHE_DIR = 'cache'
+IMAGE_CACHE_MAX_BYTES = int(os.getenv('IMAGE_CACHE_MAX_BYTES', 1024 ** 3))
+IMAGE_CACHE_MAX_AGE = int(os.getenv('IMAGE_CACHE_MAX_AGE', 86400))
+
+# Unfiltered querysets on tables with at least this many rows are
+# counted from database statistics instead of COUNT(*).
+
+ESTIMATED_COUNT_THRESHOLD = int(os.getenv('ESTIMATED_COUNT_THRESHOLD', 10000))
+
+# Exact counts of catalog lists are cached until the catalog changes
+# or for this many seconds (count mode "cached" of API pagination).
+
+COUNT_CACHE_TIMEOUT = int(os.getenv('COUNT_CACHE_TIMEOUT', 600))
+
+# Count mode of the product list. "cached" is reset by the catalog
+# version, which all workers share only through a shared cache (Redis):
+# with LocMemCache other workers would keep an old count after a change.
+
+PRODUCT_COUNT_MODE = os.getenv(
+    'PRODUCT_COUNT_MODE', 'cached' if os.getenv('REDIS_URL') else 'exact'
+)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -153,6 +351,6 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.CountModeLimitOffsetPagination',
     'PAGE_SIZE': 10
 }
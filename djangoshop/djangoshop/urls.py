@@ -1,10 +1,12 @@
 from django.contrib import admin
 from django.urls import path, include
-from rest_framework.authtoken import views
+
+from api.views.auth_views import ObtainAuthTokenView
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/v1/async/', include('api.urls.async_urls')),
     path('api/v1/', include('api.urls.shop_urls')),
-    path('api-token-auth/', views.obtain_auth_token),
+    path('api-token-auth/', ObtainAuthTokenView.as_view()),
 ]
@@ -1,11 +1,49 @@
-from django.contrib import admin
 
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.template.response import TemplateResponse
+
+from .catalog_bulk import change_prices, delete_products, move_to_subcategory
+from .counting import EstimatedCountPaginator, estimated_count
 from .models import (
     Category, SubCategory, Product, ProductImage,
-    Cart, ProductCart,
+    Cart, ProductCart, Order, OrderLine,
 )
 
 
+class ScalableAdmin(admin.ModelAdmin):
+    """
+    Настройки списков для больших таблиц: число строк оценивается
+    по статистике БД, без второго COUNT(*) по всей таблице при поиске
+    и фильтрации.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+class PriceChangeForm(forms.Form):
+    mode = forms.ChoiceField(label="Изменение", choices=(
+        ('percent', "В процентах"),
+        ('amount', "На сумму"),
+    ))
+    value = forms.FloatField(
+        label="Значение",
+        help_text="Отрицательное значение снижает цены.",
+    )
+
+
+class MoveForm(forms.Form):
+    subcategory = forms.ModelChoiceField(
+        label="Подкатегория", queryset=SubCategory.objects.all(),
+    )
+
+
+class ConfirmForm(forms.Form):
+    pass
+
+
 class ImageInline(admin.StackedInline):
     model = ProductImage
     extra = 1
@@ -15,33 +53,137 @@ class ImageInline(admin.StackedInline):
 class ProductCartInline(admin.StackedInline):
     model = ProductCart
     extra = 1
+    raw_id_fields = ('product',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
 
 
 @admin.register(Category)
-class CategoryAdmin(admin.ModelAdmin):
-    ...
+class CategoryAdmin(ScalableAdmin):
+    list_display = ('name', 'slug')
+    search_fields = ('slug__exact', 'name__startswith')
 
 
 @admin.register(SubCategory)
-class SubCategoryAdmin(admin.ModelAdmin):
-    ...
+class SubCategoryAdmin(ScalableAdmin):
+    list_display = ('name', 'slug', 'category')
+    list_select_related = ('category',)
+    list_filter = ('category',)
+    search_fields = ('slug__exact', 'name__startswith')
+    autocomplete_fields = ('category',)
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(ScalableAdmin):
     inlines = [ImageInline]
+    list_display = (
+        'name', 'slug', 'price', 'category', 'subcategory', 'updated_at',
+    )
+    list_select_related = ('category', 'subcategory')
+    list_filter = ('category', 'updated_at')
+    search_fields = ('slug__exact', 'name__startswith')
+    autocomplete_fields = ('category', 'subcategory')
+    actions = ('change_prices', 'move_to_subcategory', 'delete_products')
+    bulk_action_template = 'admin/shop/product/bulk_action.html'
+
+    def get_actions(self, request):
+        # Стандартное удаление загружает все объекты для страницы
+        # подтверждения, вместо него действие delete_products.
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def delete_model(self, request, obj):
+        delete_products(Product.objects.filter(pk=obj.pk))
+
+    @admin.action(description="Изменить цены", permissions=['change'])
+    def change_prices(self, request, queryset):
+        return self._bulk_action(
+            request, queryset, PriceChangeForm, "Изменение цен",
+            lambda data: change_prices(
+                queryset, **{data['mode']: data['value']},
+            ),
+            "Изменены цены продуктов: {}.",
+        )
+
+    @admin.action(description="Перенести в подкатегорию",
+                  permissions=['change'])
+    def move_to_subcategory(self, request, queryset):
+        return self._bulk_action(
+            request, queryset, MoveForm, "Перенос в подкатегорию",
+            lambda data: move_to_subcategory(queryset, data['subcategory']),
+            "Перенесено продуктов: {}.",
+        )
+
+    @admin.action(description="Удалить выбранные продукты",
+                  permissions=['delete'])
+    def delete_products(self, request, queryset):
+        return self._bulk_action(
+            request, queryset, ConfirmForm, "Удаление продуктов",
+            lambda data: delete_products(queryset),
+            "Удалено продуктов: {}.",
+        )
+
+    def _bulk_action(self, request, queryset, form_class, title, run,
+                     message):
+        """
+        Показывает форму параметров операции и после её отправки
+        выполняет операцию над всеми выбранными продуктами пачками.
+        """
+        form = form_class(request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            self.message_user(
+                request, message.format(run(form.cleaned_data)),
+                messages.SUCCESS,
+            )
+            return None
+        return TemplateResponse(request, self.bulk_action_template, {
+            **self.admin_site.each_context(request),
+            'title': title,
+            'opts': self.model._meta,
+            'form': form,
+            'count': estimated_count(queryset),
+            'action': request.POST['action'],
+            'selected': request.POST.getlist(ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+        })
 
 
 @admin.register(ProductImage)
-class ProductImageAdmin(admin.ModelAdmin):
-    ...
+class ProductImageAdmin(ScalableAdmin):
+    list_display = ('pk', 'image', 'product')
+    list_select_related = ('product',)
+    autocomplete_fields = ('product',)
 
 
 @admin.register(Cart)
-class CartAdmin(admin.ModelAdmin):
+class CartAdmin(ScalableAdmin):
     inlines = [ProductCartInline]
+    list_display = ('pk', 'user', 'last_activity')
+    list_select_related = ('user',)
+    search_fields = ('user__username__exact',)
+    raw_id_fields = ('user',)
 
 
 @admin.register(ProductCart)
-class ProductCartAdmin(admin.ModelAdmin):
-    ...
+class ProductCartAdmin(ScalableAdmin):
+    list_display = ('pk', 'cart', 'product', 'quantity')
+    list_select_related = ('cart__user', 'product')
+    search_fields = ('cart__user__username__exact', 'product__slug__exact')
+    raw_id_fields = ('cart', 'product')
+
+
+class OrderLineInline(admin.TabularInline):
+    model = OrderLine
+    raw_id_fields = ('product',)
+    extra = 0
+
+
+@admin.register(Order)
+class OrderAdmin(ScalableAdmin):
+    inlines = [OrderLineInline]
+    list_display = ('pk', 'user', 'total', 'created_at')
+    list_select_related = ('user',)
+    search_fields = ('user__username__exact',)
+    raw_id_fields = ('user',)
@@ -0,0 +1,46 @@
+"""
+SQLite с настройками для нескольких воркеров на одном файле БД.
+
+В OPTIONS понимаются два дополнительных ключа, как в Django 5.1:
+init_command — PRAGMA, выполняемые на каждом новом подключении
+(WAL, synchronous, mmap_size, cache_size), и transaction_mode — режим
+BEGIN для транзакций. В режиме IMMEDIATE блокировка записи берётся
+в начале транзакции и ждёт по timeout, а не падает с "database is
+locked" при повышении блокировки чтения до записи посреди транзакции.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    init_command = ''
+    transaction_mode = None
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.init_command = params.pop('init_command', '')
+        self.transaction_mode = params.pop('transaction_mode', None)
+        if self.transaction_mode is not None:
+            self.transaction_mode = self.transaction_mode.upper()
+            if self.transaction_mode not in TRANSACTION_MODES:
+                raise ImproperlyConfigured(
+                    "transaction_mode должен быть одним из "
+                    f"{', '.join(TRANSACTION_MODES)}."
+                )
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        if self.init_command:
+            conn.executescript(self.init_command)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute(f'BEGIN {self.transaction_mode}')
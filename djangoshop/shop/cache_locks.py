@@ -0,0 +1,65 @@
+"""
+Блокировки в кеше Django с токеном владельца.
+
+Блокировку берёт cache.add (в Redis это атомарный SET NX) со случайным
+токеном, а снимает только процесс с тем же токеном: процесс, который
+проработал дольше тайм-аута блокировки, не снимет блокировку, взятую
+после него другим. В Redis сравнение и удаление выполняет один
+скрипт, в других кешах между ними остаётся узкое окно.
+"""
+import re
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+REDIS_CACHE_BACKEND = 'django.core.cache.backends.redis.RedisCache'
+# Удаляет блокировку, только если в ней токен её владельца.
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_redis_clients = {}
+
+
+def acquire_lock(alias, key, timeout):
+    """
+    Берёт блокировку key на timeout секунд. Возвращает токен владельца
+    или None, если блокировка занята. Токен — целое число: RedisCache
+    хранит целые без сериализации, и скрипт снятия сравнивает его
+    как строку.
+    """
+    token = uuid.uuid4().int
+    if caches[alias].add(key, token, timeout=timeout):
+        return token
+    return None
+
+
+def release_lock(alias, key, token):
+    """Снимает блокировку key, если её держит владелец token."""
+    cache = caches[alias]
+    cache_settings = settings.CACHES[alias]
+    if cache_settings['BACKEND'] == REDIS_CACHE_BACKEND:
+        _redis_client(cache_settings['LOCATION']).eval(
+            RELEASE_LOCK_SCRIPT, 1, cache.make_key(key), token,
+        )
+    elif cache.get(key) == token:
+        cache.delete(key)
+
+
+def _redis_client(location):
+    """
+    Клиент Redis для основного сервера кеша: как RedisCache, пишет
+    в первый из адресов LOCATION.
+    """
+    servers = (re.split('[;,]', location) if isinstance(location, str)
+               else location)
+    if servers[0] not in _redis_clients:
+        import redis
+
+        _redis_clients[servers[0]] = redis.Redis.from_url(servers[0])
+    return _redis_clients[servers[0]]
@@ -0,0 +1,62 @@
+"""
+Очистка брошенных корзин.
+
+Корзина есть у каждого пользователя и создаётся вместе с ним, поэтому
+брошенная корзина не удаляется, а опустошается: удаляются строки
+корзин, которые не менялись CART_ABANDONED_DAYS дней
+(Cart.last_activity). Корзины со строками обходятся по возрастанию id
+пачками по CART_CLEANUP_BATCH_SIZE, каждая пачка — отдельная короткая
+транзакция, поэтому очистка не держит долгих блокировок, а прерванный
+проход можно просто запустить снова. Корзины пачки блокируются
+с пропуском занятых (skip_locked) и в хранилище корзин, их last_activity
+проверяется заново под блокировкой: корзину, которую изменили во время
+очистки, она не тронет. Корзины, изменения которых ещё лежат в кеше
+(CART_STORE = 'cache'), пропускаются: при записи в БД они обновят
+last_activity.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from shop.cart_store import get_cart_store
+from shop.models import Cart, ProductCart
+
+
+def clear_abandoned(days=None, batch_size=None):
+    """
+    Опустошает корзины, не менявшиеся days (CART_ABANDONED_DAYS) дней.
+    После каждой пачки отдаёт (id последней просмотренной корзины,
+    число очищенных корзин, число удалённых строк).
+    """
+    days = settings.CART_ABANDONED_DAYS if days is None else days
+    batch_size = batch_size or settings.CART_CLEANUP_BATCH_SIZE
+    cutoff = timezone.now() - timedelta(days=days)
+    store = get_cart_store()
+    lines = ProductCart.objects.filter(cart__last_activity__lt=cutoff)
+    last_id = 0
+    while True:
+        candidates = dict(lines.filter(
+            cart_id__gt=last_id,
+        ).order_by('cart_id').values_list(
+            'cart_id', 'cart__user_id',
+        ).distinct()[:batch_size])
+        if not candidates:
+            return
+        last_id = max(candidates)
+        # Блокировка хранилища держится до удаления корзин из кеша после
+        # коммита, иначе чтение корзины успело бы загрузить в кеш
+        # ещё не удалённые строки.
+        with store.unchanged(candidates.values()) as user_ids:
+            with transaction.atomic():
+                carts = dict(Cart.objects.select_for_update(
+                    skip_locked=True,
+                ).filter(
+                    user_id__in=user_ids, last_activity__lt=cutoff,
+                ).values_list('pk', 'user_id'))
+                deleted, _ = ProductCart.objects.filter(
+                    cart_id__in=list(carts),
+                ).delete()
+            store.forget_many(carts.values())
+        yield last_id, len(carts), deleted
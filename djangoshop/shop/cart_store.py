@@ -0,0 +1,545 @@
+"""
+Хранилища корзин пользователей.
+
+DatabaseCartStore работает напрямую с Cart и ProductCart.
+CacheCartStore держит живые корзины в кеше Django как словари
+{id продукта: количество} и записывает их в БД с задержкой
+(write-behind): каждое изменение добавляет id пользователя в журнал
+в кеше, а flush() переносит накопившиеся корзины в БД пачками
+по CART_FLUSH_BATCH_SIZE. Сбрасывает журнал фоновый поток процесса раз
+в CART_FLUSH_INTERVAL секунд (запросы покупателей его не ждут), команда
+flush_carts и оформление заказа. Журнал и позиция последнего сброса
+лежат в кеше, а запись в журнал делается до изменения корзины, поэтому
+после падения воркера незаписанные изменения сбросит следующий flush().
+Номер журнала, который долго остаётся пустым, сброс занимает сам
+атомарным cache.add, и опоздавший процесс записывает корзину в журнал
+под новым номером: пропуск номера не теряет изменений.
+Корзина, которой нет в кеше, загружается из БД под её блокировкой.
+Блокировки корзин хранят токен владельца (shop.cache_locks), поэтому
+процесс, проработавший дольше CART_LOCK_TIMEOUT, не снимет чужую
+блокировку.
+Оба хранилища отмечают изменение корзины в Cart.last_activity.
+GuestCartStore хранит в кеше корзины анонимных покупателей и переносит
+их в корзину пользователя при входе.
+"""
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from shop.cache_locks import acquire_lock, release_lock
+from shop.models import Cart, Product, ProductCart
+
+
+logger = logging.getLogger(__name__)
+
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+# Пауза между попытками взять занятую блокировку растёт вдвое
+# от LOCK_RETRY_MIN до LOCK_RETRY_MAX секунд.
+LOCK_RETRY_MIN = 0.001
+LOCK_RETRY_MAX = 0.05
+# Значение занятого сбросом номера журнала, для которого так и не
+# появилась запись.
+SKIPPED = 'skipped'
+
+
+def touch(carts):
+    """
+    Отмечает изменение корзин queryset carts. last_activity
+    переписывается, только если оно старше CART_ACTIVITY_RESOLUTION
+    секунд, поэтому частые изменения одной корзины не обновляют её
+    строку каждый раз.
+    """
+    now = timezone.now()
+    carts.filter(last_activity__lt=now - timedelta(
+        seconds=settings.CART_ACTIVITY_RESOLUTION,
+    )).update(last_activity=now)
+
+
+class DatabaseCartStore:
+
+    def lines(self, user):
+        """
+        Строки корзины с продуктами одним запросом при любом их числе.
+        Корзина создаётся вместе с пользователем, поэтому сама она
+        не запрашивается.
+        """
+        return list(ProductCart.objects.filter(
+            cart__user=user,
+        ).select_related('product').order_by('pk'))
+
+    @transaction.atomic
+    def add(self, user, product, quantity):
+        touch(Cart.objects.filter(user=user))
+        lines = ProductCart.objects.filter(cart__user=user, product=product)
+        if lines.update(quantity=F('quantity') + quantity):
+            quantity = lines.values_list('quantity', flat=True).get()
+            return ProductCart(product=product, quantity=quantity)
+        try:
+            with transaction.atomic():
+                ProductCart.objects.create(
+                    cart_id=self._cart_id(user), product=product,
+                    quantity=quantity,
+                )
+        except IntegrityError:
+            # Одновременный запрос первым добавил этот продукт.
+            lines.update(quantity=F('quantity') + quantity)
+            quantity = lines.values_list('quantity', flat=True).get()
+        return ProductCart(product=product, quantity=quantity)
+
+    def update(self, user, product, quantity):
+        touch(Cart.objects.filter(user=user))
+        lines = ProductCart.objects.filter(cart__user=user, product=product)
+        if not lines.update(quantity=quantity):
+            return None
+        return ProductCart(product=product, quantity=quantity)
+
+    def remove(self, user, product):
+        touch(Cart.objects.filter(user=user))
+        deleted, _ = ProductCart.objects.filter(
+            cart__user=user, product=product,
+        ).delete()
+        return bool(deleted)
+
+    def clear(self, user):
+        touch(Cart.objects.filter(user=user))
+        ProductCart.objects.filter(cart__user=user).delete()
+
+    @transaction.atomic
+    def merge(self, user, items):
+        """
+        Добавляет к корзине пользователя количества из словаря
+        {id продукта: количество} одним INSERT ... ON CONFLICT.
+        """
+        cart_id = self._cart_id(user)
+        touch(Cart.objects.filter(pk=cart_id))
+        existing = dict(ProductCart.objects.select_for_update().filter(
+            cart_id=cart_id, product_id__in=items,
+        ).values_list('product_id', 'quantity'))
+        product_ids = Product.objects.filter(
+            pk__in=items,
+        ).values_list('pk', flat=True)
+        ProductCart.objects.bulk_create(
+            [
+                ProductCart(cart_id=cart_id, product_id=pk,
+                            quantity=existing.get(pk, 0) + items[pk])
+                for pk in product_ids
+            ],
+            update_conflicts=True,
+            unique_fields=['cart', 'product'],
+            update_fields=['quantity'],
+        )
+
+    def flush(self, user_ids=None):
+        return 0
+
+    @contextmanager
+    def detached(self, user):
+        yield
+
+    def forget_many(self, user_ids):
+        pass
+
+    @contextmanager
+    def unchanged(self, user_ids):
+        yield set(user_ids)
+
+    def _cart_id(self, user):
+        return Cart.objects.values_list('pk', flat=True).get(user=user)
+
+
+class CacheCartStore:
+
+    key_prefix = 'cart'
+    timeout = None
+
+    def __init__(self, alias=None):
+        self.alias = alias or settings.CART_CACHE_ALIAS
+        self.cache = caches[self.alias]
+
+    def lines(self, user):
+        owner_id = self._owner_id(user)
+        items = self.cache.get(self._key(owner_id))
+        if items is None:
+            # Корзину из БД кладёт в кеш только держатель блокировки:
+            # иначе строки, прочитанные до оформления заказа или сброса,
+            # вернулись бы в кеш после них.
+            with self._locked(owner_id):
+                items = self._load(owner_id)
+        products = Product.objects.in_bulk(items)
+        return [
+            ProductCart(product=products[pk], quantity=quantity)
+            for pk, quantity in items.items() if pk in products
+        ]
+
+    def add(self, user, product, quantity):
+        with self._changing(self._owner_id(user)) as items:
+            items[product.pk] = items.get(product.pk, 0) + quantity
+            return ProductCart(product=product, quantity=items[product.pk])
+
+    def update(self, user, product, quantity):
+        with self._changing(self._owner_id(user)) as items:
+            if product.pk not in items:
+                return None
+            items[product.pk] = quantity
+            return ProductCart(product=product, quantity=quantity)
+
+    def remove(self, user, product):
+        with self._changing(self._owner_id(user)) as items:
+            return items.pop(product.pk, None) is not None
+
+    def clear(self, user):
+        with self._changing(self._owner_id(user)) as items:
+            items.clear()
+
+    def merge(self, user, items):
+        with self._changing(self._owner_id(user)) as cart_items:
+            for pk, quantity in items.items():
+                cart_items[pk] = cart_items.get(pk, 0) + quantity
+
+    def flush(self, user_ids=None):
+        """
+        Записывает в БД корзины из журнала изменений, не больше
+        CART_FLUSH_BATCH_SIZE за вызов, или корзины указанных
+        пользователей. Возвращает число записанных корзин.
+        """
+        if user_ids is not None:
+            return self._persist_locked(set(user_ids))
+        flush_lock = self._key('flush-lock')
+        if (token := self._acquire(flush_lock)) is None:
+            return 0
+        try:
+            flushed = self.cache.get(self._key('flushed'), 0)
+            upto = min(
+                self.cache.get(self._key('seq'), 0),
+                flushed + settings.CART_FLUSH_BATCH_SIZE,
+            )
+            keys = [self._key('journal', n) for n in range(flushed + 1,
+                                                           upto + 1)]
+            entries = self.cache.get_many(keys)
+            if len(entries) < len(keys):
+                # Запись журнала пишется сразу после увеличения счётчика,
+                # даём ей время появиться.
+                time.sleep(0.05)
+                entries = self.cache.get_many(keys)
+            upto = self._journal_end(flushed, upto, entries)
+            keys = keys[:upto - flushed]
+            written = [key for key in keys if entries[key] != SKIPPED]
+            persisted = self._persist_locked({
+                entries[key] for key in written
+            })
+            self.cache.set(self._key('flushed'), upto, None)
+            # Занятые номера остаются: иначе опоздавший процесс записал
+            # бы корзину под номером, который уже сброшен.
+            self.cache.delete_many(written + [
+                self._key('gap', n) for n in range(flushed + 1, upto + 1)
+            ])
+            return persisted
+        finally:
+            self._release(flush_lock, token)
+
+    def _journal_end(self, flushed, upto, entries):
+        """
+        Последний номер журнала, до которого его можно сбросить. Записи,
+        которой ещё нет, пишет другой процесс, и сброс останавливается
+        перед ней. Если её нет дольше CART_LOCK_TIMEOUT (процесс упал
+        или завис между увеличением счётчика и записью в журнал), сброс
+        занимает номер значением SKIPPED. Запись журнала делается
+        cache.add, поэтому опоздавший процесс увидит занятый номер
+        и запишет корзину в журнал под новым (_changed). В entries
+        добавляются значения занятых номеров.
+        """
+        for seq in range(flushed + 1, upto + 1):
+            key = self._key('journal', seq)
+            if key in entries:
+                continue
+            gap = self._key('gap', seq)
+            self.cache.add(gap, time.time(), None)
+            seen = self.cache.get(gap, time.time())
+            if time.time() - seen < settings.CART_LOCK_TIMEOUT:
+                return seq - 1
+            self.cache.add(key, SKIPPED, None)
+            entries[key] = self.cache.get(key, SKIPPED)
+        return upto
+
+    @contextmanager
+    def detached(self, user):
+        """
+        Записывает корзину пользователя в БД и держит её блокировку, пока
+        строки корзины меняют в БД напрямую (оформление заказа): изменения
+        из кеша за это время не появятся. После блока корзина убирается
+        из кеша, следующее чтение загрузит её из БД.
+        """
+        owner_id = self._owner_id(user)
+        with self._locked(owner_id):
+            self._persist({owner_id})
+            yield
+            self.cache.delete(self._key(owner_id))
+
+    def forget_many(self, user_ids):
+        """
+        Убирает из кеша корзины пользователей user_ids одним запросом
+        без блокировок: вызывается внутри unchanged().
+        """
+        self.cache.delete_many([self._key(user_id) for user_id in user_ids])
+
+    @contextmanager
+    def unchanged(self, user_ids):
+        """
+        Блокирует корзины пользователей user_ids, пропуская занятые,
+        и отдаёт множество тех из них, у кого корзина в кеше совпадает
+        с БД. Пока блок не завершился, их строки можно менять в БД
+        напрямую (очистка брошенных корзин): изменить корзину в кеше никто
+        не может. Корзины с ещё не записанными изменениями не отдаются,
+        их запишет flush().
+        """
+        tokens = {}
+        for user_id in user_ids:
+            token = self._acquire(self._key('lock', user_id))
+            if token is not None:
+                tokens[user_id] = token
+        try:
+            yield self._in_sync(list(tokens))
+        finally:
+            for user_id, token in tokens.items():
+                self._release(self._key('lock', user_id), token)
+
+    def _key(self, *parts):
+        return ':'.join(map(str, (self.key_prefix, *parts)))
+
+    def _owner_id(self, user):
+        return user.pk
+
+    def _initial(self, user_id):
+        return dict(ProductCart.objects.filter(
+            cart__user_id=user_id,
+        ).order_by('pk').values_list('product_id', 'quantity'))
+
+    def _load(self, owner_id):
+        """Корзина из кеша или из БД. Вызывается под её блокировкой."""
+        items = self.cache.get(self._key(owner_id))
+        if items is None:
+            items = self._initial(owner_id)
+            self.cache.set(self._key(owner_id), items, self.timeout)
+        return items
+
+    def _acquire(self, lock):
+        return acquire_lock(self.alias, lock, settings.CART_LOCK_TIMEOUT)
+
+    def _release(self, lock, token):
+        release_lock(self.alias, lock, token)
+
+    @contextmanager
+    def _locked(self, owner_id):
+        lock = self._key('lock', owner_id)
+        delay = LOCK_RETRY_MIN
+        while (token := self._acquire(lock)) is None:
+            time.sleep(random.uniform(delay / 2, delay))
+            delay = min(delay * 2, LOCK_RETRY_MAX)
+        try:
+            yield
+        finally:
+            self._release(lock, token)
+
+    @contextmanager
+    def _locked_many(self, owner_ids):
+        # Блокировки берутся в одном порядке, чтобы два сброса
+        # не ждали друг друга по кругу.
+        with ExitStack() as stack:
+            for owner_id in sorted(owner_ids, key=str):
+                stack.enter_context(self._locked(owner_id))
+            yield
+
+    @contextmanager
+    def _changing(self, owner_id):
+        with self._locked(owner_id):
+            items = self._load(owner_id)
+            yield items
+            # Сначала журнал: если процесс упадёт после него, сброс
+            # запишет корзину, а изменение без записи в журнале
+            # потерялось бы для БД. Сброс, увидевший запись журнала
+            # раньше новой корзины, читает корзину под этой же
+            # блокировкой и дождётся её.
+            self._changed(owner_id)
+            self.cache.set(self._key(owner_id), items, self.timeout)
+
+    def _changed(self, user_id):
+        self.cache.add(self._key('seq'), 0, None)
+        while not self._journal(self.cache.incr(self._key('seq')), user_id):
+            # Номер занял сброс, не дождавшись записи.
+            pass
+        start_flusher()
+
+    def _journal(self, seq, user_id):
+        return self.cache.add(self._key('journal', seq), user_id, None)
+
+    def _in_sync(self, user_ids):
+        keys = {self._key(user_id): user_id for user_id in user_ids}
+        cached = {
+            keys[key]: items
+            for key, items in self.cache.get_many(keys).items()
+        }
+        stored = {user_id: {} for user_id in cached}
+        for user_id, pk, quantity in ProductCart.objects.filter(
+                cart__user_id__in=cached,
+        ).values_list('cart__user_id', 'product_id', 'quantity'):
+            stored[user_id][pk] = quantity
+        # Удалённые продукты остаются только в кеше и при записи
+        # пропускаются.
+        product_ids = set(Product.objects.filter(pk__in={
+            pk for items in cached.values() for pk in items
+        }).values_list('pk', flat=True))
+        return {
+            user_id for user_id in user_ids
+            if user_id not in cached or stored[user_id] == {
+                pk: quantity for pk, quantity in cached[user_id].items()
+                if pk in product_ids
+            }
+        }
+
+    def _persist_locked(self, user_ids):
+        with self._locked_many(user_ids):
+            return self._persist(user_ids)
+
+    def _persist(self, user_ids):
+        """
+        Записывает в БД корзины пользователей user_ids из кеша.
+        Вызывается под их блокировками.
+        """
+        keys = {self._key(user_id): user_id for user_id in user_ids}
+        carts = {
+            keys[key]: items
+            for key, items in self.cache.get_many(keys).items()
+        }
+        if not carts:
+            return 0
+        with transaction.atomic():
+            cart_ids = dict(Cart.objects.filter(
+                user_id__in=carts,
+            ).values_list('user_id', 'pk'))
+            touch(Cart.objects.filter(pk__in=cart_ids.values()))
+            product_ids = set(Product.objects.filter(pk__in={
+                pk for items in carts.values() for pk in items
+            }).values_list('pk', flat=True))
+            ProductCart.objects.filter(reduce(or_, (
+                Q(cart_id=cart_ids[user_id])
+                & ~Q(product_id__in=list(carts[user_id]))
+                for user_id in cart_ids
+            ), Q(pk__in=[]))).delete()
+            ProductCart.objects.bulk_create(
+                [
+                    ProductCart(cart_id=cart_id, product_id=pk,
+                                quantity=quantity)
+                    for user_id, cart_id in cart_ids.items()
+                    for pk, quantity in carts[user_id].items()
+                    if pk in product_ids
+                ],
+                update_conflicts=True,
+                unique_fields=['cart', 'product'],
+                update_fields=['quantity'],
+            )
+        return len(cart_ids)
+
+
+class GuestCartStore(CacheCartStore):
+    """
+    Корзины анонимных покупателей. Хранятся только в кеше
+    GUEST_CART_TIMEOUT секунд с последнего изменения, вместо пользователя
+    методы принимают идентификатор гостевой корзины.
+    """
+
+    key_prefix = 'guest-cart'
+
+    @property
+    def timeout(self):
+        return settings.GUEST_CART_TIMEOUT
+
+    def new_id(self):
+        return uuid.uuid4().hex
+
+    def move_to_user(self, cart_id, user):
+        """
+        Переносит гостевую корзину в корзину пользователя и удаляет её.
+        Возвращает число перенесённых позиций.
+        """
+        with self._locked(cart_id):
+            items = self.cache.get(self._key(cart_id))
+            if items:
+                get_cart_store().merge(user, items)
+            self.cache.delete(self._key(cart_id))
+        return len(items or ())
+
+    def flush(self, user_ids=None):
+        return 0
+
+    def _owner_id(self, cart_id):
+        return cart_id
+
+    def _initial(self, cart_id):
+        return {}
+
+    def _changed(self, cart_id):
+        pass
+
+
+def _run_flusher():
+    while True:
+        time.sleep(settings.CART_FLUSH_INTERVAL)
+        store = CacheCartStore()
+        try:
+            while store.flush():
+                pass
+        except Exception:
+            # Поток не перезапускается: любая ошибка БД или кеша только
+            # откладывает запись до следующего интервала.
+            logger.exception("Не удалось записать корзины из кеша")
+        close_old_connections()
+
+
+def start_flusher():
+    """
+    Запускает в процессе фоновый поток, который раз
+    в CART_FLUSH_INTERVAL секунд сбрасывает журнал корзин. С нулевым
+    интервалом поток не запускается, журнал сбрасывает flush_carts.
+    """
+    global _flusher_pid
+    if settings.CART_FLUSH_INTERVAL <= 0:
+        return
+    with _flusher_lock:
+        # После fork поток родителя в процессе не работает.
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(
+        target=_run_flusher, name='cart-flush', daemon=True,
+    ).start()
+
+
+CART_STORES = {
+    'database': DatabaseCartStore,
+    'cache': CacheCartStore,
+}
+
+
+def get_cart_store():
+    try:
+        return CART_STORES[settings.CART_STORE]()
+    except KeyError:
+        raise ImproperlyConfigured(
+            f"Неизвестное хранилище корзин {settings.CART_STORE!r}, "
+            f"доступны: {', '.join(CART_STORES)}."
+        )
@@ -0,0 +1,209 @@
+"""
+Массовые операции с продуктами: изменение цен, перенос в другую
+подкатегорию и удаление.
+
+Каждая операция выполняется пачками по chunk_size продуктов: id пачки
+выбираются одним запросом по возрастанию pk, затем пачка изменяется
+одним UPDATE с исходными фильтрами и границами pk пачки в своей
+транзакции, поэтому блокировки держатся недолго даже на миллионах
+строк. Новые значения считаются в БД через F-выражения. После фиксации
+каждой пачки один раз отправляется сигнал catalog_changed со списком
+id её продуктов.
+
+Удаление пачки блокирует и читает id её продуктов, затем удаляет их
+строки и строки связанных таблиц явными DELETE (или UPDATE для
+SET_NULL) по DELETE_BATCH_SIZE id за запрос, без загрузки объектов
+и сигналов post_delete, и записывает удаление для выгрузки каталога
+одним INSERT. Число запросов не зависит от числа продуктов в пачке,
+пока оно не больше DELETE_BATCH_SIZE. После фиксации файлы
+изображений пачки освобождаются одним вызовом release вместе с копиями
+в дисковом кэше.
+"""
+from functools import partial
+
+from django.db import connections, models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest, Round
+from django.utils import timezone
+
+from shop.image_cache import get_image_cache
+from shop.media import release
+from shop.models import Product, ProductImage
+from shop.signals import (
+    catalog_changed, record_deleted_products, reported_in_batch,
+)
+
+
+DEFAULT_CHUNK_SIZE = 1000
+# Меньше предела SQLite в 999 параметров на запрос.
+DELETE_BATCH_SIZE = 500
+
+
+def chunks(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Генератор пачек продуктов queryset в виде пар (queryset с границами
+    pk пачки, список id). Следующая пачка выбирается после изменения
+    предыдущей, поэтому продукты, которые перестали подходить
+    под фильтр, не пропускают соседей.
+    """
+    if chunk_size < 1:
+        raise ValueError("Размер пачки должен быть положительным.")
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        remaining = queryset
+        if last_pk is not None:
+            remaining = queryset.filter(pk__gt=last_pk)
+        product_ids = list(
+            remaining.values_list('pk', flat=True)[:chunk_size]
+        )
+        if not product_ids:
+            return
+        last_pk = product_ids[-1]
+        yield queryset.filter(
+            pk__gte=product_ids[0], pk__lte=last_pk,
+        ), product_ids
+
+
+def _apply(queryset, operation, chunk_size):
+    changed = 0
+    for chunk, product_ids in chunks(queryset, chunk_size):
+        with transaction.atomic(using=chunk.db), reported_in_batch():
+            changed += operation(chunk)
+            transaction.on_commit(partial(
+                catalog_changed.send, sender=Product,
+                product_ids=product_ids,
+            ), using=chunk.db)
+    return changed
+
+
+def change_prices(queryset, percent=None, amount=None,
+                  chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Меняет цены продуктов на percent процентов или на amount.
+    Цена округляется до копеек и не опускается ниже нуля. Возвращает
+    число изменённых продуктов.
+    """
+    if (percent is None) == (amount is None):
+        raise ValueError("Укажите либо процент, либо сумму изменения.")
+    if percent is not None:
+        price = F('price') * (1 + percent / 100)
+    else:
+        price = F('price') + amount
+    return _apply(
+        queryset,
+        lambda chunk: chunk.update(
+            price=Round(Greatest(price, Value(0.0)), 2),
+            updated_at=timezone.now(),
+        ),
+        chunk_size,
+    )
+
+
+def move_to_subcategory(queryset, subcategory,
+                        chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Переносит продукты в подкатегорию, категория продуктов меняется
+    на категорию подкатегории, если она задана.
+    """
+    changes = {'subcategory': subcategory}
+    if subcategory.category_id is not None:
+        changes['category_id'] = subcategory.category_id
+    return _apply(
+        queryset,
+        lambda chunk: chunk.update(**changes, updated_at=timezone.now()),
+        chunk_size,
+    )
+
+
+def delete_products(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Удаляет продукты вместе с их изображениями и строками корзин.
+    Возвращает число удалённых продуктов.
+    """
+    return _apply(queryset, _delete_chunk, chunk_size)
+
+
+def _delete_chunk(chunk):
+    using = chunk.db
+    product_ids = list(
+        chunk.select_for_update().values_list('pk', flat=True)
+    )
+    released = []
+    for batch in _batches(product_ids):
+        released += ProductImage.objects.using(using).filter(
+            product_id__in=batch,
+        ).values_list('pk', 'image')
+    _delete_rows(ProductImage, using, [pk for pk, _ in released])
+    _delete_dependants(using, product_ids)
+    _delete_rows(Product, using, product_ids)
+    record_deleted_products(product_ids, using=using)
+    transaction.on_commit(partial(_release_images, released), using=using)
+    return len(product_ids)
+
+
+def _batches(pks):
+    for start in range(0, len(pks), DELETE_BATCH_SIZE):
+        yield pks[start:start + DELETE_BATCH_SIZE]
+
+
+def _delete_dependants(using, product_ids):
+    """
+    Удаляет или отвязывает строки, ссылающиеся на продукты, так же,
+    как это сделал бы Collector: по запросу на связь и пачку id.
+    Изображения удаляет _delete_chunk, у остальных связанных моделей
+    нет сигналов и своих зависимых, поэтому QuerySet.delete() удаляет
+    их одним DELETE без загрузки строк.
+    """
+    for relation in Product._meta.get_fields(include_hidden=True):
+        # Обратные связи ForeignKey и OneToOneField, в том числе
+        # скрытые (related_name='+'), как у Collector.
+        if (not relation.auto_created or relation.concrete
+                or not (relation.one_to_many or relation.one_to_one)
+                or relation.related_model is ProductImage):
+            continue
+        related = relation.related_model._base_manager.using(using)
+        lookup = f'{relation.field.name}__in'
+        for batch in _batches(product_ids):
+            rows = related.filter(**{lookup: batch})
+            if relation.on_delete is models.CASCADE:
+                rows.delete()
+            elif relation.on_delete is models.SET_NULL:
+                rows.update(**{relation.field.name: None})
+            else:
+                raise ValueError(
+                    f"Массовое удаление не поддерживает on_delete="
+                    f"{relation.on_delete.__name__} для "
+                    f"{relation.related_model._meta.label}."
+                )
+
+
+def _delete_rows(model, using, pks):
+    """
+    Удаляет строки модели по id явным DELETE. QuerySet.delete() загрузил
+    бы каждую строку ради сигналов post_delete (shop.signals), а они
+    освобождают файлы, чистят кэш и записывают удаления по одному;
+    здесь это делается для всей пачки.
+    """
+    connection = connections[using]
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(model._meta.pk.column)
+    with connection.cursor() as cursor:
+        for batch in _batches(pks):
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(
+                f'DELETE FROM {table} WHERE {column} IN ({placeholders})',
+                batch,
+            )
+
+
+def _release_images(images):
+    """
+    Освобождает файлы удалённых изображений, пары (id, имя файла),
+    и удаляет их копии из дискового кэша.
+    """
+    release([name for _, name in images])
+    image_cache = get_image_cache()
+    kind = ProductImage._meta.get_field('image').upload_to.strip('/')
+    for pk, _ in images:
+        image_cache.invalidate(kind, pk)
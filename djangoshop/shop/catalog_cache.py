@@ -0,0 +1,44 @@
+"""
+Версия каталога для кешей, зависящих от продуктов.
+
+Ключи таких кешей включают текущую версию, поэтому после изменения
+каталога старые записи перестают читаться и вытесняются сами: вместо
+удаления ключей по одному версия увеличивается один раз на пачку
+изменённых продуктов. Начальная версия — время её создания, чтобы
+после очистки кеша версии не повторялись.
+Версия общая для всех процессов, только если кеш общий (Redis):
+в LocMemCache у каждого воркера и команды своя версия, и изменение
+каталога в одном процессе не видно остальным.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+CATALOG_VERSION_KEY = 'catalog:version'
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def cache_is_shared(alias='default'):
+    """Общий ли для процессов кеш alias."""
+    return settings.CACHES[alias]['BACKEND'] not in PROCESS_LOCAL_CACHES
+
+
+def version_is_shared():
+    """Видят ли все процессы одну версию каталога."""
+    return cache_is_shared()
+
+
+def catalog_version():
+    return cache.get_or_set(CATALOG_VERSION_KEY, time.time_ns, timeout=None)
+
+
+def bump_catalog_version():
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        return catalog_version()
@@ -0,0 +1,242 @@
+"""
+Потоковый импорт каталога продуктов из CSV/JSONL.
+
+Файл читается построчно генераторами и никогда не загружается в память
+целиком: строки нормализуются, группируются в пачки, проверяются
+пачкой и записываются одним upsert-запросом на пачку. После каждой
+пачки отправляется сигнал catalog_changed. Из отклонённых строк
+в отчёте остаются число и первые REJECTED_LIMIT строк с причинами.
+В режиме dry_run строки только проверяются, прошедшие проверку
+считаются в validated, а upserted остаётся нулевым.
+"""
+import csv
+import json
+import math
+import time
+from dataclasses import dataclass, field
+from itertools import islice
+
+from django.core.validators import validate_slug
+from django.core.exceptions import ValidationError
+
+from shop.models import Category, SubCategory, Product
+from shop.signals import catalog_changed
+
+
+IMPORT_FIELDS = ('name', 'slug', 'price', 'category', 'subcategory')
+TEXT_FIELDS = ('name', 'slug', 'category', 'subcategory')
+UPDATE_FIELDS = [
+    'name', 'price', 'category', 'subcategory', 'updated_at',
+]
+NAME_MAX_LENGTH = Product._meta.get_field('name').max_length
+SLUG_MAX_LENGTH = Product._meta.get_field('slug').max_length
+REJECTED_LIMIT = 1000
+
+
+@dataclass
+class ImportReport:
+    processed: int = 0
+    validated: int = 0
+    upserted: int = 0
+    rejected: list = field(default_factory=list)
+    rejected_count: int = 0
+    rejected_limit: int = REJECTED_LIMIT
+    elapsed: float = 0.0
+
+    def reject(self, rejected):
+        """
+        Учитывает отклонённые строки пачки: считаются все, а в rejected
+        остаются первые rejected_limit.
+        """
+        self.rejected_count += len(rejected)
+        free = self.rejected_limit - len(self.rejected)
+        self.rejected.extend(rejected[:free])
+
+    @property
+    def rows_per_second(self):
+        if not self.elapsed:
+            return 0.0
+        return self.processed / self.elapsed
+
+
+class UndecodableLine(Exception):
+    pass
+
+
+def decode_lines(stream):
+    """
+    Генератор строк бинарного потока в UTF-8, декодированных по одной.
+    BOM в начале файла (выгрузки Excel и ERP) отбрасывается. Строка
+    не в UTF-8 вызывает UndecodableLine с её номером.
+    """
+    for line_num, line in enumerate(stream, start=1):
+        try:
+            yield line.decode('utf-8-sig' if line_num == 1 else 'utf-8')
+        except UnicodeDecodeError as error:
+            raise UndecodableLine(line_num) from error
+
+
+def read_rows(stream, fmt):
+    """
+    Генератор сырых строк файла в виде пар (номер строки, словарь).
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_num, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_num, row if isinstance(row, dict) else None
+    else:
+        raise ValueError(f"Неизвестный формат импорта: {fmt}")
+
+
+def normalize(rows):
+    """
+    Приводит строки к единому виду: обрезает пробелы, пустые значения
+    заменяет на None, лишние колонки отбрасывает.
+    """
+    for line_num, row in rows:
+        if row is None:
+            yield line_num, None
+            continue
+        normalized = {}
+        for key in IMPORT_FIELDS:
+            value = row.get(key)
+            if isinstance(value, str):
+                value = value.strip() or None
+            normalized[key] = value
+        yield line_num, normalized
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class CatalogImporter:
+    """
+    Загрузчик продуктов: slug'и категорий и подкатегорий разрешаются
+    через словари slug -> id, собранные одним запросом на модель,
+    продукты записываются через bulk_create(update_conflicts=True)
+    по уникальному slug.
+    """
+
+    def __init__(self, batch_size=1000, dry_run=False,
+                 rejected_limit=REJECTED_LIMIT):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.rejected_limit = rejected_limit
+        self.category_ids = dict(
+            Category.objects.values_list('slug', 'id')
+        )
+        self.subcategory_ids = dict(
+            SubCategory.objects.values_list('slug', 'id')
+        )
+
+    def run(self, rows):
+        report = ImportReport(rejected_limit=self.rejected_limit)
+        started = time.monotonic()
+        for batch in batched(normalize(rows), self.batch_size):
+            report.processed += len(batch)
+            products, rejected = self.validate_batch(batch)
+            report.reject(rejected)
+            report.validated += len(products)
+            if products and not self.dry_run:
+                self.upsert(products)
+                report.upserted += len(products)
+        report.elapsed = time.monotonic() - started
+        return report
+
+    def validate_batch(self, batch):
+        """
+        Проверка пачки строк по правилам Product.clean и ограничениям
+        полей модели. Возвращает продукты и отклонённые строки
+        в виде (номер строки, причина). При повторе slug внутри пачки
+        остаётся последняя строка.
+        """
+        products = {}
+        rejected = []
+        for line_num, row in batch:
+            if row is None:
+                rejected.append((line_num, "Строка не разобрана."))
+                continue
+            errors = self._row_errors(row)
+            if errors:
+                rejected.append((line_num, ' '.join(errors)))
+                continue
+            products[row['slug']] = Product(
+                name=row['name'],
+                slug=row['slug'],
+                price=float(row['price']),
+                category_id=self.category_ids.get(row['category']),
+                subcategory_id=self.subcategory_ids.get(row['subcategory']),
+            )
+        return list(products.values()), rejected
+
+    def _row_errors(self, row):
+        # В JSONL значения могут быть числами, списками и объектами.
+        errors = [
+            f"Поле {key} должно быть строкой." for key in TEXT_FIELDS
+            if row[key] is not None and not isinstance(row[key], str)
+        ]
+        if errors:
+            return errors
+        name = row['name']
+        if not name:
+            errors.append("Не указано название.")
+        elif len(name) > NAME_MAX_LENGTH:
+            errors.append("Слишком длинное название.")
+        if not self._is_valid_slug(row['slug']):
+            errors.append("Некорректный slug.")
+        if not self._is_valid_price(row['price']):
+            errors.append("Некорректная цена.")
+        category, subcategory = row['category'], row['subcategory']
+        if category and category not in self.category_ids:
+            errors.append(f"Категория {category} не найдена.")
+        if subcategory and subcategory not in self.subcategory_ids:
+            errors.append(f"Подкатегория {subcategory} не найдена.")
+        if not category and not subcategory:
+            errors.append(
+                "У продукта должна быть категория или подкатегория."
+            )
+        return errors
+
+    @staticmethod
+    def _is_valid_slug(slug):
+        if not slug or len(slug) > SLUG_MAX_LENGTH:
+            return False
+        try:
+            validate_slug(slug)
+        except ValidationError:
+            return False
+        return True
+
+    @staticmethod
+    def _is_valid_price(price):
+        try:
+            price = float(price)
+        except (TypeError, ValueError):
+            return False
+        return math.isfinite(price) and price >= 0
+
+    def upsert(self, products):
+        Product.objects.bulk_create(
+            products,
+            update_conflicts=True,
+            unique_fields=['slug'],
+            update_fields=UPDATE_FIELDS,
+        )
+        catalog_changed.send(
+            sender=Product,
+            product_ids=list(Product.objects.filter(
+                slug__in=[product.slug for product in products],
+            ).values_list('pk', flat=True)),
+        )
@@ -0,0 +1,151 @@
+"""
+Оформление заказа из корзины пользователя.
+
+Заказ создаётся одной транзакцией с постоянным числом запросов при
+любом размере корзины: вставка Order, перенос строк корзины с текущими
+названиями и ценами продуктов одним INSERT ... SELECT, подсчёт суммы,
+списание резервов и очистка корзины. Повтор запроса с тем же ключом
+идемпотентности возвращает уже созданный заказ, в том числе если первый
+запрос ещё выполняется: второй дождётся его транзакции на уникальном
+индексе (user, idempotency_key). Одновременные оформления с разными
+ключами ждут друг друга на блокировке строки корзины (и корзины
+в хранилище, пока её строки переносятся в заказ), поэтому одна
+корзина не становится двумя заказами.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from shop.cart_store import get_cart_store
+from shop.models import (
+    Cart, Order, OrderLine, Product, ProductCart, Reservation,
+)
+from shop.stock import OutOfStock, reserve, user_owner
+
+
+class EmptyCart(Exception):
+    pass
+
+
+def checkout(user, idempotency_key):
+    """
+    Оформляет заказ из корзины пользователя и возвращает (заказ,
+    создан ли он этим вызовом). Бросает EmptyCart для пустой корзины
+    и OutOfStock со списком id продуктов, которых не хватает на складе.
+    """
+    if order := Order.objects.filter(
+        user=user, idempotency_key=idempotency_key,
+    ).first():
+        return order, False
+    store = get_cart_store()
+    # Корзина из кеша записывается в БД, чтобы заказ собрался из неё,
+    # и до её очистки не меняется.
+    with store.detached(user):
+        _reserve_cart(user)
+        using = router.db_for_write(Order)
+        try:
+            order = _create_order(using, user, idempotency_key)
+        except IntegrityError:
+            return Order.objects.get(
+                user=user, idempotency_key=idempotency_key,
+            ), False
+    order.refresh_from_db(fields=['total'])
+    return order, True
+
+
+def _create_order(using, user, idempotency_key):
+    """
+    Создаёт заказ из строк корзины и очищает её. Строка корзины
+    блокируется первой: одновременное оформление той же корзины
+    дождётся коммита и найдёт её пустой.
+    """
+    with transaction.atomic(using=using):
+        Cart.objects.using(using).select_for_update().get(user=user)
+        order = Order.objects.using(using).create(
+            user=user, idempotency_key=idempotency_key,
+        )
+        if not _copy_lines(using, order, user):
+            raise EmptyCart
+        Order.objects.using(using).filter(pk=order.pk).update(
+            total=Subquery(
+                OrderLine.objects.filter(order=OuterRef('pk')).values(
+                    'order',
+                ).annotate(
+                    total=Sum(F('price') * F('quantity')),
+                ).values('total'),
+            ),
+        )
+        lines = ProductCart.objects.using(using).filter(cart__user=user)
+        # Резервы становятся проданным количеством.
+        Reservation.objects.using(using).filter(
+            owner=user_owner(user),
+            product_id__in=lines.values('product_id'),
+        ).delete()
+        lines.delete()
+        return order
+
+
+def _reserve_cart(user):
+    """
+    Дозарезервировывает строки корзины, резервы которых истекли
+    и были сняты, и продлевает остальные, чтобы их не сняли
+    до конца оформления.
+    """
+    owner = user_owner(user)
+    Reservation.objects.filter(owner=owner).update(
+        expires_at=timezone.now() + timedelta(
+            seconds=settings.STOCK_RESERVATION_TIMEOUT,
+        ),
+    )
+    shortfall = ProductCart.objects.filter(
+        cart__user=user, product__stock__isnull=False,
+    ).annotate(reserved=Coalesce(Subquery(
+        Reservation.objects.filter(
+            owner=owner, product_id=OuterRef('product_id'),
+        ).values('quantity'),
+    ), 0)).filter(reserved__lt=F('quantity')).values_list(
+        'product_id', 'quantity',
+    )
+    missing = [
+        product_id for product_id, quantity in shortfall
+        if not reserve(owner, product_id, quantity, replace=True)
+    ]
+    if missing:
+        raise OutOfStock(missing)
+
+
+def _copy_lines(using, order, user):
+    """Копирует строки корзины в заказ, возвращает их число."""
+    connection = connections[using]
+    quote = connection.ops.quote_name
+
+    def table(model):
+        return quote(model._meta.db_table)
+
+    def column(model, name):
+        return quote(model._meta.get_field(name).column)
+
+    columns = ', '.join(
+        column(OrderLine, name)
+        for name in ('order', 'product', 'name', 'price', 'quantity')
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table(OrderLine)} ({columns}) "
+            f"SELECT %s, p.{column(Product, 'id')}, "
+            f"p.{column(Product, 'name')}, p.{column(Product, 'price')}, "
+            f"pc.{column(ProductCart, 'quantity')} "
+            f"FROM {table(ProductCart)} pc "
+            f"JOIN {table(Product)} p ON p.{column(Product, 'id')} "
+            f"= pc.{column(ProductCart, 'product')} "
+            f"JOIN {table(Cart)} c ON c.{column(Cart, 'id')} "
+            f"= pc.{column(ProductCart, 'cart')} "
+            f"WHERE c.{column(Cart, 'user')} = %s "
+            f"ORDER BY pc.{column(ProductCart, 'id')}",
+            [order.pk, user.pk],
+        )
+        return cursor.rowcount
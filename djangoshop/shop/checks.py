@@ -0,0 +1,101 @@
+"""
+Проверки настроек, которые зависят от общего для процессов кеша:
+версии каталога (shop.catalog_cache), корзин, гостевых корзин и ответов
+API в кеше.
+"""
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+
+from shop.catalog_cache import cache_is_shared, version_is_shared
+
+
+@register()
+def check_catalog_snapshot(app_configs, **kwargs):
+    """
+    Снимок каталога отдаётся, только пока его версия совпадает с версией
+    каталога воркера. Без общего кеша команда сборки и каждый воркер
+    видят свою версию, и снимок не используется никогда.
+    """
+    if not settings.CATALOG_SNAPSHOT_PATH or version_is_shared():
+        return []
+    return [Error(
+        "Снимок каталога (CATALOG_SNAPSHOT_PATH) требует общего для "
+        "процессов кеша: с кешем в памяти процесса версии каталога "
+        "у воркеров и build_catalog_snapshot не совпадают.",
+        hint="Укажите REDIS_URL или очистите CATALOG_SNAPSHOT_PATH.",
+        id='shop.E001',
+    )]
+
+
+@register()
+def check_product_count_mode(app_configs, **kwargs):
+    """
+    Число продуктов из кеша сбрасывается версией каталога: без общего
+    кеша остальные воркеры отдают старое число до COUNT_CACHE_TIMEOUT.
+    """
+    if settings.PRODUCT_COUNT_MODE != 'cached' or version_is_shared():
+        return []
+    return [Warning(
+        "PRODUCT_COUNT_MODE=cached без общего для процессов кеша: после "
+        "изменения каталога воркеры отдают устаревшее число продуктов "
+        "до COUNT_CACHE_TIMEOUT секунд.",
+        hint="Укажите REDIS_URL или PRODUCT_COUNT_MODE=exact.",
+        id='shop.W001',
+    )]
+
+
+@register()
+def check_cart_store(app_configs, **kwargs):
+    """
+    Корзины в кеше и их журнал должны быть общими для воркеров:
+    LocMemCache у каждого процесса свой и вытесняет записи сверх
+    MAX_ENTRIES, вместе с ними теряются изменения, не записанные в БД.
+    """
+    if (settings.CART_STORE != 'cache'
+            or cache_is_shared(settings.CART_CACHE_ALIAS)):
+        return []
+    return [Error(
+        "CART_STORE=cache требует общего для процессов кеша: в кеше "
+        "процесса корзины у воркеров расходятся, а вытесненные записи "
+        "журнала не попадают в БД.",
+        hint="Укажите REDIS_URL или CART_STORE=database.",
+        id='shop.E002',
+    )]
+
+
+@register()
+def check_guest_carts(app_configs, **kwargs):
+    """
+    Гостевые корзины есть только в кеше. В кеше процесса покупатель
+    видит разные корзины в разных воркерах, а LocMemCache вытесняет
+    их сверх MAX_ENTRIES.
+    """
+    if cache_is_shared(settings.CART_CACHE_ALIAS):
+        return []
+    return [Warning(
+        "Гостевые корзины хранятся в кеше процесса: с несколькими "
+        "воркерами корзина покупателя зависит от воркера и теряется "
+        "при вытеснении из кеша.",
+        hint="Укажите REDIS_URL.",
+        id='shop.W002',
+    )]
+
+
+@register()
+def check_response_cache(app_configs, **kwargs):
+    """
+    Блокировка пересчёта ответа и версия каталога, по которой ответ
+    устаревает, в кеше процесса действуют только внутри него: остальные
+    воркеры отдают старый каталог до RESPONSE_CACHE_TIMEOUT секунд.
+    """
+    if (not settings.RESPONSE_CACHE_TIMEOUT
+            or cache_is_shared(settings.RESPONSE_CACHE_ALIAS)
+            and version_is_shared()):
+        return []
+    return [Error(
+        "RESPONSE_CACHE_TIMEOUT требует общего для процессов кеша: "
+        "с кешем в памяти процесса изменение каталога в одном воркере "
+        "не сбрасывает ответы остальных.",
+        hint="Укажите REDIS_URL или RESPONSE_CACHE_TIMEOUT=0.",
+        id='shop.E003',
+    )]
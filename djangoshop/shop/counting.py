@@ -0,0 +1,96 @@
+"""
+Приблизительный подсчёт строк для больших таблиц.
+
+COUNT(*) по таблице с миллионами строк читает её целиком. Для запросов
+без фильтров число строк берётся из статистики БД, которую собирает
+ANALYZE: reltuples в PostgreSQL, sqlite_stat1 в SQLite. Если статистики
+нет или оценка меньше ESTIMATED_COUNT_THRESHOLD, строки считаются
+точно.
+Точное число строк каталога можно брать из кеша: ключ включает версию
+каталога, поэтому после его изменения число пересчитывается.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from shop.catalog_cache import catalog_version
+
+
+def table_estimate(model, using):
+    """Оценка числа строк таблицы модели или None, если её нет."""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class '
+                'WHERE oid = %s::regclass',
+                [model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # -1 у таблиц, по которым ещё не собиралась статистика.
+        return row[0] if row and row[0] >= 0 else None
+    if connection.vendor == 'sqlite':
+        return _sqlite_estimate(connection, model._meta.db_table)
+    return None
+
+
+def _sqlite_estimate(connection, table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' "
+            "AND name = 'sqlite_stat1'"
+        )
+        if cursor.fetchone() is None:
+            return None
+        cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [table])
+        # Первое число stat — строки таблицы или индекса; частичный
+        # индекс покрывает не все строки, поэтому берётся наибольшее.
+        counts = [int(stat.split()[0]) for stat, in cursor.fetchall()]
+    return max(counts, default=None)
+
+
+def is_unfiltered(queryset):
+    query = queryset.query
+    return not (
+        query.where or query.distinct or query.combinator
+        or query.is_sliced or query.group_by
+    )
+
+
+def estimated_count(queryset):
+    """
+    Число строк queryset: оценка по статистике для запросов без
+    фильтров по большим таблицам, иначе точный COUNT.
+    """
+    if is_unfiltered(queryset):
+        estimate = table_estimate(queryset.model, queryset.db)
+        if (estimate is not None
+                and estimate >= settings.ESTIMATED_COUNT_THRESHOLD):
+            return estimate
+    return queryset.count()
+
+
+def cached_count(queryset):
+    """
+    Точный COUNT queryset, сохранённый в кеше до изменения каталога
+    или на COUNT_CACHE_TIMEOUT секунд.
+    """
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.md5(
+        f'{queryset.db}:{sql}:{params!r}'.encode(), usedforsecurity=False,
+    ).hexdigest()
+    return cache.get_or_set(
+        f'count:{catalog_version()}:{digest}', queryset.count,
+        timeout=settings.COUNT_CACHE_TIMEOUT,
+    )
+
+
+class EstimatedCountPaginator(Paginator):
+
+    @cached_property
+    def count(self):
+        return estimated_count(self.object_list)
@@ -0,0 +1,116 @@
+"""
+Маршрутизация чтения каталога на реплики БД.
+
+Чтение категорий, подкатегорий, продуктов и их изображений уходит
+на одну из реплик из settings.DATABASE_REPLICAS, выбранную по весам
+или по кругу. После любой записи запрос до конца закрепляется
+за основной БД, чтобы пользователь сразу видел свои изменения.
+Недоступная реплика исключается из выбора на
+DATABASE_REPLICA_RETRY_SECONDS, тогда чтение идёт в основную БД.
+"""
+import itertools
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import DatabaseError
+
+
+CATALOG_MODELS = {
+    ('shop', 'category'),
+    ('shop', 'subcategory'),
+    ('shop', 'product'),
+    ('shop', 'productimage'),
+    ('shop', 'relatedproduct'),
+    ('shop', 'popularproduct'),
+}
+
+_pinned_to_primary = ContextVar('pinned_to_primary', default=False)
+
+
+def pin_to_primary():
+    _pinned_to_primary.set(True)
+
+
+def reset_pinning():
+    return _pinned_to_primary.set(False)
+
+
+def restore_pinning(token):
+    _pinned_to_primary.reset(token)
+
+
+class ReplicaSelector:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._down_until = {}
+        self._cycle = None
+        self._cycle_source = None
+
+    def choose(self):
+        replicas = [
+            (alias, weight) for alias, weight in settings.DATABASE_REPLICAS
+            if self._down_until.get(alias, 0) <= time.monotonic()
+        ]
+        while replicas:
+            alias = self._pick(replicas)
+            if self._is_available(alias):
+                return alias
+            replicas = [item for item in replicas if item[0] != alias]
+        return None
+
+    def mark_down(self, alias):
+        with self._lock:
+            self._down_until[alias] = (
+                time.monotonic() + settings.DATABASE_REPLICA_RETRY_SECONDS
+            )
+
+    def _pick(self, replicas):
+        if settings.DATABASE_REPLICA_STRATEGY == 'round_robin':
+            with self._lock:
+                if self._cycle_source != replicas:
+                    self._cycle_source = replicas
+                    self._cycle = itertools.cycle([
+                        alias for alias, weight in replicas
+                        for _ in range(weight)
+                    ])
+                return next(self._cycle)
+        aliases, weights = zip(*replicas)
+        return random.choices(aliases, weights=weights)[0]
+
+    def _is_available(self, alias):
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            self.mark_down(alias)
+            return False
+        return True
+
+
+selector = ReplicaSelector()
+
+
+class CatalogReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        meta = model._meta
+        if (meta.app_label, meta.model_name) not in CATALOG_MODELS:
+            return None
+        if _pinned_to_primary.get():
+            return DEFAULT_DB_ALIAS
+        return selector.choose()
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики получают схему через репликацию основной БД.
+        return db not in dict(settings.DATABASE_REPLICAS)
@@ -0,0 +1,94 @@
+"""
+Сброс микрокеша каталога в nginx (gateway/nginx.conf).
+
+nginx кеширует анонимные GET-запросы списков каталога и карточек
+категорий и подкатегорий на несколько секунд. Карточки продуктов
+не кешируются: их просмотры считает Django (shop.popularity).
+Open-source nginx не удаляет записи по запросу, поэтому сброс — это
+GET того же адреса с секретом CACHE_PURGE_TOKEN
+в заголовке CACHE_PURGE_HEADER: такой запрос идёт мимо кеша, и свежий
+ответ сохраняется на место старого. После изменения каталога
+обновляются первые страницы списков и карточки изменённых категорий,
+страницы с параметрами устаревают сами за время жизни записи.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import URLError
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+API_PREFIXES = ('/api/v1/', '/api/v1/async/')
+CATALOG_LISTS = ('categories', 'subcategories', 'products')
+# Кешируемые карточки для каждого префикса: карточки продуктов nginx
+# не кеширует, а других асинхронное API не отдаёт.
+CATALOG_DETAILS = {
+    '/api/v1/': ('categories', 'subcategories'),
+    '/api/v1/async/': (),
+}
+
+_executor = None
+
+
+def catalog_paths(objects=()):
+    """
+    Адреса кешируемых ответов, которые меняются вместе с каталогом
+    и объектами objects в виде пар (список, id).
+    """
+    return [
+        f'{prefix}{name}/'
+        for prefix in API_PREFIXES for name in CATALOG_LISTS
+    ] + [
+        f'{prefix}{name}/{pk}/'
+        for prefix in API_PREFIXES for name, pk in objects
+        if name in CATALOG_DETAILS[prefix]
+    ]
+
+
+def purge(paths):
+    """
+    Обновляет в кеше nginx ответы по адресам paths. Возвращает число
+    обновлённых адресов, ошибки только записываются в лог: запись
+    в любом случае устареет за время жизни микрокеша.
+    """
+    headers = {
+        settings.CACHE_PURGE_HEADER: settings.CACHE_PURGE_TOKEN,
+        'Accept': 'application/json',
+    }
+    if settings.CACHE_PURGE_HOST:
+        headers['Host'] = settings.CACHE_PURGE_HOST
+    purged = 0
+    for path in paths:
+        request = Request(settings.CACHE_PURGE_URL + path, headers=headers)
+        try:
+            with urlopen(request, timeout=settings.CACHE_PURGE_TIMEOUT):
+                purged += 1
+        except (URLError, OSError) as error:
+            logger.warning("Не удалось сбросить кеш %s: %s", path, error)
+    return purged
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='cache-purge',
+        )
+    return _executor
+
+
+def schedule_purge(paths):
+    """
+    Ставит сброс в фоновый поток, чтобы запрос, изменивший каталог,
+    не ждал ответов nginx. Без CACHE_PURGE_URL и CACHE_PURGE_TOKEN
+    ничего не делает.
+    """
+    if not (settings.CACHE_PURGE_URL and settings.CACHE_PURGE_TOKEN):
+        return
+    if settings.CACHE_PURGE_ASYNC:
+        _get_executor().submit(purge, paths)
+    else:
+        purge(paths)
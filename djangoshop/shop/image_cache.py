@@ -0,0 +1,221 @@
+"""
+Дисковый кэш копий изображений, создаваемых по запросу.
+
+Файлы лежат в MEDIA_ROOT/cache/<вид>/<id>/w<ширина>.<расширение>,
+то есть по тому же пути, что и URL /media/cache/..., поэтому после
+первого запроса nginx отдаёт их сам. Общий размер кэша ограничен:
+при превышении удаляются давно не использованные файлы (приближённый
+LRU по времени последнего доступа). Чтения nginx ядро отмечает в atime
+при монтировании с relatime (по умолчанию в Linux) не чаще раза
+в сутки, чего достаточно для кэша, живущего днями, а обращения через
+Django отмечаются явно. С noatime вытеснение сводится к порядку
+создания файлов. Размер хранится
+в файле .size, общем для всех процессов gunicorn, и меняется под
+файловой блокировкой. Одновременные запросы одной копии создают её
+только один раз: внутри процесса их разводит блокировка потоков, между
+процессами — файловая блокировка.
+"""
+import fcntl
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+LOCKS_DIR = '.locks'
+EVICT_LOCK = '.evict.lock'
+SIZE_FILE = '.size'
+
+
+class ImageCache:
+
+    def __init__(self, root, max_bytes, low_watermark=0.9):
+        self.root = str(root)
+        self.max_bytes = max_bytes
+        self.low_watermark = low_watermark
+        self._key_locks = {}
+        self._key_locks_guard = threading.Lock()
+
+    def path_for(self, kind, pk, width, extension):
+        return os.path.join(
+            self.root, kind, str(pk), f'w{width}.{extension}'
+        )
+
+    def get_or_create(self, path, render):
+        """
+        Возвращает путь к файлу кэша, при отсутствии файла создаёт его
+        из байтов, которые вернёт render().
+        """
+        if self._touch(path):
+            return path
+        with self._thread_lock(path), self._file_lock(path):
+            if self._touch(path):
+                return path
+            data = render()
+            self._write(path, data)
+        self._account(len(data))
+        return path
+
+    def invalidate(self, kind, pk):
+        directory = os.path.join(self.root, kind, str(pk))
+        with self._size_lock():
+            removed = self._disk_size(directory)
+            shutil.rmtree(directory, ignore_errors=True)
+            stored = self._stored_size()
+            if removed and stored is not None:
+                self._write_size(max(stored - removed, 0))
+
+    def evict(self):
+        """
+        Удаляет самые давно использованные файлы, пока размер кэша
+        не опустится до low_watermark от max_bytes.
+        """
+        with self._size_lock():
+            return self._evict()
+
+    def size(self):
+        with self._size_lock():
+            stored = self._stored_size()
+            if stored is None:
+                stored = self._disk_size()
+                self._write_size(stored)
+            return stored
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for path, stat in self._scan():
+            entries.append((max(stat.st_atime, stat.st_mtime),
+                            stat.st_size, path))
+            total += stat.st_size
+        target = self.max_bytes * self.low_watermark
+        entries.sort()
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._write_size(total)
+        return total
+
+    def _stored_size(self):
+        """
+        Размер кэша из общего файла или None, если файла нет (первый
+        запуск, файл удалён вручную) и размер нужно считать по диску.
+        """
+        try:
+            with open(os.path.join(self.root, SIZE_FILE)) as file:
+                return int(file.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _disk_size(self, root=None):
+        return sum(stat.st_size for _, stat in self._scan(root))
+
+    def _write_size(self, size):
+        self._write(os.path.join(self.root, SIZE_FILE), str(size).encode())
+
+    def _scan(self, root=None):
+        root = root or self.root
+        for directory, dirnames, filenames in os.walk(root):
+            if directory == self.root and LOCKS_DIR in dirnames:
+                dirnames.remove(LOCKS_DIR)
+            for filename in filenames:
+                if filename.startswith('.'):
+                    continue
+                path = os.path.join(directory, filename)
+                try:
+                    yield path, os.stat(path)
+                except FileNotFoundError:
+                    continue
+
+    def _touch(self, path):
+        """
+        Отмечает обращение к файлу в atime независимо от параметров
+        монтирования. mtime не меняется: по нему nginx отдаёт
+        Last-Modified.
+        """
+        try:
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _write(self, path, data):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix='.')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(data)
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def _account(self, size):
+        with self._size_lock():
+            total = self._stored_size()
+            # Подсчёт по диску уже включает только что записанный файл.
+            total = self._disk_size() if total is None else total + size
+            if total > self.max_bytes:
+                self._evict()
+            else:
+                self._write_size(total)
+
+    def _size_lock(self):
+        return self._lock_file(os.path.join(self.root, EVICT_LOCK))
+
+    @contextmanager
+    def _thread_lock(self, path):
+        with self._key_locks_guard:
+            lock, users = self._key_locks.get(path, (threading.Lock(), 0))
+            self._key_locks[path] = (lock, users + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._key_locks_guard:
+                lock, users = self._key_locks[path]
+                if users == 1:
+                    del self._key_locks[path]
+                else:
+                    self._key_locks[path] = (lock, users - 1)
+
+    def _file_lock(self, path):
+        digest = hashlib.sha1(path.encode()).hexdigest()
+        return self._lock_file(
+            os.path.join(self.root, LOCKS_DIR, digest[:2], digest)
+        )
+
+    @contextmanager
+    def _lock_file(self, lock_path):
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        with open(lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_image_cache():
+    root = os.path.join(settings.MEDIA_ROOT, settings.IMAGE_CACHE_DIR)
+    key = (root, settings.IMAGE_CACHE_MAX_BYTES)
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = ImageCache(root, settings.IMAGE_CACHE_MAX_BYTES)
+        return _caches[key]
@@ -0,0 +1,137 @@
+"""
+Уменьшенные копии загруженных изображений.
+
+Для каждого изображения категорий, подкатегорий и продуктов рядом
+с оригиналом сохраняются копии заданной ширины в JPEG и WebP:
+categories/banner.png -> categories/banner_w200.jpg,
+categories/banner_w200.webp и т.д. Имена копий вычисляются из имени
+оригинала, поэтому сериализаторы отдают их ссылки без обращения к БД.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+
+logger = logging.getLogger(__name__)
+
+VARIANT_FORMATS = {
+    'jpg': 'JPEG',
+    'webp': 'WEBP',
+}
+
+_executor = None
+
+
+def variant_name(name, width, extension):
+    stem, _ = os.path.splitext(name)
+    return f'{stem}_w{width}.{extension}'
+
+
+def variant_names(name):
+    """
+    Имена всех копий изображения в виде {ширина: {расширение: имя}}.
+    """
+    return {
+        width: {
+            extension: variant_name(name, width, extension)
+            for extension in VARIANT_FORMATS
+        }
+        for width in settings.IMAGE_VARIANT_WIDTHS
+    }
+
+
+def generate_variants(name, storage=default_storage):
+    """
+    Создаёт недостающие копии изображения. Изображения уже меньше
+    нужной ширины не увеличиваются, но копия всё равно сохраняется,
+    чтобы ссылки из сериализаторов всегда вели на существующий файл.
+    """
+    missing = [
+        (width, extension, variant)
+        for width, variants in variant_names(name).items()
+        for extension, variant in variants.items()
+        if not storage.exists(variant)
+    ]
+    if not missing:
+        return []
+    with storage.open(name, 'rb') as file:
+        original = Image.open(file)
+        original.load()
+    created = []
+    for width, extension, variant in missing:
+        content = ContentFile(render_variant(original, width, extension))
+        created.append(_replace(storage, variant, content))
+    return created
+
+
+def _replace(storage, name, content):
+    """
+    Сохраняет копию под её вычисленным именем. Копия, созданная
+    одновременно другим процессом, заменяется: иначе хранилище
+    сохранило бы вторую с суффиксом, на которую никто не ссылается.
+    """
+    storage.delete(name)
+    saved = storage.save(name, content)
+    if saved != name:
+        storage.delete(saved)
+    return name
+
+
+def render_variant(original, width, extension):
+    """
+    Возвращает байты копии изображения шириной не больше width
+    в формате по расширению.
+    """
+    image = original.copy()
+    image.thumbnail((width, image.height), Image.LANCZOS)
+    content = BytesIO()
+    _convert(image, extension).save(
+        content,
+        VARIANT_FORMATS[extension],
+        quality=settings.IMAGE_VARIANT_QUALITY,
+    )
+    return content.getvalue()
+
+
+def _convert(image, extension):
+    if extension == 'jpg':
+        return image.convert('RGB')
+    if image.mode not in ('RGB', 'RGBA'):
+        return image.convert('RGBA')
+    return image
+
+
+def _generate_safely(name):
+    try:
+        generate_variants(name)
+    except Exception:
+        logger.exception("Не удалось создать копии изображения %s", name)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_VARIANT_WORKERS,
+            thread_name_prefix='image-variants',
+        )
+    return _executor
+
+
+def schedule_variants(name):
+    """
+    Ставит создание копий в фоновый пул потоков, чтобы сохранение
+    в админке не ждало обработки изображения.
+    """
+    if not name:
+        return
+    if settings.IMAGE_VARIANTS_ASYNC:
+        _get_executor().submit(_generate_safely, name)
+    else:
+        _generate_safely(name)
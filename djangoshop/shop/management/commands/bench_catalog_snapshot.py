@@ -0,0 +1,179 @@
+import mmap
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from api.snapshot import CatalogSnapshot, SnapshotRequest, build_snapshot
+from api.views.shop_views import ProductViewSet
+from shop.management.commands.bench_http import percentile
+from shop.models import Product
+
+
+SMAPS_ROLLUP = '/proc/self/smaps_rollup'
+
+
+def memory_usage():
+    """Rss, Pss и частная память процесса в килобайтах."""
+    values = {}
+    with open(SMAPS_ROLLUP) as file:
+        for line in file:
+            name, _, rest = line.partition(':')
+            if rest.strip().endswith('kB'):
+                values[name] = int(rest.split()[0])
+    return {
+        'rss': values['Rss'],
+        'pss': values['Pss'],
+        'private': values['Private_Clean'] + values['Private_Dirty'],
+    }
+
+
+def load_from_orm():
+    """Каталог продуктов в памяти процесса, как в локальном кеше."""
+    renderer = JSONRenderer()
+    context = {'request': SnapshotRequest()}
+    queryset = Product.objects.select_related(
+        'category', 'subcategory__category',
+    ).prefetch_related('images').order_by('pk')
+    return {
+        product.pk: renderer.render(
+            ProductViewSet.serializer_class(product, context=context).data
+        )
+        for product in queryset.iterator(chunk_size=1000)
+    }
+
+
+def load_from_snapshot(path):
+    """Снимок в памяти процесса: все его страницы прочитаны."""
+    snapshot = CatalogSnapshot(path)
+    for offset in range(0, len(snapshot.mmap), mmap.PAGESIZE):
+        snapshot.mmap[offset]
+    return snapshot
+
+
+def run_worker(mode, path, barrier, results):
+    """Процесс, имитирующий воркер gunicorn с каталогом в памяти."""
+    connections['default'].close()
+    # Pss делит общие страницы между процессами, поэтому память
+    # измеряется, когда запущены все воркеры и когда каталог загружен
+    # во всех воркерах.
+    barrier.wait()
+    before = memory_usage()
+    catalog = load_from_orm() if mode == 'orm' else load_from_snapshot(path)
+    connections['default'].close()
+    barrier.wait()
+    after = memory_usage()
+    results.put({name: after[name] - before[name] for name in after})
+    barrier.wait()
+    del catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает чтение карточек продуктов через ORM и из снимка "
+        "каталога (api.snapshot): задержку и число запросов к БД на "
+        "запрос, а также память, которую занимает каталог в нескольких "
+        "воркерах."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--processes', type=int, default=4)
+
+    def handle(self, *args, **options):
+        if min(options['requests'], options['processes']) < 1:
+            raise CommandError("Параметры должны быть положительными.")
+        if not os.path.exists(SMAPS_ROLLUP):
+            raise CommandError(f"Нет {SMAPS_ROLLUP}, нужен Linux.")
+        product_ids = list(
+            Product.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        if not product_ids:
+            raise CommandError(
+                "Каталог пуст, загрузите его командой import_catalog."
+            )
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'catalog.snapshot')
+            started = time.monotonic()
+            build_snapshot(path)
+            self.stdout.write(
+                f"Продуктов: {len(product_ids)}, снимок "
+                f"{os.path.getsize(path) // 1024} КБ собран за "
+                f"{time.monotonic() - started:.2f} с."
+            )
+            self.stdout.write(
+                f"{'источник':<9} {'p50, мс':>8} {'p95, мс':>8} "
+                f"{'запросов к БД':>14}"
+            )
+            for mode, snapshot_path in (('orm', ''), ('snapshot', path)):
+                with override_settings(CATALOG_SNAPSHOT_PATH=snapshot_path,
+                                       RESPONSE_CACHE_TIMEOUT=0,
+                                       ALLOWED_HOSTS=['testserver']):
+                    result = self._measure_latency(product_ids, options)
+                self.stdout.write(
+                    f"{mode:<9} {result['p50'] * 1000:>8.2f} "
+                    f"{result['p95'] * 1000:>8.2f} "
+                    f"{result['queries']:>14.1f}"
+                )
+            self.stdout.write(
+                f"{'источник':<9} {'Rss, КБ':>10} {'Pss, КБ':>10} "
+                f"{'частная, КБ':>12}  (на воркер, "
+                f"воркеров: {options['processes']})"
+            )
+            for mode in ('orm', 'snapshot'):
+                result = self._measure_memory(mode, path, options)
+                self.stdout.write(
+                    f"{mode:<9} {result['rss']:>10.0f} "
+                    f"{result['pss']:>10.0f} {result['private']:>12.0f}"
+                )
+
+    def _measure_latency(self, product_ids, options):
+        view = ProductViewSet.as_view({'get': 'retrieve'})
+        factory = APIRequestFactory()
+        latencies = []
+        with CaptureQueriesContext(connection) as queries:
+            for step in range(options['requests']):
+                pk = product_ids[step % len(product_ids)]
+                request = factory.get(f'/api/v1/products/{pk}/')
+                started = time.monotonic()
+                response = view(request, pk=pk)
+                if hasattr(response, 'render'):
+                    response.render()
+                latencies.append(time.monotonic() - started)
+                if response.status_code != 200:
+                    raise CommandError(
+                        f"Продукт {pk}: ответ {response.status_code}."
+                    )
+        latencies.sort()
+        return {
+            'p50': percentile(latencies, 0.50),
+            'p95': percentile(latencies, 0.95),
+            'queries': len(queries) / options['requests'],
+        }
+
+    def _measure_memory(self, mode, path, options):
+        connections['default'].close()
+        context = multiprocessing.get_context('fork')
+        barrier = context.Barrier(options['processes'])
+        results = context.Queue()
+        workers = [
+            context.Process(
+                target=run_worker, args=(mode, path, barrier, results),
+            )
+            for _ in range(options['processes'])
+        ]
+        for worker in workers:
+            worker.start()
+        collected = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        return {
+            name: sum(result[name] for result in collected) / len(collected)
+            for name in collected[0]
+        }
@@ -0,0 +1,76 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает число новых подключений к БД и время ответа на "
+        "запрос без постоянных подключений (CONN_MAX_AGE=0) и с текущими "
+        "настройками DATABASES."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='/api/v1/products/')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError("Число запросов должно быть положительным.")
+        connection = connections[options['database']]
+        configured = connection.settings_dict['CONN_MAX_AGE']
+        client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+        self.stdout.write(
+            f"{'CONN_MAX_AGE':<14} {'подключений/запрос':>19} "
+            f"{'мс/запрос':>10}"
+        )
+        try:
+            for max_age in (0, configured):
+                connects, elapsed = self._measure(
+                    client, connection, max_age,
+                    options['url'], options['requests'],
+                )
+                self.stdout.write(
+                    f"{str(max_age):<14} "
+                    f"{connects / options['requests']:>19.2f} "
+                    f"{elapsed * 1000 / options['requests']:>10.2f}"
+                )
+        finally:
+            connection.settings_dict['CONN_MAX_AGE'] = configured
+            connection.close()
+
+    def _measure(self, client, connection, max_age, url, requests):
+        connection.close()
+        connection.settings_dict['CONN_MAX_AGE'] = max_age
+        alias = connection.alias
+        connects = 0
+
+        def count(sender, connection, **kwargs):
+            # Реплики (shop.db_router) подключаются отдельно
+            # и к пулу проверяемой базы не относятся.
+            nonlocal connects
+            if connection.alias == alias:
+                connects += 1
+
+        connection_created.connect(count, weak=False)
+        try:
+            started = time.monotonic()
+            for _ in range(requests):
+                # Тестовый клиент отключает закрытие подключений
+                # по сигналам запроса, вызываем его как WSGI-обработчик.
+                close_old_connections()
+                response = client.get(url)
+                close_old_connections()
+                if response.status_code >= 400:
+                    raise CommandError(
+                        f"{url} вернул {response.status_code}."
+                    )
+            elapsed = time.monotonic() - started
+        finally:
+            connection_created.disconnect(count)
+        return connects, elapsed
@@ -0,0 +1,145 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(values, share):
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(len(values) * share))
+    return values[index]
+
+
+class HttpClient:
+    """
+    Минимальный HTTP/1.1-клиент на asyncio с keep-alive: один объект
+    на виртуального пользователя, чтобы нагрузка не упиралась
+    в потоки самого генератора.
+    """
+
+    def __init__(self, url, headers):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        path = parts.path or '/'
+        if parts.query:
+            path = f'{path}?{parts.query}'
+        lines = [f'GET {path} HTTP/1.1', f'Host: {parts.netloc}']
+        lines.extend(f'{name}: {value}' for name, value in headers)
+        self.request = ('\r\n'.join(lines) + '\r\n\r\n').encode()
+        self.reader = self.writer = None
+
+    async def get(self):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+        self.writer.write(self.request)
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Соединение закрыто сервером.")
+        headers = {}
+        while (line := await self.reader.readline()) not in (b'\r\n', b''):
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if headers.get('transfer-encoding') == 'chunked':
+            while size := int((await self.reader.readline()).strip(), 16):
+                await self.reader.readexactly(size + 2)
+            await self.reader.readline()
+        else:
+            await self.reader.readexactly(
+                int(headers.get('content-length', 0))
+            )
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return int(status_line.split()[1])
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def run_load(url, concurrency, duration, headers):
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def user():
+        nonlocal errors
+        client = HttpClient(url, headers)
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            try:
+                status = await client.get()
+            except (OSError, ConnectionError, ValueError,
+                    asyncio.IncompleteReadError):
+                errors += 1
+                client.close()
+                continue
+            if status >= 400:
+                errors += 1
+            latencies.append(time.monotonic() - started)
+        client.close()
+
+    started = time.monotonic()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    elapsed = time.monotonic() - started
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочное сравнение синхронного (WSGI) и асинхронного (ASGI) "
+        "API: пропускная способность и хвосты задержек при заданном "
+        "числе одновременных клиентов. Серверы нужно запустить заранее, "
+        "например gunicorn djangoshop.wsgi и "
+        "gunicorn -k uvicorn.workers.UvicornWorker djangoshop.asgi."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sync-url',
+            default='http://127.0.0.1:8000/api/v1/products/',
+        )
+        parser.add_argument(
+            '--async-url',
+            default='http://127.0.0.1:8001/api/v1/async/products/',
+        )
+        parser.add_argument('--concurrency', type=int, default=200)
+        parser.add_argument('--duration', type=float, default=15.0)
+        parser.add_argument(
+            '--token', help="Токен для эндпоинтов корзины.",
+        )
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError("Число клиентов должно быть положительным.")
+        headers = []
+        if options['token']:
+            headers.append(('Authorization', f"Token {options['token']}"))
+        self.stdout.write(
+            f"{'режим':<6} {'запросов':>9} {'ошибок':>7} {'rps':>9} "
+            f"{'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9}"
+        )
+        for mode in ('sync', 'async'):
+            result = asyncio.run(run_load(
+                options[f'{mode}_url'], options['concurrency'],
+                options['duration'], headers,
+            ))
+            self.stdout.write(
+                f"{mode:<6} {result['requests']:>9} {result['errors']:>7} "
+                f"{result['rps']:>9.1f} {result['p50'] * 1000:>9.1f} "
+                f"{result['p95'] * 1000:>9.1f} {result['p99'] * 1000:>9.1f}"
+            )
@@ -0,0 +1,206 @@
+import heapq
+import itertools
+import os
+import random
+import resource
+import sqlite3
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIRequestFactory
+
+from api.views.shop_views import ProductViewSet
+from shop.management.commands.bench_http import percentile
+from shop.management.commands.bench_sqlite_writes import use_database
+from shop.models import Product, ProductCart, RelatedProduct
+from shop.related import build_related
+
+
+INSERT_BATCH_SIZE = 50000
+
+
+def peak_memory():
+    """Пиковый размер резидентной памяти процесса в мегабайтах."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def python_related(top, max_cart_size):
+    """
+    Те же рекомендации наивно: строки корзин читаются в Python, пары
+    считаются двойным циклом по каждой корзине.
+    """
+    pairs = Counter()
+    lines = ProductCart.objects.order_by('cart_id').values_list(
+        'cart_id', 'product_id',
+    ).iterator(chunk_size=INSERT_BATCH_SIZE)
+    for _, cart in itertools.groupby(lines, key=lambda line: line[0]):
+        products = [product_id for _, product_id in cart]
+        if len(products) > max_cart_size:
+            continue
+        for first in products:
+            for second in products:
+                if first != second:
+                    pairs[first, second] += 1
+    related = defaultdict(list)
+    for (first, second), score in pairs.items():
+        related[first].append((-score, second))
+    return {
+        product_id: heapq.nsmallest(top, candidates)
+        for product_id, candidates in related.items()
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает сборку рекомендаций «вместе с этим покупают» "
+        "разреженными матрицами (shop.related) с подсчётом пар двойным "
+        "циклом Python на синтетических корзинах в копии SQLite-базы "
+        "и измеряет чтение рекомендаций продукта через API."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=1_000_000)
+        parser.add_argument('--products', type=int, default=10_000)
+        parser.add_argument(
+            '--cart-size', type=int, default=10,
+            help="Средний размер корзины.",
+        )
+        parser.add_argument('--top', type=int, default=10)
+        parser.add_argument('--max-cart-size', type=int, default=50)
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument(
+            '--skip-python', action='store_true',
+            help="Не запускать сравнение с подсчётом в Python.",
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        connection = connections['default']
+        if connection.vendor != 'sqlite':
+            raise CommandError("Основная БД должна быть SQLite.")
+        if min(options['lines'], options['products'], options['cart_size'],
+               options['top'], options['requests']) < 1:
+            raise CommandError("Параметры должны быть положительными.")
+        source = connection.settings_dict['NAME']
+        configured = connection.settings_dict['OPTIONS']
+        if not os.path.exists(source):
+            raise CommandError(
+                "База не найдена, выполните python manage.py migrate."
+            )
+        with tempfile.TemporaryDirectory() as directory:
+            name = os.path.join(directory, 'related.sqlite3')
+            connection.close()
+            with sqlite3.connect(source) as src, \
+                    sqlite3.connect(name) as dst:
+                src.backup(dst)
+            src.close()
+            dst.close()
+            use_database(name, configured)
+            try:
+                self._run(options)
+            finally:
+                use_database(source, configured)
+
+    def _run(self, options):
+        started = time.monotonic()
+        product_ids, carts = self._generate(options)
+        self.stdout.write(
+            f"Строк корзин: {options['lines']}, корзин: {carts}, "
+            f"продуктов: {len(product_ids)}, данные созданы за "
+            f"{time.monotonic() - started:.1f} с."
+        )
+        # Пик памяти только растёт, поэтому сборка SciPy измеряется первой.
+        memory = peak_memory()
+        started = time.monotonic()
+        saved = build_related(options['top'], options['max_cart_size'])
+        self.stdout.write(
+            f"SciPy: пар сохранено {saved} за "
+            f"{time.monotonic() - started:.2f} с, рост пика памяти "
+            f"{peak_memory() - memory:.0f} МБ."
+        )
+        if not options['skip_python']:
+            memory = peak_memory()
+            started = time.monotonic()
+            related = python_related(options['top'], options['max_cart_size'])
+            self.stdout.write(
+                f"Python: пар {sum(map(len, related.values()))} за "
+                f"{time.monotonic() - started:.2f} с, рост пика памяти "
+                f"{peak_memory() - memory:.0f} МБ."
+            )
+        self._measure_reads(product_ids, options)
+
+    def _generate(self, options):
+        """Продукты и корзины с популярностью продуктов по закону Ципфа."""
+        rng = random.Random(options['seed'])
+        connection = connections['default']
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {RelatedProduct._meta.db_table}"
+            )
+            cursor.execute(f"DELETE FROM {ProductCart._meta.db_table}")
+        # Строки корзин ссылаются на несуществующие корзины: для подсчёта
+        # пар нужен только id корзины.
+        connection.disable_constraint_checking()
+        Product.objects.bulk_create(
+            [
+                Product(name=f'bench {number}',
+                        slug=f'bench-related-{number}', price=1)
+                for number in range(options['products'])
+            ],
+            batch_size=INSERT_BATCH_SIZE,
+        )
+        product_ids = list(Product.objects.filter(
+            slug__startswith='bench-related-',
+        ).values_list('pk', flat=True))
+        weights = list(itertools.accumulate(
+            1 / rank for rank in range(1, len(product_ids) + 1)
+        ))
+        insert = (
+            f"INSERT INTO {ProductCart._meta.db_table} "
+            f"(cart_id, product_id, quantity) VALUES (%s, %s, 1)"
+        )
+        batch = []
+        written = 0
+        cart_id = 0
+        with connection.cursor() as cursor:
+            while written < options['lines']:
+                cart_id += 1
+                size = min(
+                    rng.randint(1, 2 * options['cart_size'] - 1),
+                    options['lines'] - written,
+                )
+                products = set(rng.choices(
+                    product_ids, cum_weights=weights, k=size,
+                ))
+                batch.extend((cart_id, pk) for pk in products)
+                written += len(products)
+                if len(batch) >= INSERT_BATCH_SIZE:
+                    cursor.executemany(insert, batch)
+                    batch = []
+            cursor.executemany(insert, batch)
+        return product_ids, cart_id
+
+    def _measure_reads(self, product_ids, options):
+        view = ProductViewSet.as_view({'get': 'related'})
+        factory = APIRequestFactory()
+        latencies = []
+        with override_settings(ALLOWED_HOSTS=['testserver']), \
+                CaptureQueriesContext(connections['default']) as queries:
+            for step in range(options['requests']):
+                pk = product_ids[step % len(product_ids)]
+                request = factory.get(f'/api/v1/products/{pk}/related/')
+                started = time.monotonic()
+                response = view(request, pk=pk)
+                response.render()
+                latencies.append(time.monotonic() - started)
+        latencies.sort()
+        p50 = percentile(latencies, 0.50) * 1000
+        p95 = percentile(latencies, 0.95) * 1000
+        self.stdout.write(
+            f"Чтение рекомендаций: p50 {p50:.2f} мс, p95 {p95:.2f} мс, "
+            f"запросов к БД: {len(queries) / options['requests']:.1f}."
+        )
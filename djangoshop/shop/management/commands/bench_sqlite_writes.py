@@ -0,0 +1,183 @@
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Sum
+from django.db.utils import DatabaseError
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.views.shop_views import ProductViewSet
+from shop.management.commands.bench_http import percentile
+from shop.models import Category, Product, ProductCart
+from users.models import User
+
+
+# Стандартное поведение Django: журнал отката, отложенные транзакции
+# и таймаут ожидания блокировки модуля sqlite3.
+DEFAULT_PROFILE = {
+    'timeout': 5,
+    'init_command': 'PRAGMA journal_mode=DELETE;',
+}
+BENCH_USERNAME = 'bench_sqlite_writes_{}'
+
+
+def use_database(name, options):
+    connection = connections['default']
+    connection.close()
+    connection.settings_dict.update(NAME=name, OPTIONS=options)
+
+
+def run_worker(name, options, user_id, product_ids, duration, results):
+    """Процесс, имитирующий воркер gunicorn, добавляющий в корзину."""
+    use_database(name, options)
+    view = ProductViewSet.as_view({'post': 'add_to_cart'})
+    factory = APIRequestFactory()
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+    step = 0
+    try:
+        while time.monotonic() < deadline:
+            pk = product_ids[step % len(product_ids)]
+            step += 1
+            request = factory.post(
+                f'/api/v1/products/{pk}/cart/', {'quantity': 1},
+                format='json',
+            )
+            started = time.monotonic()
+            try:
+                # Пользователь загружается на каждый запрос, как при
+                # аутентификации по токену.
+                force_authenticate(request, User.objects.get(pk=user_id))
+                response = view(request, pk=pk)
+            except DatabaseError:
+                errors += 1
+                continue
+            if response.status_code != 201:
+                errors += 1
+                continue
+            latencies.append(time.monotonic() - started)
+    finally:
+        connections['default'].close()
+        results.put((latencies, errors))
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает запись в корзину из нескольких процессов на копии "
+        "SQLite-базы со стандартными настройками Django и с профилем "
+        "из settings.DATABASES: запросы в секунду, ошибки "
+        "\"database is locked\", задержки и потерянные обновления."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--duration', type=float, default=10.0)
+        parser.add_argument('--products', type=int, default=5)
+        parser.add_argument(
+            '--users', type=int, default=1,
+            help="Число пользователей, между которыми делятся процессы.",
+        )
+
+    def handle(self, *args, **options):
+        connection = connections['default']
+        if connection.vendor != 'sqlite':
+            raise CommandError("Основная БД должна быть SQLite.")
+        if min(options['processes'], options['products'],
+               options['users']) < 1:
+            raise CommandError("Параметры должны быть положительными.")
+        source = connection.settings_dict['NAME']
+        configured = connection.settings_dict['OPTIONS']
+        profiles = (('default', DEFAULT_PROFILE), ('tuned', configured))
+        self.stdout.write(
+            f"{'профиль':<8} {'успешно':>8} {'ошибок':>7} {'rps':>8} "
+            f"{'p50, мс':>8} {'p99, мс':>8} {'потеряно':>9}"
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            try:
+                for profile, profile_options in profiles:
+                    name = os.path.join(directory, f'{profile}.sqlite3')
+                    self._copy_database(source, name)
+                    result = self._measure(name, profile_options, options)
+                    self.stdout.write(
+                        f"{profile:<8} {result['requests']:>8} "
+                        f"{result['errors']:>7} {result['rps']:>8.1f} "
+                        f"{result['p50'] * 1000:>8.1f} "
+                        f"{result['p99'] * 1000:>8.1f} {result['lost']:>9}"
+                    )
+            finally:
+                use_database(source, configured)
+
+    def _copy_database(self, source, name):
+        connections['default'].close()
+        if not os.path.exists(source):
+            raise CommandError(
+                "База не найдена, выполните python manage.py migrate."
+            )
+        with sqlite3.connect(source) as src, sqlite3.connect(name) as dst:
+            src.backup(dst)
+        src.close()
+        dst.close()
+
+    def _prepare(self, options):
+        # bulk_create не отправляет post_save и не запускает генерацию
+        # копий несуществующего изображения.
+        category, = Category.objects.bulk_create([Category(
+            name='bench', slug='bench-sqlite-writes', image='bench.gif',
+        )])
+        product_ids = [
+            Product.objects.create(
+                name=f'bench {number}', slug=f'bench-sqlite-writes-{number}',
+                price=1, category=category,
+            ).pk
+            for number in range(options['products'])
+        ]
+        user_ids = [
+            User.objects.create_user(
+                username=BENCH_USERNAME.format(number),
+                email=f'{BENCH_USERNAME.format(number)}@example.com',
+            ).pk
+            for number in range(options['users'])
+        ]
+        return product_ids, user_ids
+
+    def _measure(self, name, profile_options, options):
+        use_database(name, profile_options)
+        product_ids, user_ids = self._prepare(options)
+        connections['default'].close()
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        workers = [
+            context.Process(target=run_worker, args=(
+                name, profile_options, user_ids[number % len(user_ids)],
+                product_ids, options['duration'], results,
+            ))
+            for number in range(options['processes'])
+        ]
+        started = time.monotonic()
+        for worker in workers:
+            worker.start()
+        collected = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - started
+        latencies = sorted(
+            latency for worker_latencies, _ in collected
+            for latency in worker_latencies
+        )
+        stored = ProductCart.objects.filter(
+            product_id__in=product_ids
+        ).aggregate(total=Sum('quantity'))['total'] or 0
+        connections['default'].close()
+        return {
+            'requests': len(latencies),
+            'errors': sum(errors for _, errors in collected),
+            'rps': len(latencies) / elapsed,
+            'p50': percentile(latencies, 0.50),
+            'p99': percentile(latencies, 0.99),
+            'lost': len(latencies) - stored,
+        }
@@ -0,0 +1,132 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Sum
+from django.db.utils import DatabaseError
+
+from shop.management.commands.bench_http import percentile
+from shop.models import Category, Product, Reservation
+from shop.stock import available_stock, reserve, set_stock
+
+
+BENCH_SLUG = 'bench-stock-reservations'
+
+
+def run_worker(number, product_id, duration, results):
+    """Процесс, имитирующий покупателей одного продукта."""
+    connections['default'].close()
+    latencies = []
+    rejected = errors = 0
+    deadline = time.monotonic() + duration
+    step = 0
+    try:
+        while time.monotonic() < deadline:
+            step += 1
+            started = time.monotonic()
+            try:
+                reserved = reserve(
+                    f'bench:{number}:{step}', product_id, 1,
+                )
+            except DatabaseError:
+                errors += 1
+                continue
+            if not reserved:
+                # Товар распродан, дальше все попытки будут отказами.
+                rejected += 1
+                break
+            latencies.append(time.monotonic() - started)
+    finally:
+        connections['default'].close()
+        results.put((latencies, rejected, errors))
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест резервирования одного продукта множеством "
+        "одновременных покупателей: остаток в одной строке и разнесённый "
+        "по частям. Показывает число резервов в секунду, задержки, "
+        "ошибки БД и проверяет, что продано не больше остатка."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=10.0)
+        parser.add_argument('--stock', type=int, default=5000)
+        parser.add_argument('--shards', type=int, default=8)
+
+    def handle(self, *args, **options):
+        if min(options['processes'], options['stock'],
+               options['shards']) < 1:
+            raise CommandError("Параметры должны быть положительными.")
+        if Product.objects.filter(slug__startswith=BENCH_SLUG).exists():
+            raise CommandError(
+                "Остались данные прошлого запуска, удалите продукты "
+                f"{BENCH_SLUG}-*."
+            )
+        self.stdout.write(
+            f"{'частей':>6} {'продано':>8} {'остаток':>8} {'ошибок':>7} "
+            f"{'rps':>8} {'p50, мс':>8} {'p99, мс':>8} {'перепродано':>12}"
+        )
+        # bulk_create не отправляет post_save и не запускает генерацию
+        # копий несуществующего изображения.
+        category, = Category.objects.bulk_create([Category(
+            name='bench', slug=BENCH_SLUG, image='bench.gif',
+        )])
+        try:
+            for shards in sorted({1, options['shards']}):
+                result = self._measure(category, shards, options)
+                self.stdout.write(
+                    f"{shards:>6} {result['sold']:>8} "
+                    f"{result['remaining']:>8} {result['errors']:>7} "
+                    f"{result['rps']:>8.1f} {result['p50'] * 1000:>8.2f} "
+                    f"{result['p99'] * 1000:>8.2f} {result['oversold']:>12}"
+                )
+        finally:
+            Product.objects.filter(slug__startswith=BENCH_SLUG).delete()
+            category.delete()
+
+    def _measure(self, category, shards, options):
+        product = Product.objects.create(
+            name=f'bench {shards}', slug=f'{BENCH_SLUG}-{shards}',
+            price=1, category=category,
+        )
+        set_stock(product.pk, options['stock'], shards)
+        connections['default'].close()
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        workers = [
+            context.Process(target=run_worker, args=(
+                number, product.pk, options['duration'], results,
+            ))
+            for number in range(options['processes'])
+        ]
+        started = time.monotonic()
+        for worker in workers:
+            worker.start()
+        collected = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - started
+        latencies = sorted(
+            latency for worker_latencies, _, _ in collected
+            for latency in worker_latencies
+        )
+        remaining = available_stock(product.pk)
+        reserved = Reservation.objects.filter(
+            product=product,
+        ).aggregate(total=Sum('quantity'))['total'] or 0
+        return {
+            'sold': len(latencies),
+            'remaining': remaining,
+            'errors': sum(errors for _, _, errors in collected),
+            'rps': len(latencies) / elapsed,
+            'p50': percentile(latencies, 0.50),
+            'p99': percentile(latencies, 0.99),
+            # Продано сверх остатка или резервы не сходятся с продажами.
+            'oversold': max(
+                len(latencies) + remaining - options['stock'],
+                reserved - len(latencies), 0,
+            ),
+        }
@@ -0,0 +1,51 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.snapshot import CatalogSnapshot, build_snapshot
+from shop.catalog_cache import catalog_version
+
+
+class Command(BaseCommand):
+    help = (
+        "Собирает снимок каталога для воркеров API (api.snapshot). "
+        "С --watch работает постоянно и пересобирает снимок после "
+        "изменения каталога."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', default=settings.CATALOG_SNAPSHOT_PATH,
+            help="Файл снимка, по умолчанию CATALOG_SNAPSHOT_PATH.",
+        )
+        parser.add_argument('--watch', action='store_true')
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help="Период проверки версии каталога с --watch, в секундах.",
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not path:
+            raise CommandError(
+                "Укажите --path или настройку CATALOG_SNAPSHOT_PATH."
+            )
+        built = None
+        while True:
+            if built != catalog_version():
+                started = time.monotonic()
+                built = build_snapshot(path)
+                if options['verbosity']:
+                    snapshot = CatalogSnapshot(path)
+                    counts = ', '.join(
+                        f"{kind}: {snapshot.count(kind)}"
+                        for kind in snapshot.sections
+                    )
+                    self.stdout.write(
+                        f"Снимок {path} собран за "
+                        f"{time.monotonic() - started:.2f} с ({counts})."
+                    )
+            if not options['watch']:
+                return
+            time.sleep(options['interval'])
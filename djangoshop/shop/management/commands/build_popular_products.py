@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from shop.popularity import build_popular
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересобирает рейтинг популярных продуктов (таблица "
+        "PopularProduct) по затухающим счётчикам просмотров "
+        "и добавлений в корзину. С --interval работает постоянно."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top', type=int, default=settings.POPULAR_PRODUCTS_TOP,
+            help="Сколько продуктов хранить в рейтинге.",
+        )
+        parser.add_argument(
+            '--interval', type=float,
+            help="Период пересборки в секундах, без него — один проход.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            ranked = build_popular(options['top'])
+            if options['verbosity']:
+                self.stdout.write(
+                    f"Продуктов в рейтинге: {ranked}, собран за "
+                    f"{time.monotonic() - started:.2f} с."
+                )
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
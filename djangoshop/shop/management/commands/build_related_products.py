@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from shop.related import build_related
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересобирает рекомендации «вместе с этим покупают» "
+        "по содержимому корзин (таблица RelatedProduct)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top', type=int, default=settings.RELATED_PRODUCTS_TOP,
+            help="Сколько рекомендаций хранить для продукта.",
+        )
+        parser.add_argument(
+            '--max-cart-size', type=int,
+            default=settings.RELATED_MAX_CART_SIZE,
+            help="Корзины с большим числом строк не учитываются.",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        saved = build_related(options['top'], options['max_cart_size'])
+        if options['verbosity']:
+            self.stdout.write(
+                f"Сохранено пар: {saved} за "
+                f"{time.monotonic() - started:.2f} с."
+            )
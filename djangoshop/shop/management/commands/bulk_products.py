@@ -0,0 +1,94 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.catalog_bulk import (
+    DEFAULT_CHUNK_SIZE, change_prices, delete_products, move_to_subcategory,
+)
+from shop.models import Category, Product, SubCategory
+
+
+class Command(BaseCommand):
+    help = (
+        "Массовые операции с продуктами категории или подкатегории: "
+        "изменение цен, перенос в другую подкатегорию и удаление. "
+        "Продукты изменяются пачками, по одному запросу на пачку."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('operation', choices=('price', 'move', 'delete'))
+        parser.add_argument(
+            '--category', help="slug категории изменяемых продуктов.",
+        )
+        parser.add_argument(
+            '--subcategory', help="slug подкатегории изменяемых продуктов.",
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help="Применить операцию ко всем продуктам.",
+        )
+        change = parser.add_mutually_exclusive_group()
+        change.add_argument(
+            '--percent', type=float,
+            help="Изменение цены в процентах, например -15.",
+        )
+        change.add_argument(
+            '--amount', type=float, help="Изменение цены на сумму.",
+        )
+        parser.add_argument(
+            '--to-subcategory', help="slug подкатегории для переноса.",
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("Размер пачки должен быть положительным.")
+        queryset = self._products(options)
+        operation = options['operation']
+        chunk_size = options['chunk_size']
+        if operation == 'price':
+            if options['percent'] is None and options['amount'] is None:
+                raise CommandError("Укажите --percent или --amount.")
+            changed = change_prices(
+                queryset, percent=options['percent'],
+                amount=options['amount'], chunk_size=chunk_size,
+            )
+            self.stdout.write(f"Изменены цены продуктов: {changed}.")
+        elif operation == 'move':
+            if not options['to_subcategory']:
+                raise CommandError("Укажите --to-subcategory.")
+            subcategory = self._get(
+                SubCategory, options['to_subcategory'], "Подкатегория",
+            )
+            changed = move_to_subcategory(
+                queryset, subcategory, chunk_size=chunk_size,
+            )
+            self.stdout.write(f"Перенесено продуктов: {changed}.")
+        else:
+            deleted = delete_products(queryset, chunk_size=chunk_size)
+            self.stdout.write(f"Удалено продуктов: {deleted}.")
+
+    def _products(self, options):
+        if not (options['category'] or options['subcategory']
+                or options['all']):
+            raise CommandError(
+                "Укажите --category, --subcategory или --all."
+            )
+        queryset = Product.objects.all()
+        if options['category']:
+            queryset = queryset.filter(category=self._get(
+                Category, options['category'], "Категория",
+            ))
+        if options['subcategory']:
+            queryset = queryset.filter(
+                subcategory=self._get(
+                    SubCategory, options['subcategory'], "Подкатегория",
+                ),
+            )
+        return queryset
+
+    def _get(self, model, slug, label):
+        try:
+            return model.objects.get(slug=slug)
+        except model.DoesNotExist:
+            raise CommandError(f"{label} {slug} не найдена.")
@@ -0,0 +1,68 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.cart_cleanup import clear_abandoned
+
+
+PROGRESS_INTERVAL = 5
+
+
+class Command(BaseCommand):
+    help = (
+        "Опустошает корзины, которые не менялись CART_ABANDONED_DAYS "
+        "дней, пачками по CART_CLEANUP_BATCH_SIZE корзин в порядке id. "
+        "С --interval работает постоянно."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.CART_ABANDONED_DAYS,
+            help="Сколько дней корзина не менялась.",
+        )
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument(
+            '--pause', type=float, default=0,
+            help="Пауза между пачками в секундах, снижает нагрузку на БД.",
+        )
+        parser.add_argument(
+            '--interval', type=float,
+            help="Период запуска в секундах, без него — один проход.",
+        )
+
+    def handle(self, *args, **options):
+        if options['days'] < 0:
+            raise CommandError("Число дней не может быть отрицательным.")
+        if options['batch_size'] is not None and options['batch_size'] < 1:
+            raise CommandError("Размер пачки должен быть положительным.")
+        while True:
+            self._clear(options)
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+
+    def _clear(self, options):
+        started = reported = time.monotonic()
+        carts = lines = 0
+        for last_id, cleared, deleted in clear_abandoned(
+                options['days'], options['batch_size']):
+            carts += cleared
+            lines += deleted
+            now = time.monotonic()
+            if (options['verbosity'] > 1 or options['verbosity']
+                    and now - reported >= PROGRESS_INTERVAL):
+                reported = now
+                self.stdout.write(
+                    f"До корзины {last_id}: очищено корзин {carts}, "
+                    f"строк {lines}, "
+                    f"{lines / max(now - started, 1e-6):.0f} строк/с."
+                )
+            if options['pause']:
+                time.sleep(options['pause'])
+        if options['verbosity'] and (carts or not options['interval']):
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f"Очищено корзин: {carts}, удалено строк: {lines} за "
+                f"{elapsed:.2f} с ({lines / max(elapsed, 1e-6):.0f} строк/с)."
+            )
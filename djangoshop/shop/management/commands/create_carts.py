@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.models import Cart
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Создаёт корзины пользователям, у которых их нет (созданным "
+        "до автоматического создания корзин или загруженным фикстурами)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("Размер пачки должен быть положительным.")
+        users = User.objects.filter(cart__isnull=True).order_by('pk')
+        created = 0
+        last_pk = 0
+        while user_ids := list(users.filter(pk__gt=last_pk).values_list(
+                'pk', flat=True)[:options['batch_size']]):
+            Cart.objects.bulk_create(
+                [Cart(user_id=user_id) for user_id in user_ids],
+                ignore_conflicts=True,
+            )
+            created += len(user_ids)
+            last_pk = user_ids[-1]
+        self.stdout.write(f"Создано корзин: {created}.")
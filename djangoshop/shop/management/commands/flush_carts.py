@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.cart_store import get_cart_store
+
+
+class Command(BaseCommand):
+    help = (
+        "Записывает в БД корзины, изменённые в кеше (CART_STORE=cache). "
+        "С --interval работает постоянно и сбрасывает журнал "
+        "с указанным периодом."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float,
+            help="Период сброса в секундах, без него — один проход.",
+        )
+
+    def handle(self, *args, **options):
+        store = get_cart_store()
+        while True:
+            total = 0
+            # Один вызов сбрасывает не больше CART_FLUSH_BATCH_SIZE
+            # записей журнала, повторяем, пока журнал не опустеет.
+            while flushed := store.flush():
+                total += flushed
+            if options['verbosity'] and (total or not options['interval']):
+                self.stdout.write(f"Записано корзин: {total}.")
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from shop.media import collect_garbage
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет медиафайлы, хранящиеся по содержимому, на которые "
+        "больше не ссылаются категории, подкатегории и продукты."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=int,
+            help="Не трогать файлы моложе указанного числа секунд.",
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        report = collect_garbage(
+            grace=options['grace'],
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+        )
+        action = "Будет удалено" if options['dry_run'] else "Удалено"
+        self.stdout.write(
+            f"Просмотрено файлов: {report.scanned}. {action} файлов: "
+            f"{report.removed}, освобождено байт: {report.freed_bytes}."
+        )
@@ -0,0 +1,86 @@
+import sys
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.catalog_import import (
+    CatalogImporter, UndecodableLine, decode_lines, read_rows,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Потоковый импорт продуктов из CSV или JSONL с upsert по slug. "
+        "Колонки: name, slug, price, category, subcategory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help="Путь к файлу или '-' для чтения из stdin."
+        )
+        parser.add_argument(
+            '--format', choices=('csv', 'jsonl'),
+            help="Формат файла, по умолчанию определяется по расширению.",
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Только проверить строки, ничего не записывая.",
+        )
+        parser.add_argument(
+            '--show-rejected', type=int, default=20,
+            help="Сколько отклонённых строк вывести в отчёте.",
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or self._guess_format(path)
+        if options['batch_size'] < 1:
+            raise CommandError("Размер пачки должен быть положительным.")
+        importer = CatalogImporter(
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+            rejected_limit=max(options['show_rejected'], 0),
+        )
+        try:
+            if path == '-':
+                report = self._import(importer, sys.stdin.buffer, fmt)
+            else:
+                with open(path, 'rb') as stream:
+                    report = self._import(importer, stream, fmt)
+        except OSError as error:
+            raise CommandError(error)
+        except UndecodableLine as error:
+            name = 'stdin' if path == '-' else path
+            raise CommandError(
+                f"{name}, строка {error.args[0]}: "
+                f"текст не в кодировке UTF-8."
+            )
+
+        if options['dry_run']:
+            written = f"прошло проверку: {report.validated}"
+        else:
+            written = f"записано: {report.upserted}"
+        self.stdout.write(
+            f"Обработано строк: {report.processed}, "
+            f"{written}, "
+            f"отклонено: {report.rejected_count} "
+            f"за {report.elapsed:.2f} с "
+            f"({report.rows_per_second:.0f} строк/с)."
+        )
+        for line_num, reason in report.rejected:
+            self.stderr.write(f"Строка {line_num}: {reason}")
+        hidden = report.rejected_count - len(report.rejected)
+        if hidden > 0:
+            self.stderr.write(f"... и ещё {hidden} отклонённых строк.")
+
+    def _import(self, importer, stream, fmt):
+        return importer.run(read_rows(decode_lines(stream), fmt))
+
+    def _guess_format(self, path):
+        suffix = Path(path).suffix.lower()
+        if suffix == '.csv':
+            return 'csv'
+        if suffix in ('.jsonl', '.ndjson'):
+            return 'jsonl'
+        raise CommandError("Не удалось определить формат, укажите --format.")
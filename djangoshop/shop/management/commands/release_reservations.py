@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.stock import release_expired
+
+
+class Command(BaseCommand):
+    help = (
+        "Возвращает на склад просроченные резервы корзин пачками "
+        "по STOCK_RELEASE_BATCH_SIZE. С --interval работает постоянно."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float,
+            help="Период проверки в секундах, без него — один проход.",
+        )
+        parser.add_argument('--batch-size', type=int)
+
+    def handle(self, *args, **options):
+        while True:
+            total = 0
+            while released := release_expired(options['batch_size']):
+                total += released
+            if options['verbosity'] and (total or not options['interval']):
+                self.stdout.write(f"Снято резервов: {total}.")
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.models import Product, Stock
+from shop.stock import available_stock, set_stock
+
+
+class Command(BaseCommand):
+    help = (
+        "Задаёт свободный остаток продукта. С --shards больше 1 остаток "
+        "разносится по нескольким строкам для товаров, которые "
+        "одновременно покупают многие (распродажи). С --unlimited "
+        "снимает ограничение остатка."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('product', help="id или slug продукта.")
+        parser.add_argument('available', type=int, nargs='?')
+        parser.add_argument('--shards', type=int, default=1)
+        parser.add_argument('--unlimited', action='store_true')
+
+    def handle(self, *args, **options):
+        key = options['product']
+        lookup = {'pk': int(key)} if key.isdigit() else {'slug': key}
+        try:
+            product = Product.objects.get(**lookup)
+        except Product.DoesNotExist:
+            raise CommandError(f"Продукт {key} не найден.")
+        if options['unlimited']:
+            Stock.objects.filter(product=product).delete()
+            self.stdout.write(f"Остаток продукта {product} не ограничен.")
+            return
+        if options['available'] is None or options['available'] < 0:
+            raise CommandError("Укажите неотрицательный остаток.")
+        if options['shards'] < 1:
+            raise CommandError("Число частей должно быть положительным.")
+        set_stock(product.pk, options['available'], options['shards'])
+        self.stdout.write(
+            f"Остаток продукта {product}: {available_stock(product.pk)}, "
+            f"частей: {options['shards']}."
+        )
@@ -0,0 +1,160 @@
+"""
+Учёт ссылок на медиафайлы, хранящиеся по содержимому, и сборка мусора.
+
+Один файл cas/... может использоваться несколькими категориями,
+подкатегориями и изображениями продуктов. Число ссылок считается
+по этим трём таблицам, файл без ссылок удаляется вместе с уменьшенными
+копиями. Удаляются только файлы старше MEDIA_GC_GRACE_SECONDS: только
+что загруженный файл может ещё не иметь сохранённой ссылки в БД.
+"""
+import os
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db.models import Count
+
+from shop.models import Category, SubCategory, ProductImage
+from shop.storage import CAS_PREFIX
+
+
+IMAGE_MODELS = (Category, SubCategory, ProductImage)
+CAS_FILE_RE = re.compile(
+    r'^(?P<digest>[0-9a-f]{64})(?P<variant>_w\d+)?(?P<extension>\.\w+)?$'
+)
+
+
+@dataclass
+class GarbageReport:
+    scanned: int = 0
+    removed: int = 0
+    freed_bytes: int = 0
+
+
+def reference_counts(names):
+    """
+    Число ссылок на каждый файл из names по всем моделям
+    с изображениями, по одному запросу на модель.
+    """
+    counts = Counter()
+    for model in IMAGE_MODELS:
+        rows = model.objects.filter(image__in=names).values(
+            'image'
+        ).annotate(references=Count('pk')).order_by()
+        for row in rows:
+            counts[row['image']] += row['references']
+    return counts
+
+
+def release(names, grace=None):
+    """
+    Удаляет файлы из names, на которые больше нет ссылок, вместе
+    с их копиями. Возвращает отчёт об удалённых файлах.
+    """
+    names = {
+        name for name in names
+        if name and name.startswith(f'{CAS_PREFIX}/')
+    }
+    report = GarbageReport(scanned=len(names))
+    if not names:
+        return report
+    counts = reference_counts(names)
+    deadline = _deadline(grace)
+    for name in names:
+        if counts[name]:
+            continue
+        directory, filename = os.path.split(
+            os.path.join(settings.MEDIA_ROOT, name)
+        )
+        if not _is_expired(os.path.join(directory, filename), deadline):
+            continue
+        digest = CAS_FILE_RE.match(filename).group('digest')
+        for sibling in _listdir(directory):
+            match = CAS_FILE_RE.match(sibling)
+            if match and match.group('digest') == digest:
+                _remove(os.path.join(directory, sibling), report)
+    return report
+
+
+def collect_garbage(grace=None, batch_size=1000, dry_run=False):
+    """
+    Обходит каталог cas/ и удаляет файлы без ссылок, копии без
+    оригиналов и брошенные временные файлы. Ссылки проверяются
+    пачками по batch_size файлов.
+    """
+    report = GarbageReport()
+    deadline = _deadline(grace)
+    pending = {}
+    root = os.path.join(settings.MEDIA_ROOT, CAS_PREFIX)
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            report.scanned += 1
+            path = os.path.join(directory, filename)
+            match = CAS_FILE_RE.match(filename)
+            if match is None:
+                if filename.startswith('.') and _is_expired(path, deadline):
+                    _remove(path, report, dry_run)
+                continue
+            digest = match.group('digest')
+            group = pending.setdefault((directory, digest), [None, []])
+            if match.group('variant'):
+                group[1].append(path)
+            else:
+                group[0] = path
+        if len(pending) >= batch_size:
+            _collect_batch(pending, deadline, report, dry_run)
+            pending = {}
+    _collect_batch(pending, deadline, report, dry_run)
+    return report
+
+
+def _collect_batch(pending, deadline, report, dry_run):
+    names = {
+        os.path.relpath(original, settings.MEDIA_ROOT).replace(os.sep, '/')
+        for original, _ in pending.values() if original
+    }
+    counts = reference_counts(names) if names else Counter()
+    for original, variants in pending.values():
+        if original is not None:
+            name = os.path.relpath(
+                original, settings.MEDIA_ROOT
+            ).replace(os.sep, '/')
+            if counts[name] or not _is_expired(original, deadline):
+                continue
+            _remove(original, report, dry_run)
+        for variant in variants:
+            if _is_expired(variant, deadline):
+                _remove(variant, report, dry_run)
+
+
+def _deadline(grace):
+    if grace is None:
+        grace = settings.MEDIA_GC_GRACE_SECONDS
+    return time.time() - grace
+
+
+def _is_expired(path, deadline):
+    try:
+        return os.stat(path).st_mtime <= deadline
+    except FileNotFoundError:
+        return False
+
+
+def _listdir(directory):
+    try:
+        return os.listdir(directory)
+    except FileNotFoundError:
+        return []
+
+
+def _remove(path, report, dry_run=False):
+    try:
+        size = os.stat(path).st_size
+        if not dry_run:
+            os.remove(path)
+    except FileNotFoundError:
+        return
+    report.removed += 1
+    report.freed_bytes += size
@@ -0,0 +1,26 @@
+from asgiref.sync import iscoroutinefunction
+from django.utils.decorators import sync_and_async_middleware
+
+from shop.db_router import reset_pinning, restore_pinning
+
+
+@sync_and_async_middleware
+def replica_pinning_middleware(get_response):
+    """
+    Сбрасывает закрепление за основной БД в начале каждого запроса.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = reset_pinning()
+            try:
+                return await get_response(request)
+            finally:
+                restore_pinning(token)
+    else:
+        def middleware(request):
+            token = reset_pinning()
+            try:
+                return get_response(request)
+            finally:
+                restore_pinning(token)
+    return middleware
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.6 on 2026-10-19 01:33
+
+from django.db import migrations, models
+import shop.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0002_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='category',
+            name='image',
+            field=models.ImageField(storage=shop.storage.get_media_storage, upload_to='categories/'),
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(storage=shop.storage.get_media_storage, upload_to='products/'),
+        ),
+        migrations.AlterField(
+            model_name='subcategory',
+            name='image',
+            field=models.ImageField(storage=shop.storage.get_media_storage, upload_to='subcategories/'),
+        ),
+    ]
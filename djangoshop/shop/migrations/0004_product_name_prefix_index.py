@@ -0,0 +1,17 @@
+# Generated by Django 4.2.6 on 2026-10-19 01:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_media_storage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name'], name='shop_product_name_prefix', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
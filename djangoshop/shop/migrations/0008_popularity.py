@@ -0,0 +1,40 @@
+# Generated by Django 4.2.6 on 2026-10-19 02:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_related_product'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularProduct',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='shop.product')),
+                ('rank', models.PositiveIntegerField(unique=True)),
+                ('score', models.FloatField()),
+            ],
+            options={
+                'verbose_name': 'Популярный продукт',
+                'verbose_name_plural': 'Популярные продукты',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductStats',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='shop.product')),
+                ('views', models.PositiveBigIntegerField(default=0)),
+                ('cart_adds', models.PositiveBigIntegerField(default=0)),
+                ('score', models.FloatField(default=0)),
+                ('decayed_at', models.FloatField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Статистика продукта',
+                'verbose_name_plural': 'Статистика продуктов',
+            },
+        ),
+    ]
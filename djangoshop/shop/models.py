@@ -1,13 +1,17 @@
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.utils import timezone
 
+from shop.storage import get_media_storage
 from users.models import User
 
 
 class Category(models.Model):
     name = models.CharField(max_length=255)
     slug = models.SlugField(max_length=255, unique=True)
-    image = models.ImageField(upload_to='categories/')
+    image = models.ImageField(
+        upload_to='categories/', storage=get_media_storage,
+    )
 
     class Meta:
         verbose_name = "Категория"
@@ -20,7 +24,9 @@ class Category(models.Model):
 class SubCategory(models.Model):
     name = models.CharField(max_length=255)
     slug = models.SlugField(max_length=255, unique=True)
-    image = models.ImageField(upload_to='subcategories/')
+    image = models.ImageField(
+        upload_to='subcategories/', storage=get_media_storage,
+    )
     category = models.ForeignKey(
         Category, related_name='subcategories', on_delete=models.SET_NULL,
         null=True,
@@ -46,10 +52,18 @@ class Product(models.Model):
         SubCategory, related_name='products', on_delete=models.SET_NULL,
         null=True, blank=True,
     )
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         verbose_name = "Продукт"
         verbose_name_plural = "Продукты"
+        indexes = [
+            # Поиск по началу названия (LIKE 'abc%') в админке.
+            models.Index(
+                fields=['name'], name='shop_product_name_prefix',
+                opclasses=['varchar_pattern_ops'],
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -62,8 +76,23 @@ class Product(models.Model):
             )
 
 
+class DeletedProduct(models.Model):
+    """
+    Запись об удалённом продукте для инкрементальной выгрузки каталога:
+    по ней выгрузка с since сообщает об удалении.
+    """
+    product_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name = "Удалённый продукт"
+        verbose_name_plural = "Удалённые продукты"
+
+
 class ProductImage(models.Model):
-    image = models.ImageField(upload_to='products/')
+    image = models.ImageField(
+        upload_to='products/', storage=get_media_storage,
+    )
     product = models.ForeignKey(
         Product, related_name='images', on_delete=models.CASCADE,
     )
@@ -75,9 +104,15 @@ class ProductImage(models.Model):
 
 
 class Cart(models.Model):
+    """
+    Корзина пользователя. last_activity — время последнего изменения
+    с точностью до CART_ACTIVITY_RESOLUTION, по нему команда
+    clear_abandoned_carts находит брошенные корзины.
+    """
     user = models.OneToOneField(
         User, related_name='cart', on_delete=models.CASCADE, unique=True
     )
+    last_activity = models.DateTimeField(default=timezone.now, db_index=True)
     products = models.ManyToManyField(
         Product,
         through='ProductCart',
@@ -110,3 +145,175 @@ class ProductCart(models.Model):
     def __str__(self):
         return (f"Продукт {self.product.name} "
                 f" в корзине пользователя {self.cart.user.username}")
+
+
+class Stock(models.Model):
+    """
+    Остаток продукта, свободный для резервирования. У продуктов без
+    остатка количество не ограничено. При shards больше одного остаток
+    разнесён по строкам StockShard, а available не используется.
+    """
+    product = models.OneToOneField(
+        Product, related_name='stock', on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    available = models.PositiveIntegerField(default=0)
+    shards = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        verbose_name = "Остаток"
+        verbose_name_plural = "Остатки"
+
+    def __str__(self):
+        return f"Остаток продукта {self.product_id}"
+
+
+class StockShard(models.Model):
+    product = models.ForeignKey(
+        Product, related_name='stock_shards', on_delete=models.CASCADE,
+    )
+    number = models.PositiveSmallIntegerField()
+    available = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Часть остатка"
+        verbose_name_plural = "Части остатка"
+        constraints = [
+            models.UniqueConstraint(
+                fields=('product', 'number'),
+                name='unique_stock_shard'
+            )
+        ]
+
+
+class Reservation(models.Model):
+    """
+    Количество продукта, снятое с остатка для корзины owner
+    (user:<id> или guest:<id гостевой корзины>) до expires_at.
+    """
+    owner = models.CharField(max_length=64)
+    product = models.ForeignKey(
+        Product, related_name='reservations', on_delete=models.CASCADE,
+    )
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Резерв"
+        verbose_name_plural = "Резервы"
+        constraints = [
+            models.UniqueConstraint(
+                fields=('owner', 'product'),
+                name='unique_reservation'
+            )
+        ]
+
+    def __str__(self):
+        return f"Резерв {self.quantity} × {self.product_id} для {self.owner}"
+
+
+class Order(models.Model):
+    user = models.ForeignKey(
+        User, related_name='orders', on_delete=models.PROTECT,
+    )
+    idempotency_key = models.CharField(max_length=64)
+    total = models.FloatField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Заказ"
+        verbose_name_plural = "Заказы"
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'idempotency_key'),
+                name='unique_order_idempotency_key'
+            )
+        ]
+
+    def __str__(self):
+        return f"Заказ {self.pk} пользователя {self.user_id}"
+
+
+class OrderLine(models.Model):
+    """
+    Строка заказа. Название и цена копируются из продукта при
+    оформлении и не меняются вместе с каталогом.
+    """
+    order = models.ForeignKey(
+        Order, related_name='lines', on_delete=models.CASCADE,
+    )
+    product = models.ForeignKey(
+        Product, related_name='order_lines', on_delete=models.SET_NULL,
+        null=True,
+    )
+    name = models.CharField(max_length=255)
+    price = models.FloatField()
+    quantity = models.PositiveIntegerField()
+
+    class Meta:
+        verbose_name = "Строка заказа"
+        verbose_name_plural = "Строки заказа"
+        ordering = ['id']
+
+
+class RelatedProduct(models.Model):
+    """
+    Продукт, который чаще других лежит в одной корзине с product.
+    Таблица пересобирается командой build_related_products, rank
+    начинается с 1.
+    """
+    product = models.ForeignKey(
+        Product, related_name='related_products', on_delete=models.CASCADE,
+    )
+    related = models.ForeignKey(
+        Product, related_name='+', on_delete=models.CASCADE,
+    )
+    score = models.PositiveIntegerField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        verbose_name = "Связанный продукт"
+        verbose_name_plural = "Связанные продукты"
+        constraints = [
+            models.UniqueConstraint(
+                fields=('product', 'rank'),
+                name='unique_related_product_rank'
+            )
+        ]
+
+
+class ProductStats(models.Model):
+    """
+    Счётчики событий продукта, которые записывают воркеры
+    (shop.popularity). score — затухающая со временем популярность
+    на момент decayed_at (Unix-время).
+    """
+    product = models.OneToOneField(
+        Product, related_name='stats', on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    views = models.PositiveBigIntegerField(default=0)
+    cart_adds = models.PositiveBigIntegerField(default=0)
+    score = models.FloatField(default=0)
+    decayed_at = models.FloatField(default=0)
+
+    class Meta:
+        verbose_name = "Статистика продукта"
+        verbose_name_plural = "Статистика продуктов"
+
+
+class PopularProduct(models.Model):
+    """
+    Место продукта в рейтинге популярных. Таблица пересобирается
+    командой build_popular_products, rank начинается с 1.
+    """
+    product = models.OneToOneField(
+        Product, related_name='popularity', on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    rank = models.PositiveIntegerField(unique=True)
+    score = models.FloatField()
+
+    class Meta:
+        verbose_name = "Популярный продукт"
+        verbose_name_plural = "Популярные продукты"
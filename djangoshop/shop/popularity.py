@@ -0,0 +1,227 @@
+"""
+Счётчики популярности продуктов и рейтинг популярных.
+
+Увеличивать счётчик в строке продукта на каждый просмотр значило бы
+превратить чтение каталога в запись в одни и те же «горячие» строки.
+Вместо этого каждый процесс копит просмотры и добавления в корзину
+в памяти (PopularityCounters), а фоновый поток раз
+в POPULARITY_FLUSH_INTERVAL секунд записывает накопленное в ProductStats
+пакетными INSERT ... ON CONFLICT DO UPDATE, которые прибавляют события
+к значениям в БД. Сколько бы запросов ни пришло, процесс пишет в БД
+не чаще раза за интервал. События, не записанные до завершения
+процесса, теряются: для рейтинга это допустимо.
+
+score — сумма событий с экспоненциальным затуханием: вес события
+уменьшается вдвое каждые POPULARITY_HALF_LIFE секунд, добавление
+в корзину весит POPULARITY_CART_WEIGHT просмотров. В строке хранится
+score на момент decayed_at, запись уменьшает его до текущего момента
+и прибавляет новые события (события одного пакета считаются
+произошедшими в момент записи). build_popular() приводит score всех
+продуктов к одному моменту и сохраняет POPULAR_PRODUCTS_TOP лучших
+в PopularProduct, откуда список популярных читается по индексу.
+"""
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connections, router, transaction
+
+from shop.models import PopularProduct, Product, ProductStats
+
+
+logger = logging.getLogger(__name__)
+
+# Параметров в одном запросе на строку: id, просмотры, добавления, вес.
+ROW_PARAMS = 4
+# 0.5 ** 1000 ещё представимо в double, дальше вес считается нулевым:
+# PostgreSQL при потере значимости POWER() выдаёт ошибку.
+MAX_HALF_LIVES = 1000
+
+
+def _column(model, name):
+    return model._meta.get_field(name).column
+
+
+def _decay(age, params=()):
+    """
+    SQL множителя затухания за age секунд и его параметры, params —
+    параметры выражения age.
+    """
+    half_life = settings.POPULARITY_HALF_LIFE
+    return (
+        f"CASE WHEN {age} >= %s THEN 0 "
+        f"ELSE POWER(0.5, ({age}) / %s) END",
+        [*params, MAX_HALF_LIVES * half_life, *params, half_life],
+    )
+
+
+def write_events(events, now=None):
+    """
+    Прибавляет события {id продукта: (просмотры, добавления в корзину)}
+    к ProductStats. События удалённых продуктов пропускаются.
+    Возвращает число обновлённых продуктов.
+    """
+    now = time.time() if now is None else now
+    using = router.db_for_write(ProductStats)
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    stats = quote(ProductStats._meta.db_table)
+    columns = {
+        name: quote(_column(ProductStats, name))
+        for name in ('product', 'views', 'cart_adds', 'score', 'decayed_at')
+    }
+    rows = [
+        (pk, views, cart_adds,
+         views + cart_adds * settings.POPULARITY_CART_WEIGHT)
+        for pk, (views, cart_adds) in events.items()
+    ]
+    decay, decay_params = _decay(
+        f"EXCLUDED.{columns['decayed_at']} - {stats}.{columns['decayed_at']}"
+    )
+    batch_size = (connection.features.max_query_params or 4000) // ROW_PARAMS
+    written = 0
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            # Столбцы VALUES называются column1, column2... и в SQLite,
+            # и в PostgreSQL. WHERE перед ON CONFLICT обязателен
+            # в SQLite для INSERT ... SELECT.
+            cursor.execute(
+                f"INSERT INTO {stats} ({', '.join(columns.values())}) "
+                f"SELECT events.column1, events.column2, events.column3, "
+                f"events.column4, %s "
+                f"FROM (VALUES "
+                f"{', '.join(['(%s, %s, %s, %s)'] * len(batch))}"
+                f") AS events, {quote(Product._meta.db_table)} AS product "
+                f"WHERE product.{quote(Product._meta.pk.column)} "
+                f"= events.column1 "
+                f"ON CONFLICT ({columns['product']}) DO UPDATE SET "
+                f"{columns['views']} = {stats}.{columns['views']} "
+                f"+ EXCLUDED.{columns['views']}, "
+                f"{columns['cart_adds']} = {stats}.{columns['cart_adds']} "
+                f"+ EXCLUDED.{columns['cart_adds']}, "
+                f"{columns['score']} = {stats}.{columns['score']} "
+                f"* {decay} + EXCLUDED.{columns['score']}, "
+                f"{columns['decayed_at']} = EXCLUDED.{columns['decayed_at']}",
+                [now, *(value for row in batch for value in row),
+                 *decay_params],
+            )
+            written += cursor.rowcount
+    return written
+
+
+class PopularityCounters:
+    """
+    События продуктов в памяти процесса. add() только увеличивает
+    числа в словаре под блокировкой и не обращается к БД, поэтому
+    подходит и для асинхронных представлений. Первое событие
+    запускает в процессе фоновый поток записи.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = {}
+        self._flusher_pid = None
+
+    def add(self, product_id, views=0, cart_adds=0):
+        with self._lock:
+            counts = self._events.setdefault(product_id, [0, 0])
+            counts[0] += views
+            counts[1] += cart_adds
+            start = (settings.POPULARITY_FLUSH_INTERVAL > 0
+                     and self._flusher_pid != os.getpid())
+            if start:
+                # После fork поток родителя в процессе не работает.
+                self._flusher_pid = os.getpid()
+        if start:
+            threading.Thread(
+                target=self._run, name='popularity-flush', daemon=True,
+            ).start()
+
+    def pending(self):
+        """Копия незаписанных событий {id продукта: (просмотры, корзины)}."""
+        with self._lock:
+            return {pk: tuple(counts) for pk, counts in self._events.items()}
+
+    def flush(self, now=None):
+        """
+        Записывает накопленные события в ProductStats и возвращает
+        число обновлённых продуктов. При ошибке БД или любой другой
+        события возвращаются в счётчики до следующей записи.
+        """
+        with self._lock:
+            events, self._events = self._events, {}
+        if not events:
+            return 0
+        try:
+            return write_events(events, now)
+        except Exception:
+            logger.warning("Не удалось записать счётчики популярности",
+                           exc_info=True)
+            with self._lock:
+                for pk, (views, cart_adds) in events.items():
+                    counts = self._events.setdefault(pk, [0, 0])
+                    counts[0] += views
+                    counts[1] += cart_adds
+            return 0
+
+    def _run(self):
+        while True:
+            time.sleep(settings.POPULARITY_FLUSH_INTERVAL)
+            try:
+                self.flush()
+                close_old_connections()
+            except Exception:
+                # Поток не перезапускается, поэтому ошибка только
+                # откладывает запись до следующего интервала.
+                logger.exception("Ошибка фоновой записи популярности")
+
+
+counters = PopularityCounters()
+
+
+def record_view(product_id):
+    counters.add(product_id, views=1)
+
+
+def record_cart_add(product_id):
+    counters.add(product_id, cart_adds=1)
+
+
+def build_popular(top=None, now=None):
+    """
+    Пересобирает PopularProduct по ProductStats и возвращает число
+    продуктов в рейтинге.
+    """
+    top = top or settings.POPULAR_PRODUCTS_TOP
+    now = time.time() if now is None else now
+    using = router.db_for_write(PopularProduct)
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    product = quote(_column(ProductStats, 'product'))
+    decay, decay_params = _decay(
+        f"%s - {quote(_column(ProductStats, 'decayed_at'))}", [now],
+    )
+    columns = ', '.join(
+        quote(_column(PopularProduct, name))
+        for name in ('product', 'rank', 'score')
+    )
+    with transaction.atomic(using=using):
+        PopularProduct.objects.using(using).all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {quote(PopularProduct._meta.db_table)} "
+                f"({columns}) "
+                f"SELECT product_id, ROW_NUMBER() OVER ("
+                f"ORDER BY score DESC, product_id), score FROM ("
+                f"SELECT {product} AS product_id, "
+                f"{quote(_column(ProductStats, 'score'))} * {decay} "
+                f"AS score "
+                f"FROM {quote(ProductStats._meta.db_table)}"
+                f") decayed WHERE score > 0 "
+                f"ORDER BY score DESC, product_id LIMIT %s",
+                [*decay_params, top],
+            )
+            return cursor.rowcount
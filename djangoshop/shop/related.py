@@ -0,0 +1,108 @@
+"""
+Рекомендации «вместе с этим покупают» по содержимому корзин.
+
+Строки корзин читаются из БД потоком пачками и складываются
+в разреженную матрицу X «корзина × продукт» (SciPy CSR). Матрица
+совместной встречаемости — произведение Xᵀ·X: в ячейке (a, b) число
+корзин, где лежат оба продукта. Она считается блоками по
+RELATED_BLOCK_SIZE продуктов, чтобы в памяти не лежала вся целиком,
+и из каждого блока векторно (сортировкой NumPy, без циклов Python
+по парам) оставляются RELATED_PRODUCTS_TOP продуктов с наибольшим
+числом для каждого продукта. Корзины длиннее RELATED_MAX_CART_SIZE строк
+(оптовые покупки, тестовые корзины) дают квадратичное число пар почти
+без полезного сигнала и не учитываются. Старые рекомендации заменяются
+в одной короткой транзакции после подсчёта, читатели видят их до её
+завершения.
+"""
+import numpy as np
+from django.conf import settings
+from django.db import connections, router, transaction
+from scipy import sparse
+
+from shop.models import ProductCart, RelatedProduct
+
+
+READ_CHUNK_SIZE = 50000
+RELATED_BLOCK_SIZE = 2000
+
+
+def build_related(top=None, max_cart_size=None):
+    """
+    Пересобирает RelatedProduct и возвращает число сохранённых пар.
+    """
+    top = top or settings.RELATED_PRODUCTS_TOP
+    max_cart_size = max_cart_size or settings.RELATED_MAX_CART_SIZE
+    product_ids, matrix = cart_matrix(max_cart_size)
+    transposed = matrix.T.tocsr()
+    blocks = [
+        top_related(matrix, transposed, start, top)
+        for start in range(0, matrix.shape[1], RELATED_BLOCK_SIZE)
+    ]
+    using = router.db_for_write(RelatedProduct)
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    columns = ', '.join(
+        quote(RelatedProduct._meta.get_field(name).column)
+        for name in ('product', 'related', 'score', 'rank')
+    )
+    insert = (
+        f"INSERT INTO {quote(RelatedProduct._meta.db_table)} "
+        f"({columns}) VALUES (%s, %s, %s, %s)"
+    )
+    with transaction.atomic(using=using):
+        RelatedProduct.objects.using(using).all().delete()
+        saved = 0
+        with connection.cursor() as cursor:
+            for rows, cols, scores, ranks in blocks:
+                # Строк сотни тысяч, поэтому без объектов моделей.
+                cursor.executemany(insert, list(zip(
+                    product_ids[rows].tolist(), product_ids[cols].tolist(),
+                    scores.tolist(), ranks.tolist(),
+                )))
+                saved += len(rows)
+    return saved
+
+
+def cart_matrix(max_cart_size):
+    """
+    Разреженная матрица 0/1 «корзина × продукт» без корзин длиннее
+    max_cart_size строк и id продуктов её столбцов по возрастанию.
+    """
+    lines = ProductCart.objects.values_list('cart_id', 'product_id')
+    chunks = []
+    chunk = []
+    for line in lines.iterator(chunk_size=READ_CHUNK_SIZE):
+        chunk.append(line)
+        if len(chunk) == READ_CHUNK_SIZE:
+            chunks.append(np.array(chunk, dtype=np.int64))
+            chunk = []
+    chunks.append(np.array(chunk, dtype=np.int64).reshape(-1, 2))
+    lines = np.concatenate(chunks)
+    _, carts = np.unique(lines[:, 0], return_inverse=True)
+    product_ids, products = np.unique(lines[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(lines), dtype=np.int32), (carts, products)),
+        shape=(carts.max(initial=-1) + 1, len(product_ids)),
+    )
+    sizes = np.diff(matrix.indptr)
+    return product_ids, matrix[sizes <= max_cart_size]
+
+
+def top_related(matrix, transposed, start, top):
+    """
+    Лучшие top продуктов для продуктов-столбцов matrix (строк
+    transposed) с номерами от start до start + RELATED_BLOCK_SIZE:
+    массивы номеров продуктов, номеров рекомендаций, числа общих корзин
+    и места (с 1). При равном числе корзин выше продукт с меньшим id.
+    """
+    block = transposed[start:start + RELATED_BLOCK_SIZE]
+    pairs = (block @ matrix).tocoo()
+    rows, cols, scores = pairs.row + start, pairs.col, pairs.data
+    distinct = rows != cols
+    rows, cols, scores = rows[distinct], cols[distinct], scores[distinct]
+    # Последний ключ lexsort — главный.
+    order = np.lexsort((cols, -scores, rows))
+    rows, cols, scores = rows[order], cols[order], scores[order]
+    ranks = np.arange(len(rows)) - np.searchsorted(rows, rows) + 1
+    best = ranks <= top
+    return rows[best], cols[best], scores[best], ranks[best]
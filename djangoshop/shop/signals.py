@@ -0,0 +1,221 @@
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import (
+    post_save, post_delete, pre_delete, pre_save,
+)
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from shop.catalog_cache import bump_catalog_version
+from shop.gateway_cache import catalog_paths, schedule_purge
+from shop.image_cache import get_image_cache
+from shop.images import schedule_variants
+from shop.media import release
+from shop.models import (
+    Cart, Category, DeletedProduct, SubCategory, Product, ProductImage,
+)
+
+
+# Отправляется после фиксации изменения продуктов, один раз на пачку;
+# аргумент product_ids — id изменённых или удалённых продуктов.
+catalog_changed = Signal()
+
+_batch = threading.local()
+
+
+@contextmanager
+def reported_in_batch():
+    """
+    Внутри блока сохранение и удаление продуктов не отправляют
+    catalog_changed по одному: массовая операция отправляет его сама
+    один раз на пачку.
+    """
+    previous = getattr(_batch, 'active', False)
+    _batch.active = True
+    try:
+        yield
+    finally:
+        _batch.active = previous
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_save, sender=ProductImage)
+def create_image_variants(sender, instance, **kwargs):
+    """
+    После фиксации транзакции ставит в очередь создание уменьшенных
+    копий изображения.
+    """
+    transaction.on_commit(partial(schedule_variants, instance.image.name))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=SubCategory)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_resized_images(sender, instance, **kwargs):
+    """
+    Удаляет из дискового кэша копии, созданные по запросу: после
+    замены изображения они устарели бы.
+    """
+    kind = instance.image.field.upload_to.strip('/')
+    get_image_cache().invalidate(kind, instance.pk)
+
+
+@receiver(pre_save, sender=Category)
+@receiver(pre_save, sender=SubCategory)
+@receiver(pre_save, sender=ProductImage)
+def remember_replaced_image(sender, instance, **kwargs):
+    """
+    Запоминает прежнее имя файла, чтобы после замены изображения
+    освободить старый файл.
+    """
+    instance._replaced_image = None
+    if instance.pk is None:
+        return
+    old_name = sender.objects.filter(pk=instance.pk).values_list(
+        'image', flat=True
+    ).first()
+    if old_name and old_name != instance.image.name:
+        instance._replaced_image = old_name
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_save, sender=ProductImage)
+def release_replaced_image(sender, instance, **kwargs):
+    if old_name := getattr(instance, '_replaced_image', None):
+        transaction.on_commit(partial(release, [old_name]))
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=SubCategory)
+@receiver(post_delete, sender=ProductImage)
+def release_deleted_image(sender, instance, **kwargs):
+    transaction.on_commit(partial(release, [instance.image.name]))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, raw=False, **kwargs):
+    """
+    После фиксации сбрасывает кеши каталога при любом сохранении или
+    удалении продукта, а не только из админки и массовых операций.
+    """
+    if not raw and not getattr(_batch, 'active', False):
+        transaction.on_commit(partial(
+            catalog_changed.send, sender=Product, product_ids=[instance.pk],
+        ))
+
+
+@receiver(post_delete, sender=Product)
+def record_deleted_product(sender, instance, using, **kwargs):
+    """
+    Запоминает удаление продукта для выгрузки каталога с since.
+    Массовое удаление записывает всю пачку само.
+    """
+    if not getattr(_batch, 'active', False):
+        record_deleted_products([instance.pk], using=using)
+
+
+def record_deleted_products(product_ids, using='default'):
+    """
+    Записывает удаление продуктов одним INSERT и удаляет записи старше
+    EXPORT_DELETED_DAYS дней: выгрузка с более ранним since
+    отклоняется, поэтому они больше не нужны.
+    """
+    deleted = DeletedProduct.objects.using(using)
+    deleted.filter(deleted_at__lt=timezone.now() - timedelta(
+        days=settings.EXPORT_DELETED_DAYS,
+    )).delete()
+    deleted.bulk_create(
+        DeletedProduct(product_id=product_id) for product_id in product_ids
+    )
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def touch_image_product(sender, instance, raw=False, **kwargs):
+    """
+    Изображения выгружаются вместе с продуктом: их изменение
+    обновляет Product.updated_at, чтобы выгрузка с since его увидела.
+    """
+    if not raw:
+        Product.objects.filter(pk=instance.product_id).update(
+            updated_at=timezone.now(),
+        )
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(pre_delete, sender=Category)
+@receiver(pre_delete, sender=SubCategory)
+def touch_category_products(sender, instance, raw=False, created=False,
+                            **kwargs):
+    """
+    Обновляет Product.updated_at продуктов (под)категории при её
+    изменении или удалении: продукты выгружаются вместе с ней. При
+    удалении это делается до того, как связь с продуктами обнулится.
+    """
+    if raw or created:
+        return
+    if sender is Category:
+        products = Q(category=instance) | Q(subcategory__category=instance)
+    else:
+        products = Q(subcategory=instance)
+    Product.objects.filter(products).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def product_image_changed(sender, instance, raw=False, **kwargs):
+    """
+    Изображения выводятся вместе с продуктом: после фиксации их
+    изменение сбрасывает кеши каталога, как изменение продукта.
+    """
+    if not raw:
+        transaction.on_commit(partial(
+            catalog_changed.send, sender=Product,
+            product_ids=[instance.product_id],
+        ))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def create_user_cart(sender, instance, created, raw=False, **kwargs):
+    """
+    Создаёт корзину вместе с пользователем, чтобы запросам к корзине
+    не нужно было проверять её наличие.
+    """
+    if created and not raw:
+        Cart.objects.create(user=instance)
+
+
+@receiver(catalog_changed)
+def invalidate_catalog_cache(sender, product_ids, **kwargs):
+    bump_catalog_version()
+    schedule_purge(catalog_paths())
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=SubCategory)
+def invalidate_category_pages(sender, instance, **kwargs):
+    """
+    После фиксации меняет версию каталога и обновляет в кеше nginx
+    списки каталога и страницу (под)категории: продукты выводятся
+    вместе с категориями.
+    """
+    name = 'categories' if sender is Category else 'subcategories'
+    transaction.on_commit(bump_catalog_version)
+    transaction.on_commit(partial(
+        schedule_purge, catalog_paths(objects=[(name, instance.pk)]),
+    ))
@@ -0,0 +1,235 @@
+"""
+Остатки продуктов и их резервирование корзинами.
+
+Резерв снимается с остатка одним условным UPDATE
+(available = available - n WHERE available >= n): проверка и списание
+атомарны, поэтому остаток не уходит в минус без SELECT ... FOR UPDATE
+и повторных попыток. Строка остатка заблокирована только до конца
+короткой транзакции резерва, списание в ней выполняется последним.
+Для продуктов с распродажами остаток можно разнести по нескольким
+строкам StockShard (set_stock(..., shards=n)): покупатели списывают
+с частей в случайном порядке и реже ждут друг друга, а если ни в одной
+части не хватает остатка целиком, он набирается из нескольких частей.
+Резервы живут STOCK_RESERVATION_TIMEOUT секунд с последнего изменения
+корзины, просроченные возвращаются на остаток пачками
+(release_expired, команда release_reservations).
+"""
+import random
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from shop.models import Reservation, Stock, StockShard
+
+
+class OutOfStock(Exception):
+    pass
+
+
+def user_owner(user):
+    return f'user:{user.pk}'
+
+
+def guest_owner(cart_id):
+    return f'guest:{cart_id}'
+
+
+def set_stock(product_id, available, shards=1):
+    """
+    Задаёт свободный остаток продукта и число частей, по которым он
+    разнесён. Действующие резервы не меняются.
+    """
+    with transaction.atomic():
+        Stock.objects.update_or_create(product_id=product_id, defaults={
+            'available': available if shards == 1 else 0,
+            'shards': shards,
+        })
+        StockShard.objects.filter(product_id=product_id).delete()
+        if shards > 1:
+            StockShard.objects.bulk_create([
+                StockShard(
+                    product_id=product_id, number=number,
+                    available=(available // shards
+                               + (number < available % shards)),
+                )
+                for number in range(shards)
+            ])
+
+
+def available_stock(product_id):
+    """Свободный остаток продукта или None, если он не ограничен."""
+    shards = _shards([product_id]).get(product_id)
+    if shards is None:
+        return None
+    if shards == 1:
+        return Stock.objects.values_list(
+            'available', flat=True,
+        ).get(product_id=product_id)
+    return StockShard.objects.filter(product_id=product_id).aggregate(
+        total=Sum('available'),
+    )['total'] or 0
+
+
+def reserve(owner, product_id, quantity, replace=False):
+    """
+    Добавляет quantity единиц к резерву корзины owner, а с replace
+    заменяет резерв на quantity, и продлевает его. Возвращает False,
+    если свободного остатка не хватает; резерв при этом не меняется.
+    """
+    shards = _shards([product_id]).get(product_id)
+    if shards is None:
+        return True
+    try:
+        return _reserve(owner, product_id, quantity, replace, shards)
+    except IntegrityError:
+        # Первый резерв продукта для той же корзины одновременно создала
+        # другая транзакция (два первых добавления в корзину): теперь его
+        # строку можно заблокировать и изменить.
+        return _reserve(owner, product_id, quantity, replace, shards)
+
+
+def _reserve(owner, product_id, quantity, replace, shards):
+    expires_at = timezone.now() + timedelta(
+        seconds=settings.STOCK_RESERVATION_TIMEOUT,
+    )
+    try:
+        with transaction.atomic():
+            reservation = Reservation.objects.select_for_update().filter(
+                owner=owner, product_id=product_id,
+            ).first()
+            held = reservation.quantity if reservation else 0
+            delta = quantity - held if replace else quantity
+            if reservation is None:
+                Reservation.objects.create(
+                    owner=owner, product_id=product_id, quantity=quantity,
+                    expires_at=expires_at,
+                )
+            else:
+                Reservation.objects.filter(pk=reservation.pk).update(
+                    quantity=held + delta, expires_at=expires_at,
+                )
+            if delta > 0 and not _take(product_id, shards, delta):
+                raise OutOfStock
+            if delta < 0:
+                _put(product_id, shards, -delta)
+    except OutOfStock:
+        return False
+    return True
+
+
+def release(owner, product_ids=None):
+    """
+    Возвращает на остаток резервы корзины owner по продуктам
+    product_ids или все. Возвращает число снятых резервов.
+    """
+    reservations = Reservation.objects.filter(owner=owner)
+    if product_ids is not None:
+        reservations = reservations.filter(product_id__in=product_ids)
+    with transaction.atomic():
+        return _release(reservations.select_for_update())
+
+
+def release_expired(batch_size=None):
+    """
+    Возвращает на остаток не больше batch_size (STOCK_RELEASE_BATCH_SIZE)
+    просроченных резервов. Строки, заблокированные другим процессом,
+    пропускаются. Возвращает число снятых резервов.
+    """
+    batch_size = batch_size or settings.STOCK_RELEASE_BATCH_SIZE
+    with transaction.atomic():
+        return _release(Reservation.objects.select_for_update(
+            skip_locked=True,
+        ).filter(expires_at__lte=timezone.now()).order_by('expires_at')[
+            :batch_size
+        ])
+
+
+def transfer(source, target):
+    """Переносит резервы корзины source в корзину target."""
+    with transaction.atomic():
+        moved = dict(Reservation.objects.select_for_update().filter(
+            owner=source,
+        ).values_list('product_id', 'quantity'))
+        if not moved:
+            return
+        existing = dict(Reservation.objects.select_for_update().filter(
+            owner=target, product_id__in=moved,
+        ).values_list('product_id', 'quantity'))
+        expires_at = timezone.now() + timedelta(
+            seconds=settings.STOCK_RESERVATION_TIMEOUT,
+        )
+        Reservation.objects.filter(owner=source).delete()
+        Reservation.objects.bulk_create(
+            [
+                Reservation(owner=target, product_id=pk,
+                            quantity=existing.get(pk, 0) + quantity,
+                            expires_at=expires_at)
+                for pk, quantity in moved.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['owner', 'product'],
+            update_fields=['quantity', 'expires_at'],
+        )
+
+
+def _shards(product_ids):
+    return dict(Stock.objects.filter(
+        product_id__in=product_ids,
+    ).values_list('product_id', 'shards'))
+
+
+def _take(product_id, shards, quantity):
+    if shards == 1:
+        return bool(Stock.objects.filter(
+            product_id=product_id, available__gte=quantity,
+        ).update(available=F('available') - quantity))
+    parts = StockShard.objects.filter(product_id=product_id)
+    for number in random.sample(range(shards), shards):
+        if parts.filter(number=number, available__gte=quantity).update(
+            available=F('available') - quantity,
+        ):
+            return True
+    # Ни в одной части не хватает остатка целиком: набираем его из
+    # нескольких частей под блокировкой всех частей продукта.
+    locked = list(parts.select_for_update().order_by('number'))
+    if sum(part.available for part in locked) < quantity:
+        return False
+    for part in locked:
+        taken = min(part.available, quantity)
+        if taken:
+            parts.filter(pk=part.pk).update(
+                available=F('available') - taken,
+            )
+            quantity -= taken
+    return True
+
+
+def _put(product_id, shards, quantity):
+    if shards == 1:
+        Stock.objects.filter(product_id=product_id).update(
+            available=F('available') + quantity,
+        )
+    else:
+        StockShard.objects.filter(
+            product_id=product_id, number=random.randrange(shards),
+        ).update(available=F('available') + quantity)
+
+
+def _release(reservations):
+    released = list(reservations.values_list('pk', 'product_id', 'quantity'))
+    if not released:
+        return 0
+    Reservation.objects.filter(pk__in=[pk for pk, _, _ in released]).delete()
+    quantities = Counter()
+    for _, product_id, quantity in released:
+        quantities[product_id] += quantity
+    shards = _shards(quantities)
+    # Строки остатков блокируются в порядке id, чтобы одновременные
+    # возвраты не ждали друг друга по кругу.
+    for product_id in sorted(shards):
+        _put(product_id, shards[product_id], quantities[product_id])
+    return len(released)
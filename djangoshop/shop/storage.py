@@ -0,0 +1,83 @@
+"""
+Хранилище медиафайлов с адресацией по содержимому.
+
+Файл сохраняется под именем cas/<aa>/<bb>/<sha256><расширение>, где
+sha256 — хэш содержимого, поэтому одинаковые загрузки в категории,
+подкатегории и продукты занимают на диске один файл. URL такого файла
+никогда не меняет содержимое и отдаётся nginx с immutable-кэшированием.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, default_storage
+
+
+CAS_PREFIX = 'cas'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        if max_length is not None and len(name) > max_length:
+            raise SuspiciousFileOperation(
+                f'Storage can not find an available filename for "{name}".'
+            )
+        self._save_once(name, content)
+        return name
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return '/'.join(
+            (CAS_PREFIX, digest[:2], digest[2:4], f'{digest}{extension}')
+        )
+
+    def _save_once(self, name, content):
+        """
+        Записывает файл во временный и атомарно ссылается на него
+        итоговым именем: если такой файл уже есть, новая копия
+        отбрасывается, а у существующей обновляется время изменения,
+        чтобы сборщик мусора не удалил её до сохранения ссылки в БД.
+        """
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            os.utime(full_path)
+            return
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        if self.directory_permissions_mode is not None:
+            os.chmod(directory, self.directory_permissions_mode)
+        descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix='.')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                for chunk in content.chunks():
+                    file.write(chunk)
+            os.chmod(temp_path, self.file_permissions_mode or 0o644)
+            try:
+                os.link(temp_path, full_path)
+            except FileExistsError:
+                os.utime(full_path)
+        finally:
+            os.unlink(temp_path)
+
+
+def get_media_storage():
+    if settings.MEDIA_CONTENT_ADDRESSED:
+        return ContentAddressedStorage()
+    return default_storage
@@ -0,0 +1,15 @@
+"""
+Запуск тестов без фоновых потоков записи: потоки писали бы в тестовую
+БД из другого соединения посреди чужих тестов. Тесты сбрасывают
+журнал корзин и счётчики популярности явно.
+"""
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class ShopTestRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.CART_FLUSH_INTERVAL = 0
+        settings.POPULARITY_FLUSH_INTERVAL = 0
@@ -0,0 +1,111 @@
+import shutil
+import tempfile
+from http import HTTPStatus
+
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from shop.counting import estimated_count
+from shop.models import Product, ProductCart, ProductImage
+from shop.tests.utils import create_category, create_subcategory
+from users.models import User
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+CHANGELISTS = (
+    'category', 'subcategory', 'product', 'productimage', 'cart',
+    'productcart',
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class AdminScalabilityTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.cat_1 = create_category()
+        cls.subcat_1 = create_subcategory(cls.cat_1)
+        cls.admin = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='adminpassword1',
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(AdminScalabilityTestCase.admin)
+
+    def fill(self, size):
+        """Добавляет по size строк в каждую таблицу магазина."""
+        start = Product.objects.count()
+        products = Product.objects.bulk_create(
+            Product(
+                name=f'product_{number}',
+                slug=f'product{number}',
+                price=number,
+                category=AdminScalabilityTestCase.cat_1,
+                subcategory=AdminScalabilityTestCase.subcat_1,
+            )
+            for number in range(start, start + size)
+        )
+        ProductImage.objects.bulk_create(
+            ProductImage(image='products/test.gif', product=product)
+            for product in products
+        )
+        users = [
+            User.objects.create_user(username=f'user_{start + number}')
+            for number in range(size)
+        ]
+        ProductCart.objects.bulk_create(
+            ProductCart(cart=user.cart, product=product, quantity=1)
+            for user, product in zip(users, products)
+        )
+
+    def changelist_queries(self, model_name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/admin/shop/{model_name}/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return len(queries)
+
+    def test_changelist_query_count_is_fixed(self):
+        """Проверка постоянного числа запросов в списках админки."""
+        self.fill(1)
+        small = {name: self.changelist_queries(name) for name in CHANGELISTS}
+        self.fill(40)
+        for name in CHANGELISTS:
+            with self.subTest(changelist=name):
+                self.assertEqual(self.changelist_queries(name), small[name])
+
+    @override_settings(ESTIMATED_COUNT_THRESHOLD=1)
+    def test_unfiltered_changelist_uses_estimated_count(self):
+        """Проверка оценки числа строк без COUNT(*) по всей таблице."""
+        self.fill(5)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/shop/product/')
+        self.assertContains(response, '5 Продукты')
+        self.assertFalse([
+            query['sql'] for query in queries.captured_queries
+            if 'COUNT(' in query['sql'] and 'shop_product' in query['sql']
+        ])
+
+    @override_settings(ESTIMATED_COUNT_THRESHOLD=1)
+    def test_filtered_count_is_exact(self):
+        """Проверка точного подсчёта при фильтрации."""
+        self.fill(5)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        Product.objects.filter(slug='product0').delete()
+        self.assertEqual(estimated_count(Product.objects.all()), 5)
+        self.assertEqual(
+            estimated_count(Product.objects.filter(price__gte=3)), 2
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
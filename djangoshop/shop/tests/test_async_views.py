@@ -0,0 +1,131 @@
+import shutil
+import tempfile
+from http import HTTPStatus
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.test import AsyncClient, TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from shop.models import ProductCart, ProductImage, Cart
+from shop.tests.utils import (
+    create_category, create_product, create_subcategory, create_user,
+    image_file,
+)
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class AsyncViewsTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.cat_1 = create_category()
+        cls.subcat_1 = create_subcategory(cls.cat_1)
+        cls.product_1 = create_product(cls.cat_1, price=123)
+        cls.product_1_image = ProductImage.objects.create(
+            image=image_file(),
+            product=cls.product_1,
+        )
+        cls.user = create_user()
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        super().setUp()
+        self.async_client = AsyncClient()
+        self.auth_headers = {
+            'Authorization': f'Token {AsyncViewsTestCase.token.key}'
+        }
+        self.sync_client = APIClient()
+
+    async def test_catalog_responses_match_sync_api(self):
+        """Проверка совпадения ответов асинхронного и синхронного API."""
+        addresses = (
+            'categories/',
+            'subcategories/',
+            'products/',
+            f'products/{AsyncViewsTestCase.product_1.pk}/',
+        )
+        for address in addresses:
+            with self.subTest(address=address):
+                response = await self.async_client.get(
+                    f'/api/v1/async/{address}'
+                )
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                expected = await self.sync_get(f'/api/v1/{address}')
+                self.assertEqual(response.json(), expected)
+
+    async def sync_get(self, address):
+        response = await sync_to_async(self.sync_client.get)(address)
+        return response.json()
+
+    async def test_pagination_links(self):
+        """Проверка ограничения и ссылок пагинации."""
+        response = await self.async_client.get(
+            '/api/v1/async/products/', {'limit': 1, 'offset': 0}
+        )
+        data = response.json()
+        self.assertEqual(data['count'], 1)
+        self.assertIsNone(data['next'])
+        self.assertEqual(len(data['results']), 1)
+
+    async def test_cart_requires_token(self):
+        """Проверка невозможности неавторизованного доступа к корзине."""
+        response = await self.async_client.get('/api/v1/async/cart/')
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+    async def test_cart_actions(self):
+        """Проверка добавления, изменения и чтения корзины."""
+        address = (
+            f'/api/v1/async/products/{AsyncViewsTestCase.product_1.pk}/cart/'
+        )
+        for _ in range(2):
+            response = await self.async_client.post(
+                address, {'quantity': 10},
+                content_type='application/json', headers=self.auth_headers,
+            )
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertEqual(response.json()['quantity'], 20)
+        response = await self.async_client.patch(
+            address, {'quantity': 3}, content_type='application/json',
+            headers=self.auth_headers,
+        )
+        self.assertEqual(response.status_code, HTTPStatus.PARTIAL_CONTENT)
+        response = await self.async_client.get(
+            '/api/v1/async/cart/', headers=self.auth_headers,
+        )
+        self.assertEqual(response.json(), {
+            'products': [
+                {
+                    'product': {'name': 'test_product_1', 'price': 123.0},
+                    'quantity': 3,
+                }
+            ],
+            'full_price': 369.0,
+        })
+        self.assertEqual(await Cart.objects.acount(), 1)
+        response = await self.async_client.delete(
+            '/api/v1/async/cart/', headers=self.auth_headers,
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        self.assertEqual(await ProductCart.objects.acount(), 0)
+
+    async def test_invalid_quantity_rejected(self):
+        """Проверка ошибки при некорректном количестве."""
+        address = (
+            f'/api/v1/async/products/{AsyncViewsTestCase.product_1.pk}/cart/'
+        )
+        response = await self.async_client.post(
+            address, {'quantity': 'many'}, content_type='application/json',
+            headers=self.auth_headers,
+        )
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
@@ -0,0 +1,151 @@
+import shutil
+import tempfile
+from datetime import timedelta
+from http import HTTPStatus
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from shop.cart_cleanup import clear_abandoned
+from shop.cart_store import CacheCartStore
+from shop.models import Cart, ProductCart
+from shop.tests.utils import create_category, create_product
+from users.models import User
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    CART_ABANDONED_DAYS=30,
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'cart-cleanup-tests',
+        }
+    },
+)
+class CartCleanupTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.cat_1 = create_category()
+        cls.products = [
+            create_product(cls.cat_1, number)
+            for number in range(2)
+        ]
+        cls.users = [
+            User.objects.create_user(
+                username=f'testuser{number}',
+                email=f'test{number}@example.com',
+            )
+            for number in range(3)
+        ]
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        ProductCart.objects.bulk_create([
+            ProductCart(cart=user.cart, product=product, quantity=1)
+            for user in CartCleanupTestCase.users
+            for product in CartCleanupTestCase.products
+        ])
+        self.abandon(*CartCleanupTestCase.users[:2])
+
+    def abandon(self, *users):
+        Cart.objects.filter(user__in=users).update(
+            last_activity=timezone.now() - timedelta(days=31),
+        )
+
+    def lines(self, user):
+        return ProductCart.objects.filter(cart__user=user).count()
+
+    def test_abandoned_carts_emptied_in_batches(self):
+        """Проверка очистки брошенных корзин пачками по id."""
+        first, second, active = CartCleanupTestCase.users
+        batches = list(clear_abandoned(batch_size=1))
+        self.assertEqual(batches, [
+            (first.cart.pk, 1, 2), (second.cart.pk, 1, 2),
+        ])
+        self.assertEqual(self.lines(first), 0)
+        self.assertEqual(self.lines(active), 2)
+        self.assertEqual(Cart.objects.count(), 3)
+        self.assertEqual(list(clear_abandoned()), [])
+
+    def test_cart_change_keeps_cart(self):
+        """Проверка, что изменённая корзина не считается брошенной."""
+        first = CartCleanupTestCase.users[0]
+        client = APIClient()
+        client.force_authenticate(first)
+        response = client.delete(
+            f'/api/v1/products/{CartCleanupTestCase.products[0].pk}/cart/'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        self.assertEqual(
+            sum(cleared for _, cleared, _ in clear_abandoned()), 1,
+        )
+        self.assertEqual(self.lines(first), 1)
+
+    @override_settings(CART_STORE='cache')
+    def test_cached_cart_forgotten(self):
+        """Проверка удаления очищенной корзины из кеша."""
+        first, second = CartCleanupTestCase.users[:2]
+        store = CacheCartStore()
+        self.assertEqual(len(store.lines(first)), 2)
+        store.add(second, CartCleanupTestCase.products[0], 1)
+        list(clear_abandoned())
+        self.assertEqual(store.lines(first), [])
+        self.assertEqual(self.lines(second), 2)
+        self.assertEqual(store.lines(second)[0].quantity, 2)
+
+    @override_settings(CART_STORE='cache')
+    def test_cart_cached_during_cleanup_kept(self):
+        """
+        Проверка, что изменение корзины в кеше посреди очистки
+        не теряется.
+        """
+        first, second = CartCleanupTestCase.users[:2]
+        store = CacheCartStore()
+        self.assertEqual(len(store.lines(second)), 2)
+        batches = clear_abandoned(batch_size=1)
+        self.assertEqual(next(batches), (first.cart.pk, 1, 2))
+        store.add(second, CartCleanupTestCase.products[0], 1)
+        self.assertEqual(next(batches), (second.cart.pk, 0, 0))
+        self.assertEqual(list(batches), [])
+        self.assertEqual(store.flush(), 1)
+        self.assertEqual(ProductCart.objects.get(
+            cart__user=second, product=CartCleanupTestCase.products[0],
+        ).quantity, 2)
+        self.assertEqual(list(clear_abandoned()), [])
+
+    @override_settings(CART_STORE='cache')
+    def test_locked_cart_skipped(self):
+        """Проверка пропуска корзины, которую сейчас меняют."""
+        first, second = CartCleanupTestCase.users[:2]
+        store = CacheCartStore()
+        with store._locked(first.pk):
+            self.assertEqual(list(clear_abandoned()), [
+                (second.cart.pk, 1, 2),
+            ])
+        self.assertEqual(self.lines(first), 2)
+
+    def test_command_reports_progress(self):
+        """Проверка отчёта команды о числе и скорости удаления строк."""
+        out = StringIO()
+        call_command('clear_abandoned_carts', batch_size=1, verbosity=2,
+                     stdout=out)
+        output = out.getvalue()
+        self.assertIn('очищено корзин 1, строк 2', output)
+        self.assertIn('Очищено корзин: 2, удалено строк: 4', output)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
@@ -0,0 +1,333 @@
+import shutil
+import tempfile
+from http import HTTPStatus
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from shop.cart_store import CacheCartStore, DatabaseCartStore, _run_flusher
+from shop.checks import check_cart_store
+from shop.models import Product, ProductCart
+from shop.tests.utils import create_category, create_product, create_user
+from users.models import User
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+class StopFlusher(BaseException):
+    """Останавливает бесконечный цикл фонового сброса в тесте."""
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    CART_STORE='cache',
+    CART_FLUSH_BATCH_SIZE=100,
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'cart-store-tests',
+        }
+    },
+)
+class CacheCartStoreTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.cat_1 = create_category()
+        cls.product_1 = create_product(cls.cat_1, price=123)
+        cls.product_2 = create_product(cls.cat_1, 2)
+        cls.user = create_user()
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.store = CacheCartStore()
+        self.authorized_client = APIClient()
+        self.authorized_client.force_authenticate(CacheCartStoreTestCase.user)
+
+    def add(self, product, quantity):
+        return self.authorized_client.post(
+            f'/api/v1/products/{product.pk}/cart/',
+            data={'quantity': quantity},
+        )
+
+    def test_cart_served_from_cache_before_flush(self):
+        """Проверка чтения корзины из кеша до записи в БД."""
+        self.add(CacheCartStoreTestCase.product_1, 10)
+        response = self.add(CacheCartStoreTestCase.product_1, 5)
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertEqual(response.data['quantity'], 15)
+        self.add(CacheCartStoreTestCase.product_2, 1)
+        self.assertEqual(ProductCart.objects.count(), 0)
+        response = self.authorized_client.get('/api/v1/cart/')
+        self.assertEqual(response.data, {
+            'products': [
+                {
+                    'product': {'name': 'test_product_1', 'price': 123.0},
+                    'quantity': 15,
+                },
+                {
+                    'product': {'name': 'test_product_2', 'price': 10.0},
+                    'quantity': 1,
+                },
+            ],
+            'full_price': 1855.0,
+        })
+
+    def test_flush_writes_changes_in_batch(self):
+        """Проверка записи изменений в БД при сбросе журнала."""
+        self.add(CacheCartStoreTestCase.product_1, 10)
+        self.add(CacheCartStoreTestCase.product_2, 2)
+        self.authorized_client.patch(
+            f'/api/v1/products/{CacheCartStoreTestCase.product_1.pk}/cart/',
+            data={'quantity': 3},
+        )
+        with self.assertNumQueries(7):
+            self.assertEqual(self.store.flush(), 1)
+        self.assertEqual(
+            dict(ProductCart.objects.values_list('product_id', 'quantity')),
+            {
+                CacheCartStoreTestCase.product_1.pk: 3,
+                CacheCartStoreTestCase.product_2.pk: 2,
+            },
+        )
+        self.assertEqual(self.store.flush(), 0)
+        self.authorized_client.delete(
+            f'/api/v1/products/{CacheCartStoreTestCase.product_2.pk}/cart/'
+        )
+        self.store.flush()
+        self.assertEqual(ProductCart.objects.get().quantity, 3)
+        self.authorized_client.delete('/api/v1/cart/')
+        self.store.flush()
+        self.assertFalse(ProductCart.objects.exists())
+
+    @override_settings(CART_FLUSH_BATCH_SIZE=2)
+    def test_requests_do_not_flush(self):
+        """Проверка, что запросы корзины не ждут записи в БД."""
+        for _ in range(3):
+            self.add(CacheCartStoreTestCase.product_1, 1)
+        self.assertFalse(ProductCart.objects.exists())
+        call_command('flush_carts', verbosity=0)
+        self.assertEqual(ProductCart.objects.get().quantity, 3)
+
+    def test_flusher_survives_cache_errors(self):
+        """Проверка, что ошибка кеша не останавливает фоновый сброс."""
+        self.add(CacheCartStoreTestCase.product_1, 1)
+        flush = CacheCartStore.flush
+        calls = []
+
+        def flaky_flush(store):
+            calls.append(store)
+            if len(calls) == 1:
+                raise ConnectionError("Кеш недоступен.")
+            return flush(store)
+
+        with mock.patch.object(CacheCartStore, 'flush', flaky_flush), \
+                mock.patch('shop.cart_store.close_old_connections'), \
+                mock.patch('shop.cart_store.time.sleep',
+                           side_effect=[None, None, StopFlusher]), \
+                self.assertLogs('shop.cart_store', 'ERROR'), \
+                self.assertRaises(StopFlusher):
+            _run_flusher()
+        self.assertEqual(ProductCart.objects.get().quantity, 1)
+
+    def test_flush_waits_for_missing_journal_entry(self):
+        """Проверка остановки сброса перед недописанной записью журнала."""
+        other = User.objects.create_user(
+            username='otheruser', email='other@example.com',
+        )
+        self.add(CacheCartStoreTestCase.product_1, 1)
+        # Другой процесс увеличил счётчик, но ещё не записал журнал.
+        cache.incr('cart:seq')
+        self.store.add(other, CacheCartStoreTestCase.product_2, 1)
+        self.assertEqual(self.store.flush(), 1)
+        self.assertFalse(ProductCart.objects.filter(
+            cart__user=other,
+        ).exists())
+        self.assertEqual(self.store.flush(), 0)
+        with override_settings(CART_LOCK_TIMEOUT=0):
+            self.assertEqual(self.store.flush(), 1)
+        self.assertEqual(ProductCart.objects.get(cart__user=other).quantity, 1)
+
+    def test_late_journal_entry_is_not_lost(self):
+        """
+        Проверка, что процесс, чей номер журнала занял сброс, записывает
+        корзину под новым номером.
+        """
+        user = CacheCartStoreTestCase.user
+        journal = self.store._journal
+
+        def late_journal(seq, user_id):
+            # Процесс завис после увеличения счётчика, сброс занял номер.
+            with override_settings(CART_LOCK_TIMEOUT=0):
+                self.store.flush()
+            self.store._journal = journal
+            return journal(seq, user_id)
+
+        with mock.patch.object(self.store, '_journal', late_journal):
+            self.store.add(user, CacheCartStoreTestCase.product_1, 2)
+        self.assertFalse(ProductCart.objects.exists())
+        self.assertEqual(self.store.flush(), 1)
+        self.assertEqual(ProductCart.objects.get(cart__user=user).quantity, 2)
+        # Занятый номер не освобождается после сброса.
+        self.assertEqual(cache.get('cart:journal:1'), 'skipped')
+        self.assertFalse(self.store._journal(1, user.pk))
+
+    def test_expired_lock_not_released_by_old_holder(self):
+        """
+        Проверка, что владелец просроченной блокировки не снимает
+        блокировку, которую уже взял другой процесс.
+        """
+        user = CacheCartStoreTestCase.user
+        lock = f'cart:lock:{user.pk}'
+        with self.store._locked(user.pk):
+            # Блокировка истекла, и её взял другой процесс.
+            cache.delete(lock)
+            other_token = self.store._acquire(lock)
+        self.assertEqual(cache.get(lock), other_token)
+        self.store._release(lock, other_token)
+        self.assertIsNone(cache.get(lock))
+
+    def test_cart_loaded_into_cache_under_lock(self):
+        """
+        Проверка, что чтение корзины загружает её из БД в кеш только под
+        блокировкой: иначе оформление заказа могло бы вернуть в кеш
+        прежние строки.
+        """
+        user = CacheCartStoreTestCase.user
+        initial = self.store._initial
+
+        def locked_initial(user_id):
+            self.assertIsNotNone(cache.get(f'cart:lock:{user_id}'))
+            return initial(user_id)
+
+        with mock.patch.object(self.store, '_initial', locked_initial):
+            self.assertEqual(self.store.lines(user), [])
+        self.assertEqual(cache.get(f'cart:{user.pk}'), {})
+
+    def test_flush_waits_for_cart_being_changed(self):
+        """
+        Проверка, что сброс, заставший запись журнала до новой корзины,
+        запишет новую корзину.
+        """
+        user = CacheCartStoreTestCase.user
+        product = CacheCartStoreTestCase.product_1
+        self.add(product, 1)
+        self.store.flush()
+        # Другой процесс меняет корзину: журнал уже записан, корзина
+        # в кеше ещё прежняя.
+        lock = f'cart:lock:{user.pk}'
+        cache.add(lock, 1)
+        self.store._changed(user.pk)
+        add = cache.add
+
+        def finish_change(key, *args, **kwargs):
+            if key == lock and cache.get(lock):
+                cache.set(f'cart:{user.pk}', {product.pk: 3})
+                cache.delete(lock)
+            return add(key, *args, **kwargs)
+
+        with mock.patch.object(self.store.cache, 'add', finish_change):
+            self.assertEqual(self.store.flush(), 1)
+        self.assertEqual(ProductCart.objects.get(cart__user=user).quantity, 3)
+
+    def test_changes_survive_worker_restart(self):
+        """Проверка записи изменений, сделанных до падения воркера."""
+        self.add(CacheCartStoreTestCase.product_1, 4)
+        call_command('flush_carts', verbosity=0)
+        self.assertEqual(ProductCart.objects.get().quantity, 4)
+
+    def test_cart_loaded_from_database_after_cache_loss(self):
+        """Проверка загрузки корзины из БД, если её нет в кеше."""
+        ProductCart.objects.create(
+            cart=CacheCartStoreTestCase.user.cart,
+            product=CacheCartStoreTestCase.product_2,
+            quantity=7,
+        )
+        response = self.add(CacheCartStoreTestCase.product_2, 1)
+        self.assertEqual(response.data['quantity'], 8)
+
+    def test_cached_cart_read_query_count_is_fixed(self):
+        """Проверка одного запроса при чтении корзины из кеша."""
+        products = Product.objects.bulk_create(
+            Product(
+                name=f'bulk_product_{number}',
+                slug=f'bulkprod{number}',
+                price=1,
+                category=CacheCartStoreTestCase.cat_1,
+            )
+            for number in range(500)
+        )
+        for product in products:
+            self.store.add(CacheCartStoreTestCase.user, product, 1)
+        with self.assertNumQueries(1):
+            response = self.authorized_client.get('/api/v1/cart/')
+        self.assertEqual(len(response.data['products']), 500)
+
+    def test_cache_store_requires_shared_cache(self):
+        """Проверка ошибки настроек корзин в кеше процесса."""
+        self.assertEqual(
+            [error.id for error in check_cart_store(None)], ['shop.E002'],
+        )
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': 'redis://localhost:6379/0',
+        }}):
+            self.assertEqual(check_cart_store(None), [])
+        with override_settings(CART_STORE='database'):
+            self.assertEqual(check_cart_store(None), [])
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class DatabaseCartStoreTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.cat_1 = create_category()
+        cls.product_1 = create_product(cls.cat_1)
+        cls.user = create_user()
+
+    def test_concurrent_first_add_sums_quantities(self):
+        """
+        Проверка, что первое добавление продукта, который одновременно
+        добавил другой запрос, прибавляет количество к его строке.
+        """
+        store = DatabaseCartStore()
+        user = DatabaseCartStoreTestCase.user
+        product = DatabaseCartStoreTestCase.product_1
+        ProductCart.objects.create(
+            cart_id=store._cart_id(user), product=product, quantity=2,
+        )
+        update = QuerySet.update
+        hidden = []
+
+        def concurrent_update(queryset, **kwargs):
+            # Строку другого запроса первое обновление ещё не видит.
+            if queryset.model is ProductCart and not hidden:
+                hidden.append(queryset)
+                return 0
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', concurrent_update):
+            line = store.add(user, product, 3)
+        self.assertEqual(len(hidden), 1)
+        self.assertEqual(line.quantity, 5)
+        self.assertEqual(ProductCart.objects.get().quantity, 5)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
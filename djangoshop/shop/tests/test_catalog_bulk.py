@@ -0,0 +1,298 @@
+import io
+import shutil
+import tempfile
+from http import HTTPStatus
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from shop.catalog_bulk import (
+    change_prices, delete_products, move_to_subcategory,
+)
+from shop.catalog_cache import catalog_version
+from shop.image_cache import ImageCache
+from shop.models import (
+    DeletedProduct, Order, OrderLine, Product, ProductCart, ProductImage,
+    RelatedProduct, Stock,
+)
+from shop.signals import catalog_changed
+from shop.tests.utils import (
+    create_category, create_product, create_subcategory, image_file,
+)
+from users.models import User
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class CatalogBulkTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.cat_1 = create_category()
+        cls.cat_2 = create_category(2)
+        cls.subcat_1 = create_subcategory(cls.cat_1)
+        cls.subcat_2 = create_subcategory(cls.cat_2, 2)
+        cls.products = Product.objects.bulk_create(
+            Product(
+                name=f'product_{number}',
+                slug=f'product{number}',
+                price=100,
+                category=cls.cat_1,
+                subcategory=cls.subcat_1,
+            )
+            for number in range(5)
+        )
+        cls.other = Product.objects.create(
+            name='other_product',
+            slug='otherprod',
+            price=100,
+            category=cls.cat_2,
+        )
+        cls.admin = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='adminpassword1',
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.batches = []
+        catalog_changed.connect(self.remember_batch)
+
+    def tearDown(self):
+        catalog_changed.disconnect(self.remember_batch)
+        super().tearDown()
+
+    def remember_batch(self, sender, product_ids, **kwargs):
+        self.batches.append(product_ids)
+
+    def prices(self):
+        return list(Product.objects.filter(
+            category=CatalogBulkTestCase.cat_1,
+        ).order_by('pk').values_list('price', flat=True))
+
+    def test_prices_changed_in_chunks(self):
+        """Проверка изменения цен одним UPDATE на пачку."""
+        version = catalog_version()
+        queryset = Product.objects.filter(category=CatalogBulkTestCase.cat_1)
+        with CaptureQueriesContext(connection) as queries, \
+                self.captureOnCommitCallbacks(execute=True):
+            changed = change_prices(queryset, percent=10, chunk_size=2)
+        self.assertEqual(changed, 5)
+        self.assertEqual(self.prices(), [110.0] * 5)
+        self.assertEqual(Product.objects.get(slug='otherprod').price, 100)
+        updates = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('UPDATE')
+        ]
+        self.assertEqual(len(updates), 3)
+        self.assertEqual(
+            [len(batch) for batch in self.batches], [2, 2, 1],
+        )
+        self.assertEqual(catalog_version(), version + 3)
+
+    def test_price_not_below_zero(self):
+        """Проверка, что цена не становится отрицательной."""
+        change_prices(Product.objects.all(), amount=-150)
+        self.assertEqual(set(Product.objects.values_list('price', flat=True)),
+                         {0.0})
+
+    def test_products_moved_to_subcategory(self):
+        """Проверка переноса продуктов в подкатегорию другой категории."""
+        queryset = Product.objects.filter(
+            subcategory=CatalogBulkTestCase.subcat_1,
+        )
+        self.assertEqual(move_to_subcategory(
+            queryset, CatalogBulkTestCase.subcat_2, chunk_size=2,
+        ), 5)
+        self.assertEqual(
+            Product.objects.filter(
+                subcategory=CatalogBulkTestCase.subcat_2,
+                category=CatalogBulkTestCase.cat_2,
+            ).count(),
+            5,
+        )
+
+    def test_products_deleted_with_cart_lines(self):
+        """Проверка удаления продуктов вместе со строками корзин."""
+        user = User.objects.create_user(username='testuser')
+        ProductCart.objects.create(
+            cart=user.cart, product=CatalogBulkTestCase.products[0],
+            quantity=1,
+        )
+        ProductCart.objects.create(
+            cart=user.cart, product=CatalogBulkTestCase.other, quantity=2,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            deleted = delete_products(
+                Product.objects.filter(category=CatalogBulkTestCase.cat_1),
+                chunk_size=3,
+            )
+        self.assertEqual(deleted, 5)
+        self.assertEqual(list(Product.objects.all()),
+                         [CatalogBulkTestCase.other])
+        self.assertEqual(ProductCart.objects.get().quantity, 2)
+        self.assertEqual(len(self.batches), 2)
+
+    def test_related_rows_deleted_or_detached(self):
+        """Проверка удаления и отвязки строк связанных таблиц."""
+        deleted = CatalogBulkTestCase.products[0]
+        kept = CatalogBulkTestCase.other
+        user = User.objects.create_user(username='testuser')
+        order = Order.objects.create(user=user, idempotency_key='key')
+        line = OrderLine.objects.create(
+            order=order, product=deleted, name=deleted.name, price=100,
+            quantity=1,
+        )
+        Stock.objects.create(product=deleted, available=3)
+        RelatedProduct.objects.create(
+            product=kept, related=deleted, score=1, rank=1,
+        )
+        RelatedProduct.objects.create(
+            product=deleted, related=kept, score=1, rank=1,
+        )
+        delete_products(Product.objects.filter(pk=deleted.pk))
+        line.refresh_from_db()
+        self.assertIsNone(line.product_id)
+        self.assertFalse(Stock.objects.exists())
+        self.assertFalse(RelatedProduct.objects.exists())
+
+    def test_delete_query_count_does_not_depend_on_chunk_size(self):
+        """Проверка, что удаление пачки выполняет одно и то же число
+        запросов при любом числе продуктов в ней."""
+        query_counts = []
+        for products in (CatalogBulkTestCase.products[:1],
+                         CatalogBulkTestCase.products[1:]):
+            for product in products:
+                ProductImage.objects.create(
+                    product=product, image=image_file(),
+                )
+            with CaptureQueriesContext(connection) as queries:
+                delete_products(
+                    Product.objects.filter(
+                        pk__in=[product.pk for product in products],
+                    ),
+                    chunk_size=len(products),
+                )
+            query_counts.append(len(queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+        self.assertEqual(list(Product.objects.all()),
+                         [CatalogBulkTestCase.other])
+
+    def test_deleted_products_recorded_once_per_chunk(self):
+        """Проверка записи удалённых продуктов для выгрузки одним
+        INSERT на пачку."""
+        with CaptureQueriesContext(connection) as queries:
+            delete_products(
+                Product.objects.filter(category=CatalogBulkTestCase.cat_1),
+                chunk_size=3,
+            )
+        inserts = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith('INSERT INTO "shop_deletedproduct"')
+        ]
+        self.assertEqual(len(inserts), 2)
+        self.assertCountEqual(
+            DeletedProduct.objects.values_list('product_id', flat=True),
+            [product.pk for product in CatalogBulkTestCase.products],
+        )
+
+    def test_deleted_images_released_once_per_chunk(self):
+        """Проверка освобождения файлов изображений и их копий в кэше
+        одним вызовом на пачку."""
+        for product in CatalogBulkTestCase.products:
+            for _ in range(2):
+                ProductImage.objects.create(
+                    product=product, image=image_file(),
+                )
+        with mock.patch('shop.catalog_bulk.release') as released, \
+                mock.patch('shop.signals.release') as released_one, \
+                mock.patch.object(ImageCache, 'invalidate') as invalidate, \
+                self.captureOnCommitCallbacks(execute=True):
+            delete_products(
+                Product.objects.filter(category=CatalogBulkTestCase.cat_1),
+                chunk_size=3,
+            )
+        self.assertEqual(
+            [len(call.args[0]) for call in released.call_args_list], [6, 4],
+        )
+        released_one.assert_not_called()
+        self.assertEqual(invalidate.call_count, 10)
+        self.assertEqual(len(self.batches), 2)
+        self.assertFalse(ProductImage.objects.exists())
+
+    def test_image_change_reported(self):
+        """Проверка сигнала об изменении каталога при смене изображения."""
+        product = CatalogBulkTestCase.products[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(
+                product=product, image=image_file(),
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            image.delete()
+        self.assertEqual(self.batches, [[product.pk], [product.pk]])
+
+    def test_product_change_reported(self):
+        """Проверка сигнала при сохранении и удалении продукта."""
+        product = create_product(CatalogBulkTestCase.cat_2)
+        product_pk = product.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            product.name = 'renamed_product'
+            product.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        self.assertEqual(self.batches, [[product_pk], [product_pk]])
+
+    def test_admin_price_action(self):
+        """Проверка действия админки с формой параметров."""
+        self.client.force_login(CatalogBulkTestCase.admin)
+        url = f'/admin/shop/product/?category__id__exact={self.cat_1.pk}'
+        data = {
+            'action': 'change_prices',
+            '_selected_action': [CatalogBulkTestCase.products[0].pk],
+            'select_across': '1',
+        }
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertContains(response, 'Выбрано продуктов: 5.')
+        self.assertEqual(self.prices(), [100.0] * 5)
+        response = self.client.post(url, {
+            **data, 'apply': '1', 'mode': 'amount', 'value': '-20',
+        })
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        self.assertEqual(self.prices(), [80.0] * 5)
+        self.assertEqual(Product.objects.get(slug='otherprod').price, 100)
+
+    def test_admin_delete_replaces_default_action(self):
+        """Проверка замены стандартного удаления на удаление пачками."""
+        self.client.force_login(CatalogBulkTestCase.admin)
+        response = self.client.get('/admin/shop/product/')
+        self.assertNotContains(response, 'value="delete_selected"')
+        self.client.post('/admin/shop/product/', {
+            'action': 'delete_products',
+            '_selected_action': [
+                product.pk for product in CatalogBulkTestCase.products[:2]
+            ],
+            'apply': '1',
+        })
+        self.assertEqual(Product.objects.count(), 4)
+
+    def test_command(self):
+        """Проверка команды массового изменения цен."""
+        call_command(
+            'bulk_products', 'price', '--subcategory', 'testsubcat1',
+            '--percent', '-25', stdout=io.StringIO(),
+        )
+        self.assertEqual(self.prices(), [75.0] * 5)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
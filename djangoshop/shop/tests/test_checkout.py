@@ -0,0 +1,205 @@
+import shutil
+import tempfile
+import threading
+from http import HTTPStatus
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from shop.cart_store import get_cart_store
+from shop.checkout import EmptyCart, checkout
+from shop.models import Order, OrderLine, Product, ProductCart, Reservation
+from shop.stock import available_stock, release, set_stock, user_owner
+from shop.tests.utils import create_category, create_product, create_user
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'checkout-tests',
+        }
+    },
+)
+class CheckoutTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.cat_1 = create_category()
+        cls.products = [
+            create_product(cls.cat_1, number, price=10 * (number + 1))
+            for number in range(5)
+        ]
+        cls.user = create_user()
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(CheckoutTestCase.user)
+
+    def fill_cart(self, products, quantity=2):
+        for product in products:
+            response = self.client.post(
+                f'/api/v1/products/{product.pk}/cart/',
+                data={'quantity': quantity},
+            )
+            self.assertEqual(response.status_code, HTTPStatus.CREATED)
+
+    def order(self, key='key-1'):
+        return self.client.post(
+            '/api/v1/checkout/', HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_checkout_creates_order(self):
+        """Проверка заказа с ценами продуктов и очистки корзины."""
+        self.fill_cart(CheckoutTestCase.products[:2])
+        response = self.order()
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertEqual(response.data['total'], 60)
+        self.assertEqual(
+            [(line['name'], line['price'], line['quantity'])
+             for line in response.data['lines']],
+            [('test_product_0', 10, 2), ('test_product_1', 20, 2)],
+        )
+        self.assertFalse(ProductCart.objects.exists())
+        Product.objects.update(price=1)
+        response = self.client.get(
+            f"/api/v1/orders/{response.data['id']}/",
+        )
+        self.assertEqual(response.data['total'], 60)
+
+    def test_retry_returns_same_order(self):
+        """Проверка, что повтор с тем же ключом не создаёт заказ."""
+        self.fill_cart(CheckoutTestCase.products[:1])
+        first = self.order()
+        self.fill_cart(CheckoutTestCase.products[1:2])
+        second = self.order()
+        self.assertEqual(second.status_code, HTTPStatus.OK)
+        self.assertEqual(second.data['id'], first.data['id'])
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(ProductCart.objects.count(), 1)
+
+    def test_statements_do_not_depend_on_cart_size(self):
+        """Проверка постоянного числа запросов при любой корзине."""
+        counts = []
+        for number, size in enumerate((1, 5)):
+            self.fill_cart(CheckoutTestCase.products[:size])
+            with CaptureQueriesContext(connection) as queries:
+                checkout(CheckoutTestCase.user, f'key-{number}')
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_empty_cart_and_missing_key(self):
+        """Проверка отказа без ключа идемпотентности и с пустой корзиной."""
+        response = self.client.post('/api/v1/checkout/')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        response = self.order()
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertFalse(Order.objects.exists())
+
+    def test_reservations_become_sold(self):
+        """Проверка списания резервов и повторного резерва при оформлении."""
+        first, second = CheckoutTestCase.products[:2]
+        set_stock(first.pk, 5)
+        set_stock(second.pk, 1)
+        self.fill_cart([first])
+        self.client.post(f'/api/v1/products/{second.pk}/cart/',
+                         data={'quantity': 1})
+        owner = user_owner(CheckoutTestCase.user)
+        release(owner, [first.pk, second.pk])
+        set_stock(second.pk, 0)
+        response = self.order()
+        self.assertEqual(response.status_code, HTTPStatus.CONFLICT)
+        self.assertEqual(response.data['products'], [second.pk])
+        set_stock(second.pk, 1)
+        response = self.order()
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertEqual(available_stock(first.pk), 3)
+        self.assertEqual(available_stock(second.pk), 0)
+        self.assertFalse(Reservation.objects.exists())
+
+    @override_settings(CART_STORE='cache')
+    def test_checkout_with_cache_cart_store(self):
+        """Проверка оформления корзины, которая ещё не записана в БД."""
+        self.fill_cart(CheckoutTestCase.products[:3], quantity=1)
+        response = self.order()
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertEqual(len(response.data['lines']), 3)
+        self.assertEqual(get_cart_store().lines(CheckoutTestCase.user), [])
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    CART_STORE='cache',
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'concurrent-checkout-tests',
+        }
+    },
+)
+class ConcurrentCheckoutTestCase(TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        category = create_category()
+        self.user = create_user()
+        store = get_cart_store()
+        for number in range(3):
+            store.add(self.user, create_product(category, number), 1)
+
+    def test_two_checkouts_of_one_cart(self):
+        """
+        Проверка, что два одновременных оформления одной корзины
+        с разными ключами создают один заказ.
+        """
+        barrier = threading.Barrier(2)
+        results = []
+
+        def order(key):
+            if connection.vendor == 'sqlite':
+                # Тестовая БД SQLite в памяти с общим кешем блокирует
+                # чтение таблицы, в которую пишет другое соединение.
+                with connection.cursor() as cursor:
+                    cursor.execute('PRAGMA read_uncommitted = 1')
+            barrier.wait()
+            try:
+                results.append(checkout(self.user, key)[1])
+            except EmptyCart:
+                results.append(None)
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=order, args=(key,))
+            for key in ('key-1', 'key-2')
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertCountEqual(results, [True, None])
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(OrderLine.objects.count(), 3)
+        self.assertFalse(ProductCart.objects.exists())
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
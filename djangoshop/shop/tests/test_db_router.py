@@ -0,0 +1,144 @@
+import os
+import shutil
+import tempfile
+from http import HTTPStatus
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from shop.db_router import (
+    CatalogReplicaRouter, reset_pinning, restore_pinning, selector,
+)
+from shop.models import (
+    Product, ProductCart, ProductImage,
+    Cart, Category, SubCategory,
+)
+from shop.tests.utils import create_category, create_product, create_user
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+REPLICA_ALIAS = 'replica'
+BROKEN_REPLICA_ALIAS = 'broken_replica'
+
+
+def register_database(alias, name):
+    """Подключает ещё одну SQLite-базу на время тестов."""
+    databases = connections.configure_settings({
+        DEFAULT_DB_ALIAS: {'ENGINE': 'django.db.backends.dummy'},
+        alias: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': name},
+    })
+    connections.settings[alias] = databases[alias]
+
+
+def unregister_database(alias):
+    connections[alias].close()
+    del connections[alias]
+    del connections.settings[alias]
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    DATABASE_REPLICAS=[(REPLICA_ALIAS, 1)],
+    DATABASE_REPLICA_STRATEGY='round_robin',
+)
+class CatalogReplicaRouterTestCase(TestCase):
+
+    # Реплика подключается в setUpClass, после сборки тестовых БД.
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.replica_path = os.path.join(TEMP_MEDIA_ROOT, 'replica.sqlite3')
+        register_database(REPLICA_ALIAS, cls.replica_path)
+        with connections[REPLICA_ALIAS].schema_editor() as editor:
+            for model in (Category, SubCategory, Product, ProductImage):
+                editor.create_model(model)
+        super().setUpClass()
+        cls.cat_1 = create_category()
+        cls.product_1 = create_product(cls.cat_1, price=123)
+        Category.objects.using(REPLICA_ALIAS).create(
+            pk=cls.cat_1.pk,
+            name='replica_category',
+            slug='testcat1',
+            image=cls.cat_1.image.name,
+        )
+        Product.objects.using(REPLICA_ALIAS).create(
+            pk=cls.product_1.pk,
+            name='replica_product',
+            slug='testprod1',
+            price=123,
+            category_id=cls.cat_1.pk,
+        )
+        cls.user = create_user()
+
+    def setUp(self):
+        super().setUp()
+        self.router = CatalogReplicaRouter()
+        self.pinning_token = reset_pinning()
+        self.anon_client = APIClient()
+        self.authorized_client = APIClient()
+        self.authorized_client.force_authenticate(
+            CatalogReplicaRouterTestCase.user
+        )
+
+    def tearDown(self):
+        super().tearDown()
+        restore_pinning(self.pinning_token)
+
+    def test_catalog_reads_use_replica(self):
+        """Проверка чтения каталога из реплики."""
+        response = self.anon_client.get('/api/v1/products/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(
+            response.data['results'][0]['name'], 'replica_product'
+        )
+        self.assertEqual(self.router.db_for_read(Product), REPLICA_ALIAS)
+        self.assertIsNone(self.router.db_for_read(ProductCart))
+
+    def test_reads_after_write_stay_on_primary(self):
+        """Проверка закрепления за основной БД после записи."""
+        self.assertEqual(self.router.db_for_read(Product), REPLICA_ALIAS)
+        self.assertEqual(self.router.db_for_write(Cart), 'default')
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+
+    def test_pinning_does_not_leak_between_requests(self):
+        """Проверка, что запись закрепляет только свой запрос,
+        а следующий запрос снова читает каталог из реплики."""
+        response = self.authorized_client.post(
+            f'/api/v1/products/{CatalogReplicaRouterTestCase.product_1.pk}'
+            '/cart/',
+            data={'quantity': 1},
+        )
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        response = self.anon_client.get(
+            f'/api/v1/products/{CatalogReplicaRouterTestCase.product_1.pk}/'
+        )
+        self.assertEqual(response.data['name'], 'replica_product')
+
+    @override_settings(
+        DATABASE_REPLICAS=[(BROKEN_REPLICA_ALIAS, 1)],
+        DATABASE_REPLICA_RETRY_SECONDS=60,
+    )
+    def test_unavailable_replica_falls_back_to_primary(self):
+        """Проверка чтения из основной БД при недоступной реплике."""
+        register_database(
+            BROKEN_REPLICA_ALIAS,
+            os.path.join(TEMP_MEDIA_ROOT, 'missing', 'replica.sqlite3'),
+        )
+        try:
+            self.assertIsNone(self.router.db_for_read(Product))
+            response = self.anon_client.get('/api/v1/products/')
+            self.assertEqual(
+                response.data['results'][0]['name'], 'test_product_1'
+            )
+        finally:
+            unregister_database(BROKEN_REPLICA_ALIAS)
+            selector._down_until.clear()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        unregister_database(REPLICA_ALIAS)
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
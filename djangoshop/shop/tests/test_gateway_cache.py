@@ -0,0 +1,318 @@
+import json
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import skipUnless
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.test import LiveServerTestCase, override_settings
+from rest_framework.authtoken.models import Token
+
+from shop import popularity
+from shop.catalog_bulk import change_prices
+from shop.gateway_cache import catalog_paths
+from shop.models import Product
+from shop.popularity import PopularityCounters
+from shop.tests.utils import create_category, create_product
+from users.models import User
+
+
+NGINX_CONF = Path(settings.BASE_DIR).parent / 'gateway' / 'nginx.conf'
+PURGE_TOKEN = 'test-purge-token'
+
+
+def cached_location():
+    """Регулярное выражение кешируемого location из nginx.conf."""
+    match = re.search(
+        r'location ~ (\S+) \{[^}]*proxy_cache api_cache;',
+        NGINX_CONF.read_text(),
+    )
+    return re.compile(match.group(1))
+
+
+class StandInGateway:
+    """
+    Заменитель nginx для тестов без docker. Повторяет правила
+    микрокеша из gateway/nginx.conf: кешируются GET-запросы адресов
+    кешируемого location, ключ — Host, адрес и формат ответа, запросы
+    с Authorization идут мимо кеша, запрос с токеном сброса обновляет
+    запись, устаревшая запись отдаётся, пока её обновляет один фоновый
+    запрос, а одновременные промахи ждут один запрос к бэкенду.
+    """
+
+    def __init__(self, upstream, ttl):
+        self.upstream = upstream
+        self.ttl = ttl
+        self.location = cached_location()
+        self.entries = {}
+        self.locks = {}
+        self.guard = threading.Lock()
+        self.upstream_requests = 0
+        self.updates = []
+        self.server = ThreadingHTTPServer(
+            ('127.0.0.1', 0), self._handler_class(),
+        )
+        self.thread = threading.Thread(target=self.server.serve_forever)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        for update in self.updates:
+            update.join()
+
+    def handle(self, path, headers):
+        """Ответ в виде (статус, тело, статус кеша)."""
+        if not self.location.match(urlsplit(path).path):
+            return (*self.forward(path, headers), None)
+        if headers.get('Authorization'):
+            return (*self.forward(path, headers), 'BYPASS')
+        accept = headers.get('Accept', '')
+        key = (
+            f"{headers.get('Host')}{path}:"
+            f"{'html' if 'text/html' in accept else 'json'}"
+        )
+        if headers.get(settings.CACHE_PURGE_HEADER) == PURGE_TOKEN:
+            return (*self.fetch(key, path, headers), 'BYPASS')
+        entry = self.entries.get(key)
+        if entry and entry['expires'] > time.monotonic():
+            return entry['status'], entry['body'], 'HIT'
+        if entry:
+            self.update_in_background(key, path, headers)
+            return entry['status'], entry['body'], 'UPDATING'
+        with self.lock(key):
+            if entry := self.entries.get(key):
+                return entry['status'], entry['body'], 'HIT'
+            return (*self.fetch(key, path, headers), 'MISS')
+
+    def lock(self, key):
+        with self.guard:
+            return self.locks.setdefault(key, threading.Lock())
+
+    def fetch(self, key, path, headers):
+        status, body = self.forward(path, headers)
+        if status == 200:
+            self.entries[key] = {
+                'status': status, 'body': body,
+                'expires': time.monotonic() + self.ttl,
+            }
+        return status, body
+
+    def update_in_background(self, key, path, headers):
+        if not self.lock(key).acquire(blocking=False):
+            return
+
+        def update():
+            try:
+                self.fetch(key, path, headers)
+            finally:
+                self.lock(key).release()
+
+        thread = threading.Thread(target=update)
+        self.updates.append(thread)
+        thread.start()
+
+    def forward(self, path, headers):
+        with self.guard:
+            self.upstream_requests += 1
+        request = Request(self.upstream + path, headers={
+            name: value for name, value in headers.items()
+            if name in ('Host', 'Accept', 'Authorization')
+        })
+        try:
+            with urlopen(request, timeout=5) as response:
+                return response.status, response.read()
+        except HTTPError as error:
+            return error.code, error.read()
+
+    def _handler_class(self):
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                status, body, cache_status = gateway.handle(
+                    self.path, dict(self.headers),
+                )
+                self.send_response(status)
+                if cache_status:
+                    self.send_header('X-Cache-Status', cache_status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+@skipUnless(NGINX_CONF.exists(), "Нет конфигурации gateway/nginx.conf.")
+@override_settings(IMAGE_VARIANTS_ASYNC=False)
+class GatewayCacheTestCase(LiveServerTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+        try:
+            super().setUpClass()
+        except Exception:
+            cls.media_settings.disable()
+            shutil.rmtree(cls.media_root, ignore_errors=True)
+            raise
+
+    def setUp(self):
+        super().setUp()
+        self.category = create_category()
+        self.product = create_product(self.category, price=100)
+        self.gateway = StandInGateway(self.live_server_url, ttl=60)
+        self.gateway.start()
+        self.addCleanup(self.gateway.stop)
+        purge_settings = override_settings(
+            CACHE_PURGE_URL=self.gateway.url,
+            CACHE_PURGE_TOKEN=PURGE_TOKEN,
+            CACHE_PURGE_ASYNC=False,
+        )
+        purge_settings.enable()
+        self.addCleanup(purge_settings.disable)
+
+    def get(self, path, **headers):
+        request = Request(self.gateway.url + path, headers=headers)
+        with urlopen(request, timeout=5) as response:
+            return (json.loads(response.read()),
+                    response.headers['X-Cache-Status'])
+
+    def test_anonymous_catalog_served_from_cache(self):
+        """Проверка повторного ответа на анонимный запрос из кеша."""
+        path = '/api/v1/products/'
+        self.assertEqual(self.get(path)[1], 'MISS')
+        data, status = self.get(path)
+        self.assertEqual(status, 'HIT')
+        self.assertEqual(data['results'][0]['price'], 100)
+        self.assertEqual(self.gateway.upstream_requests, 1)
+
+    def test_product_views_counted_behind_gateway(self):
+        """
+        Проверка, что карточки продуктов не кешируются и каждый
+        просмотр доходит до счётчиков популярности.
+        """
+        saved_counters = popularity.counters
+        popularity.counters = PopularityCounters()
+        self.addCleanup(setattr, popularity, 'counters', saved_counters)
+        for prefix in ('/api/v1/', '/api/v1/async/'):
+            for _ in range(2):
+                data, status = self.get(
+                    f'{prefix}products/{self.product.pk}/'
+                )
+                self.assertEqual((data['price'], status), (100, None))
+        self.assertEqual(self.gateway.upstream_requests, 4)
+        self.assertEqual(
+            popularity.counters.pending(), {self.product.pk: (4, 0)},
+        )
+
+    def test_requests_with_credentials_bypass_cache(self):
+        """Проверка, что запросы с Authorization не читают кеш."""
+        token = Token.objects.create(
+            user=User.objects.create_user(username='testuser'),
+        )
+        self.get('/api/v1/products/')
+        for _ in range(2):
+            self.assertEqual(
+                self.get('/api/v1/products/',
+                         Authorization=f'Token {token.key}')[1],
+                'BYPASS',
+            )
+        self.assertEqual(self.get('/api/v1/products/')[1], 'HIT')
+        self.assertEqual(self.gateway.upstream_requests, 3)
+
+    def test_catalog_change_refreshes_cached_pages(self):
+        """Проверка сброса кеша при массовом изменении цен."""
+        self.get('/api/v1/products/')
+        change_prices(Product.objects.all(), percent=-10)
+        data, status = self.get('/api/v1/products/')
+        self.assertEqual((data['results'][0]['price'], status), (90, 'HIT'))
+
+    def test_category_change_refreshes_product_lists(self):
+        """Проверка сброса списков при изменении категории."""
+        self.get('/api/v1/products/')
+        self.category.name = 'renamed_category'
+        self.category.save()
+        data, status = self.get('/api/v1/products/')
+        self.assertEqual(status, 'HIT')
+        self.assertEqual(data['results'][0]['category']['name'],
+                         'renamed_category')
+
+    def test_purged_paths_exist(self):
+        """Проверка, что сбрасываются только существующие адреса."""
+        lists = [
+            f'{prefix}{name}/'
+            for prefix in ('/api/v1/', '/api/v1/async/')
+            for name in ('categories', 'subcategories', 'products')
+        ]
+        self.assertCountEqual(
+            catalog_paths(objects=[('categories', 3)]),
+            lists + ['/api/v1/categories/3/'],
+        )
+        self.assertCountEqual(catalog_paths(), lists)
+        for path in catalog_paths(objects=[
+            ('categories', self.category.pk),
+        ]):
+            with urlopen(self.live_server_url + path, timeout=5) as response:
+                self.assertEqual(response.status, 200)
+
+    def test_purge_requires_token(self):
+        """Проверка, что сброс без верного токена не работает."""
+        path = '/api/v1/products/'
+        self.get(path)
+        Product.objects.update(price=50)
+        data, status = self.get(
+            path, **{settings.CACHE_PURGE_HEADER: 'wrong-token'},
+        )
+        self.assertEqual((data['results'][0]['price'], status), (100, 'HIT'))
+
+    def test_concurrent_misses_reach_backend_once(self):
+        """Проверка одного запроса к бэкенду при одновременных промахах."""
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            statuses = list(executor.map(
+                lambda _: self.get('/api/v1/categories/')[1], range(8),
+            ))
+        self.assertEqual(statuses.count('MISS'), 1)
+        self.assertEqual(self.gateway.upstream_requests, 1)
+
+    def test_stale_entry_served_while_updating(self):
+        """Проверка ответа устаревшей записью на время обновления."""
+        self.gateway.ttl = 0
+        path = '/api/v1/products/'
+        self.get(path)
+        Product.objects.update(price=70)
+        data, status = self.get(path)
+        self.assertEqual((data['results'][0]['price'], status),
+                         (100, 'UPDATING'))
+        for update in self.gateway.updates:
+            update.join()
+        entry, = self.gateway.entries.values()
+        self.assertEqual(json.loads(entry['body'])['results'][0]['price'], 70)
+        self.assertEqual(self.gateway.upstream_requests, 2)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
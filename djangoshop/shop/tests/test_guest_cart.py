@@ -0,0 +1,156 @@
+import shutil
+import tempfile
+from http import HTTPStatus
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from shop.cart_store import CacheCartStore
+from shop.checks import check_guest_carts
+from shop.models import ProductCart
+from shop.tests.utils import create_category, create_product, create_user
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'guest-cart-tests',
+        }
+    },
+)
+class GuestCartTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.cat_1 = create_category()
+        cls.product_1 = create_product(cls.cat_1, price=123)
+        cls.product_2 = create_product(cls.cat_1, 2)
+        cls.user = create_user()
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.guest_client = APIClient()
+
+    def add(self, product, quantity, client=None):
+        return (client or self.guest_client).post(
+            f'/api/v1/guest-cart/products/{product.pk}/',
+            data={'quantity': quantity},
+        )
+
+    def login(self):
+        return self.guest_client.post('/api-token-auth/', data={
+            'username': 'testuser', 'password': 'testpassword1',
+        })
+
+    def test_guest_cart_kept_in_cache(self):
+        """Проверка гостевой корзины без записей в БД."""
+        response = self.add(GuestCartTestCase.product_1, 2)
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertIn(settings.GUEST_CART_COOKIE, response.cookies)
+        self.add(GuestCartTestCase.product_1, 3)
+        response = self.guest_client.get('/api/v1/guest-cart/')
+        self.assertEqual(response.data, {
+            'products': [
+                {
+                    'product': {'name': 'test_product_1', 'price': 123.0},
+                    'quantity': 5,
+                }
+            ],
+            'full_price': 615.0,
+        })
+        self.assertFalse(ProductCart.objects.exists())
+
+    def test_guest_cart_addressed_by_header(self):
+        """Проверка доступа к гостевой корзине по заголовку."""
+        response = self.add(GuestCartTestCase.product_2, 1)
+        header_client = APIClient()
+        header_client.credentials(
+            HTTP_X_GUEST_CART=response[settings.GUEST_CART_HEADER]
+        )
+        response = header_client.patch(
+            f'/api/v1/guest-cart/products/{GuestCartTestCase.product_2.pk}/',
+            data={'quantity': 4},
+        )
+        self.assertEqual(response.status_code, HTTPStatus.PARTIAL_CONTENT)
+        self.assertEqual(response.data['quantity'], 4)
+
+    def test_forged_guest_cart_id_ignored(self):
+        """Проверка, что неподписанный идентификатор не принимается."""
+        self.add(GuestCartTestCase.product_1, 1)
+        cart_id = self.guest_client.cookies[
+            settings.GUEST_CART_COOKIE
+        ].value.split(':')[0]
+        forged_client = APIClient()
+        forged_client.credentials(HTTP_X_GUEST_CART=f'{cart_id}:forged')
+        response = forged_client.get('/api/v1/guest-cart/')
+        self.assertEqual(response.data['products'], [])
+
+    def test_guest_cart_merged_on_login(self):
+        """Проверка переноса гостевой корзины при получении токена."""
+        ProductCart.objects.create(
+            cart=GuestCartTestCase.user.cart,
+            product=GuestCartTestCase.product_1,
+            quantity=2,
+        )
+        self.add(GuestCartTestCase.product_1, 3)
+        self.add(GuestCartTestCase.product_2, 1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.login()
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertIn('token', response.data)
+        writes = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith(('INSERT', 'UPDATE'))
+            and 'shop_productcart' in query['sql']
+        ]
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(
+            dict(ProductCart.objects.values_list('product_id', 'quantity')),
+            {
+                GuestCartTestCase.product_1.pk: 5,
+                GuestCartTestCase.product_2.pk: 1,
+            },
+        )
+        self.assertEqual(response.cookies[settings.GUEST_CART_COOKIE].value,
+                         '')
+        response = self.guest_client.get('/api/v1/guest-cart/')
+        self.assertEqual(response.data['products'], [])
+
+    @override_settings(CART_STORE='cache')
+    def test_guest_cart_merged_into_cached_cart(self):
+        """Проверка переноса гостевой корзины в корзину в кеше."""
+        self.add(GuestCartTestCase.product_2, 2)
+        self.login()
+        lines = CacheCartStore().lines(GuestCartTestCase.user)
+        self.assertEqual(
+            [(line.product, line.quantity) for line in lines],
+            [(GuestCartTestCase.product_2, 2)],
+        )
+
+    def test_guest_carts_require_shared_cache(self):
+        """Проверка предупреждения о гостевых корзинах в кеше процесса."""
+        self.assertEqual(
+            [warning.id for warning in check_guest_carts(None)],
+            ['shop.W002'],
+        )
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': 'redis://localhost:6379/0',
+        }}):
+            self.assertEqual(check_guest_carts(None), [])
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
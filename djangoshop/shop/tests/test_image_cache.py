@@ -0,0 +1,188 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http import HTTPStatus
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from shop.image_cache import ImageCache
+from shop.models import Category, Product, ProductImage
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+class ImageCacheTestCase(SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_concurrent_requests_render_once(self):
+        """Проверка, что 100 одновременных запросов одной копии
+        создают её один раз."""
+        cache = ImageCache(self.root, max_bytes=10 ** 6)
+        path = cache.path_for('products', 1, 200, 'webp')
+        calls = []
+
+        def render():
+            calls.append(1)
+            time.sleep(0.05)
+            return b'data'
+
+        threads = [
+            threading.Thread(target=cache.get_or_create, args=(path, render))
+            for _ in range(100)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        with open(path, 'rb') as file:
+            self.assertEqual(file.read(), b'data')
+
+    def test_least_recently_used_files_evicted(self):
+        """Проверка вытеснения давно не использованных файлов
+        при превышении размера кэша: чтение мимо Django (nginx)
+        отмечено в atime, обращение через кэш отмечается явно."""
+        cache = ImageCache(self.root, max_bytes=450, low_watermark=0.7)
+        paths = [cache.path_for('products', pk, 200, 'jpg')
+                 for pk in range(4)]
+        for num, path in enumerate(paths):
+            cache.get_or_create(path, lambda: b'x' * 100)
+            os.utime(path, (num, num))
+        # Файл прочитал nginx, ядро обновило atime.
+        os.utime(paths[0], (10, 0))
+        cache.get_or_create(paths[1], lambda: b'x' * 100)
+        cache.get_or_create(
+            cache.path_for('products', 4, 200, 'jpg'), lambda: b'x' * 100
+        )
+        self.assertTrue(os.path.exists(paths[0]))
+        self.assertTrue(os.path.exists(paths[1]))
+        self.assertFalse(os.path.exists(paths[2]))
+        self.assertFalse(os.path.exists(paths[3]))
+        self.assertEqual(os.stat(paths[1]).st_mtime, 1)
+        self.assertEqual(cache.size(), 300)
+
+    def test_size_shared_between_processes(self):
+        """Проверка общего ограничения размера для кэшей нескольких
+        процессов с одним каталогом."""
+        workers = [ImageCache(self.root, max_bytes=350) for _ in range(4)]
+        for pk, cache in enumerate(workers):
+            cache.get_or_create(
+                cache.path_for('products', pk, 200, 'jpg'),
+                lambda: b'x' * 100,
+            )
+        disk_size = sum(
+            os.path.getsize(os.path.join(directory, name))
+            for directory, _, names in os.walk(self.root)
+            for name in names if not name.startswith('.')
+        )
+        self.assertLessEqual(disk_size, 350)
+        for cache in workers:
+            self.assertEqual(cache.size(), disk_size)
+
+    def test_invalidate_reduces_size(self):
+        """Проверка уменьшения размера кэша при удалении копий."""
+        cache = ImageCache(self.root, max_bytes=10 ** 6)
+        for width in (100, 200):
+            cache.get_or_create(
+                cache.path_for('products', 1, width, 'jpg'),
+                lambda: b'x' * 100,
+            )
+        cache.invalidate('products', 1)
+        self.assertEqual(ImageCache(self.root, max_bytes=10 ** 6).size(), 0)
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    IMAGE_RESIZE_WIDTHS=[100, 300],
+)
+class ImageResizeViewTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        content = BytesIO()
+        Image.new('RGB', (600, 300)).save(content, 'PNG')
+        image = SimpleUploadedFile('banner.png', content.getvalue(),
+                                   content_type='image/png')
+        cls.cat_1 = Category.objects.create(
+            name='test_category_1',
+            slug='testcat1',
+            image=image,
+        )
+        cls.product_1 = Product.objects.create(
+            name='test_product_1',
+            slug='testprod1',
+            price=123,
+            category=cls.cat_1,
+        )
+        cls.product_1_image = ProductImage.objects.create(
+            image=image,
+            product=cls.product_1,
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.anon_client = APIClient()
+
+    def test_resized_image_cached_on_disk(self):
+        """Проверка создания копии и её размещения по пути для nginx."""
+        pk = ImageResizeViewTestCase.cat_1.pk
+        response = self.anon_client.get(
+            f'/api/v1/images/categories/{pk}/w100.webp'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        with Image.open(BytesIO(b''.join(response.streaming_content))) as im:
+            self.assertEqual(im.size, (100, 50))
+        cached_path = os.path.join(
+            TEMP_MEDIA_ROOT, 'cache', 'categories', str(pk), 'w100.webp'
+        )
+        self.assertTrue(os.path.exists(cached_path))
+
+    def test_not_whitelisted_sizes_rejected(self):
+        """Проверка отказа для неразрешённых ширины, формата и вида."""
+        pk = ImageResizeViewTestCase.product_1_image.pk
+        addresses = (
+            f'/api/v1/images/products/{pk}/w101.webp',
+            f'/api/v1/images/products/{pk}/w100.gif',
+            f'/api/v1/images/users/{pk}/w100.jpg',
+            '/api/v1/images/products/999/w100.jpg',
+        )
+        for address in addresses:
+            with self.subTest(address=address):
+                response = self.anon_client.get(address)
+                self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_cache_invalidated_on_image_change(self):
+        """Проверка удаления копий после изменения объекта."""
+        image = ImageResizeViewTestCase.product_1_image
+        response = self.anon_client.get(
+            f'/api/v1/images/products/{image.pk}/w300.jpg'
+        )
+        response.close()
+        cached_dir = os.path.join(
+            TEMP_MEDIA_ROOT, 'cache', 'products', str(image.pk)
+        )
+        self.assertTrue(os.path.isdir(cached_dir))
+        image.save()
+        self.assertFalse(os.path.exists(cached_dir))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
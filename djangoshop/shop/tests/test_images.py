@@ -0,0 +1,118 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from shop.images import generate_variants, variant_name
+from shop.models import Category, Product, ProductImage
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def make_image(name, size=(1000, 500)):
+    content = BytesIO()
+    Image.new('RGB', size, color=(200, 10, 10)).save(content, 'PNG')
+    return SimpleUploadedFile(name, content.getvalue(),
+                              content_type='image/png')
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    IMAGE_VARIANT_WIDTHS=[200, 400],
+    IMAGE_VARIANTS_ASYNC=False,
+)
+class ImageVariantsTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.anon_client = APIClient()
+
+    def create_category(self, size=(1000, 500)):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Category.objects.create(
+                name='test_category_1',
+                slug='testcat1',
+                image=make_image('banner.png', size),
+            )
+
+    def test_variants_created_on_save(self):
+        """Проверка создания копий нужной ширины в JPEG и WebP."""
+        category = self.create_category()
+        for width in (200, 400):
+            for extension, image_format in (('jpg', 'JPEG'),
+                                            ('webp', 'WEBP')):
+                with self.subTest(width=width, extension=extension):
+                    path = os.path.join(
+                        TEMP_MEDIA_ROOT,
+                        variant_name(category.image.name, width, extension),
+                    )
+                    with Image.open(path) as variant:
+                        self.assertEqual(variant.format, image_format)
+                        self.assertEqual(variant.size, (width, width // 2))
+
+    def test_small_image_is_not_upscaled(self):
+        """Проверка, что маленькое изображение не увеличивается."""
+        category = self.create_category(size=(100, 50))
+        path = os.path.join(
+            TEMP_MEDIA_ROOT, variant_name(category.image.name, 400, 'webp')
+        )
+        with Image.open(path) as variant:
+            self.assertEqual(variant.size, (100, 50))
+
+    def test_concurrent_variants_keep_their_names(self):
+        """
+        Проверка, что копия, созданная одновременно другим процессом,
+        заменяется, а не сохраняется второй раз с суффиксом.
+        """
+        category = self.create_category()
+        directory = os.path.dirname(
+            os.path.join(TEMP_MEDIA_ROOT, category.image.name)
+        )
+        files = sorted(os.listdir(directory))
+        storage = FileSystemStorage()
+        with mock.patch.object(storage, 'exists', return_value=False):
+            generate_variants(category.image.name, storage=storage)
+        self.assertEqual(sorted(os.listdir(directory)), files)
+
+    def test_serializers_expose_variant_urls(self):
+        """Проверка ссылок на копии в ответах API."""
+        category = self.create_category()
+        product = Product.objects.create(
+            name='test_product_1',
+            slug='testprod1',
+            price=1,
+            category=category,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            product_image = ProductImage.objects.create(
+                image=make_image('photo.png'), product=product,
+            )
+        response = self.anon_client.get('/api/v1/categories/')
+        variants = response.data['results'][0]['image_variants']
+        self.assertEqual(set(variants), {'200', '400'})
+        self.assertEqual(
+            variants['200']['webp'],
+            'http://testserver/media/'
+            + variant_name(category.image.name, 200, 'webp'),
+        )
+        response = self.anon_client.get(f'/api/v1/products/{product.pk}/')
+        image_data = response.data['images'][0]
+        self.assertTrue(
+            image_data['image_variants']['400']['jpg'].endswith(
+                variant_name(product_image.image.name, 400, 'jpg')
+            )
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
@@ -0,0 +1,165 @@
+import io
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+
+from shop.catalog_import import CatalogImporter, read_rows
+from shop.models import Product
+from shop.tests.utils import (
+    create_category, create_product, create_subcategory,
+)
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class CatalogImportTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.cat_1 = create_category()
+        cls.subcat_1 = create_subcategory(cls.cat_1)
+        cls.product_1 = create_product(cls.cat_1, price=123)
+
+    def test_csv_import_upserts_by_slug(self):
+        """Проверка создания новых и обновления существующих продуктов."""
+        stream = io.StringIO(
+            'name,slug,price,category,subcategory\n'
+            'renamed,testprod1,321,testcat1,\n'
+            'new product,testprod2,10.5,,testsubcat1\n'
+        )
+        report = CatalogImporter(batch_size=1).run(read_rows(stream, 'csv'))
+        self.assertEqual(report.upserted, 2)
+        self.assertEqual(report.rejected_count, 0)
+        self.assertEqual(Product.objects.count(), 2)
+        product_1 = Product.objects.get(slug='testprod1')
+        self.assertEqual(product_1.pk, CatalogImportTestCase.product_1.pk)
+        self.assertEqual(product_1.name, 'renamed')
+        self.assertEqual(product_1.price, 321)
+        product_2 = Product.objects.get(slug='testprod2')
+        self.assertEqual(product_2.subcategory, CatalogImportTestCase.subcat_1)
+        self.assertIsNone(product_2.category)
+
+    def test_invalid_rows_are_rejected(self):
+        """Проверка отклонения строк, не прошедших валидацию."""
+        stream = io.StringIO(
+            '{"name": "no category", "slug": "p1", "price": 1}\n'
+            '{"name": "bad price", "slug": "p2", "price": "x",'
+            ' "category": "testcat1"}\n'
+            '{"name": "bad slug", "slug": "p 3", "price": 1,'
+            ' "category": "testcat1"}\n'
+            '{"name": "unknown", "slug": "p4", "price": 1,'
+            ' "category": "missing"}\n'
+            'not json\n'
+            '{"name": "ok", "slug": "p5", "price": 1,'
+            ' "category": "testcat1"}\n'
+        )
+        report = CatalogImporter().run(read_rows(stream, 'jsonl'))
+        rejected_lines = [line_num for line_num, _ in report.rejected]
+        self.assertEqual(rejected_lines, [1, 2, 3, 4, 5])
+        self.assertEqual(report.processed, 6)
+        self.assertTrue(Product.objects.filter(slug='p5').exists())
+
+    def test_rejected_rows_are_limited(self):
+        """
+        Проверка, что отчёт считает все отклонённые строки, а хранит
+        только первые rejected_limit.
+        """
+        stream = io.StringIO(
+            'name,slug,price,category,subcategory\n'
+            + ''.join(f'bad {number},p{number},x,testcat1,\n'
+                      for number in range(5))
+        )
+        report = CatalogImporter(batch_size=2, rejected_limit=3).run(
+            read_rows(stream, 'csv'),
+        )
+        self.assertEqual(report.rejected_count, 5)
+        self.assertEqual(
+            [line_num for line_num, _ in report.rejected], [2, 3, 4],
+        )
+
+    def test_non_string_values_are_rejected(self):
+        """Проверка отклонения строк JSONL с нестроковыми значениями."""
+        stream = io.StringIO(
+            '{"name": 5, "slug": 7, "price": 1, "category": "testcat1"}\n'
+            '{"name": "list", "slug": "p2", "price": 1,'
+            ' "category": ["testcat1"]}\n'
+            '{"name": "object", "slug": "p3", "price": 1,'
+            ' "subcategory": {"slug": "x"}}\n'
+            '{"name": "ok", "slug": "p4", "price": 1,'
+            ' "category": "testcat1"}\n'
+        )
+        report = CatalogImporter().run(read_rows(stream, 'jsonl'))
+        self.assertEqual(report.rejected, [
+            (1, "Поле name должно быть строкой. "
+                "Поле slug должно быть строкой."),
+            (2, "Поле category должно быть строкой."),
+            (3, "Поле subcategory должно быть строкой."),
+        ])
+        self.assertEqual(report.upserted, 1)
+
+    def test_duplicate_slug_in_batch_keeps_last_row(self):
+        """Проверка, что при повторе slug в пачке записывается последняя
+        строка."""
+        stream = io.StringIO(
+            'name,slug,price,category,subcategory\n'
+            'first,dup,1,testcat1,\n'
+            'second,dup,2,testcat1,\n'
+        )
+        CatalogImporter().run(read_rows(stream, 'csv'))
+        self.assertEqual(Product.objects.get(slug='dup').name, 'second')
+
+    def test_command_dry_run_reports_without_writing(self):
+        """Проверка отчёта команды в режиме dry-run."""
+        path = f'{TEMP_MEDIA_ROOT}/catalog.csv'
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(
+                'name,slug,price,category,subcategory\n'
+                'new,testprod9,1,testcat1,\n'
+                'broken,,1,testcat1,\n'
+            )
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_catalog', path, '--dry-run',
+                     stdout=out, stderr=err)
+        self.assertIn('Обработано строк: 2', out.getvalue())
+        self.assertIn('прошло проверку: 1', out.getvalue())
+        self.assertNotIn('записано', out.getvalue())
+        self.assertIn('отклонено: 1', out.getvalue())
+        self.assertIn('Строка 3', err.getvalue())
+        self.assertFalse(Product.objects.filter(slug='testprod9').exists())
+
+    def test_command_skips_byte_order_mark(self):
+        """Проверка импорта CSV в UTF-8 с BOM в начале файла."""
+        path = f'{TEMP_MEDIA_ROOT}/catalog_bom.csv'
+        with open(path, 'w', encoding='utf-8-sig') as file:
+            file.write(
+                'name,slug,price,category,subcategory\n'
+                'продукт,testprod9,1,testcat1,\n'
+            )
+        call_command('import_catalog', path,
+                     stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(
+            Product.objects.get(slug='testprod9').name, 'продукт',
+        )
+
+    def test_command_rejects_non_utf8_file(self):
+        """Проверка ошибки команды с номером строки не в UTF-8."""
+        path = f'{TEMP_MEDIA_ROOT}/catalog_cp1251.csv'
+        with open(path, 'wb') as file:
+            file.write(
+                'name,slug,price,category,subcategory\n'
+                'продукт,testprod9,1,testcat1,\n'.encode('cp1251')
+            )
+        with self.assertRaisesMessage(CommandError, f'{path}, строка 2'):
+            call_command('import_catalog', path,
+                         stdout=io.StringIO(), stderr=io.StringIO())
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
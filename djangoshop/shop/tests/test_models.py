@@ -1,7 +1,9 @@
 import tempfile
 import shutil
+from io import StringIO
 
 from django.conf import settings
+from django.core.management import call_command
 from django.db import IntegrityError, transaction
 from django.test import TestCase, override_settings
 from django.core.files.uploadedfile import SimpleUploadedFile
@@ -358,9 +360,7 @@ class CartTestCase(TestCase):
             email='test@example.com',
             password='testpassword1',
         )
-        cls.cart = Cart.objects.create(
-            user=cls.user,
-        )
+        cls.cart = cls.user.cart
         cls.product_1_cart = ProductCart.objects.create(
             cart=cls.cart,
             product=cls.product_1,
@@ -402,6 +402,23 @@ class CartTestCase(TestCase):
                     expected_data[field]
                 )
 
+    def test_cart_created_with_user(self):
+        """Проверка создания корзины вместе с пользователем."""
+        user = User.objects.create_user(username='newuser')
+        self.assertTrue(Cart.objects.filter(user=user).exists())
+
+    def test_create_carts_command_backfills_missing_carts(self):
+        """Проверка создания недостающих корзин командой."""
+        users = [
+            User.objects.create_user(username=f'user_{number}')
+            for number in range(3)
+        ]
+        Cart.objects.filter(user__in=users).delete()
+        call_command('create_carts', batch_size=2, stdout=StringIO())
+        self.assertEqual(
+            Cart.objects.filter(user__in=users).count(), len(users)
+        )
+
     def test_cannot_add_duplicate_product_carts(self):
         """Проверка невозможности создать несколько
         объектов с одинаковым продуктом."""
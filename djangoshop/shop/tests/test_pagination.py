@@ -0,0 +1,145 @@
+import shutil
+import tempfile
+from http import HTTPStatus
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from shop.checks import check_product_count_mode
+from shop.models import Product
+from shop.signals import catalog_changed
+from shop.tests.utils import create_category
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'pagination-tests',
+        }
+    },
+)
+class CountModePaginationTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.cat_1 = create_category()
+        cls.products = Product.objects.bulk_create(
+            Product(
+                name=f'test_product_{num}',
+                slug=f'testprod{num}',
+                price=num,
+                category=cls.cat_1,
+            )
+            for num in range(1, 16)
+        )
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.anon_client = APIClient()
+
+    def count_queries(self, address, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.anon_client.get(address, params)
+        return response, [
+            query['sql'] for query in queries.captured_queries
+            if 'COUNT(' in query['sql']
+        ]
+
+    @override_settings(PRODUCT_COUNT_MODE='cached')
+    def test_product_count_cached_until_catalog_changes(self):
+        """Проверка кеширования числа продуктов до изменения каталога."""
+        response, counts = self.count_queries('/api/v1/products/')
+        self.assertEqual((response.data['count'], len(counts)), (15, 1))
+        response, counts = self.count_queries('/api/v1/products/')
+        self.assertEqual((response.data['count'], len(counts)), (15, 0))
+        product = Product.objects.create(
+            name='new_product', slug='newprod', price=1,
+            category=CountModePaginationTestCase.cat_1,
+        )
+        catalog_changed.send(sender=Product, product_ids=[product.pk])
+        response, counts = self.count_queries('/api/v1/products/')
+        self.assertEqual((response.data['count'], len(counts)), (16, 1))
+
+    @override_settings(PRODUCT_COUNT_MODE='exact')
+    def test_product_count_exact_without_shared_cache(self):
+        """Проверка точного подсчёта продуктов без общего кеша."""
+        for _ in range(2):
+            response, counts = self.count_queries('/api/v1/products/')
+            self.assertEqual((response.data['count'], len(counts)), (15, 1))
+        self.assertEqual(
+            [warning.id for warning in check_product_count_mode(None)], [],
+        )
+        with override_settings(PRODUCT_COUNT_MODE='cached'):
+            self.assertEqual(
+                [warning.id for warning in check_product_count_mode(None)],
+                ['shop.W001'],
+            )
+
+    def test_no_count_mode_reports_has_next(self):
+        """Проверка режима без подсчёта с признаком has_next."""
+        response, counts = self.count_queries(
+            '/api/v1/products/', {'count': 'none', 'limit': 10},
+        )
+        self.assertEqual(counts, [])
+        self.assertNotIn('count', response.data)
+        self.assertTrue(response.data['has_next'])
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertIn('offset=10', response.data['next'])
+        response = self.anon_client.get(
+            '/api/v1/products/', {'count': 'none', 'limit': 10, 'offset': 10},
+        )
+        self.assertFalse(response.data['has_next'])
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(len(response.data['results']), 5)
+
+    @override_settings(ESTIMATED_COUNT_THRESHOLD=10)
+    def test_estimated_count_for_unfiltered_list(self):
+        """Проверка оценки числа строк по статистике БД."""
+        Product.objects.filter(
+            pk=CountModePaginationTestCase.products[0].pk,
+        ).delete()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        response, counts = self.count_queries(
+            '/api/v1/products/', {'count': 'estimated'},
+        )
+        self.assertEqual(counts, [])
+        self.assertEqual(response.data['count'], 14)
+
+    @override_settings(ESTIMATED_COUNT_THRESHOLD=10)
+    def test_exact_count_without_statistics(self):
+        """Проверка точного подсчёта, пока БД не собрала статистику."""
+        Product.objects.filter(
+            pk=CountModePaginationTestCase.products[-1].pk,
+        ).delete()
+        response, counts = self.count_queries(
+            '/api/v1/products/', {'count': 'estimated'},
+        )
+        self.assertEqual((response.data['count'], len(counts)), (14, 1))
+
+    def test_other_lists_count_exactly(self):
+        """Проверка точного подсчёта в списках по умолчанию."""
+        for _ in range(2):
+            response, counts = self.count_queries('/api/v1/categories/')
+            self.assertEqual((response.data['count'], len(counts)), (1, 1))
+
+    def test_unknown_count_mode_rejected(self):
+        """Проверка ошибки при неизвестном режиме подсчёта."""
+        response = self.anon_client.get('/api/v1/products/', {'count': 'x'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
@@ -0,0 +1,162 @@
+import shutil
+import tempfile
+from http import HTTPStatus
+from unittest import mock
+
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from shop import popularity
+from shop.models import PopularProduct, ProductStats
+from shop.popularity import PopularityCounters, build_popular, write_events
+from shop.tests.utils import create_category, create_product, create_user
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+HALF_LIFE = 100
+STARTED_AT = 1_000_000
+
+
+class StopFlusher(BaseException):
+    """Останавливает бесконечный цикл фоновой записи в тесте."""
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    POPULARITY_FLUSH_INTERVAL=0,
+    POPULARITY_HALF_LIFE=HALF_LIFE,
+    POPULARITY_CART_WEIGHT=5,
+)
+class PopularityTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.cat_1 = create_category()
+        cls.products = [
+            create_product(cls.cat_1, number, price=10 * (number + 1))
+            for number in range(4)
+        ]
+        cls.user = create_user()
+
+    def setUp(self):
+        super().setUp()
+        # Счётчики процесса хранят события других тестов.
+        self.saved_counters = popularity.counters
+        popularity.counters = PopularityCounters()
+        self.client = APIClient()
+
+    def tearDown(self):
+        popularity.counters = self.saved_counters
+        super().tearDown()
+
+    def stats(self, product):
+        return ProductStats.objects.filter(product=product).values_list(
+            'views', 'cart_adds', 'score',
+        ).get()
+
+    def test_events_counted_in_memory(self):
+        """Проверка подсчёта просмотров и корзин без записи в БД."""
+        product = PopularityTestCase.products[0]
+        for _ in range(3):
+            response = self.client.get(f'/api/v1/products/{product.pk}/')
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.client.get('/api/v1/products/999/')
+        self.client.force_authenticate(PopularityTestCase.user)
+        self.client.post(f'/api/v1/products/{product.pk}/cart/',
+                         data={'quantity': 2})
+        self.assertEqual(
+            popularity.counters.pending(), {product.pk: (3, 1)},
+        )
+        self.assertFalse(ProductStats.objects.exists())
+        self.assertEqual(popularity.counters.flush(STARTED_AT), 1)
+        self.assertEqual(self.stats(product), (3, 1, 8))
+        self.assertEqual(popularity.counters.pending(), {})
+
+    def test_flush_thread_survives_errors(self):
+        """
+        Проверка, что ошибка записи не останавливает фоновый поток,
+        а события записываются следующей попыткой.
+        """
+        product = PopularityTestCase.products[0]
+        counters = PopularityCounters()
+        counters.add(product.pk, views=2)
+        attempts = [RuntimeError("Нет соединения."), STARTED_AT]
+
+        def flaky_write(events, now=None):
+            attempt = attempts.pop(0)
+            if isinstance(attempt, Exception):
+                raise attempt
+            return write_events(events, attempt)
+
+        with mock.patch('shop.popularity.write_events', flaky_write), \
+                mock.patch('shop.popularity.close_old_connections'), \
+                mock.patch('shop.popularity.time.sleep',
+                           side_effect=[None, None, StopFlusher]), \
+                self.assertLogs('shop.popularity', 'WARNING'), \
+                self.assertRaises(StopFlusher):
+            counters._run()
+        self.assertEqual(self.stats(product)[:2], (2, 0))
+        self.assertEqual(counters.pending(), {})
+
+    def test_flush_statements_do_not_depend_on_products(self):
+        """Проверка записи событий пакетом и пропуска удалённых продуктов."""
+        counts = []
+        for products in ([PopularityTestCase.products[0]],
+                         PopularityTestCase.products):
+            counters = PopularityCounters()
+            for product in products:
+                counters.add(product.pk, views=1)
+            counters.add(999, views=1)
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(counters.flush(STARTED_AT), len(products))
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(
+            self.stats(PopularityTestCase.products[0]), (2, 0, 2),
+        )
+
+    def test_scores_decay_with_half_life(self):
+        """Проверка затухания популярности вдвое за период."""
+        first, second = PopularityTestCase.products[:2]
+        write_events({first.pk: (4, 0)}, STARTED_AT)
+        write_events({first.pk: (4, 0), second.pk: (0, 1)},
+                     STARTED_AT + HALF_LIFE)
+        self.assertAlmostEqual(self.stats(first)[2], 4 * 0.5 + 4)
+        self.assertEqual(
+            build_popular(now=STARTED_AT + 2 * HALF_LIFE), 2,
+        )
+        self.assertEqual(
+            list(PopularProduct.objects.order_by('rank').values_list(
+                'product_id', 'score',
+            )),
+            [(first.pk, 3.0), (second.pk, 2.5)],
+        )
+        self.assertEqual(
+            build_popular(now=STARTED_AT + 2000 * HALF_LIFE), 0,
+        )
+
+    def test_popular_listing(self):
+        """Проверка списка продуктов в порядке рейтинга."""
+        products = PopularityTestCase.products
+        write_events({
+            products[0].pk: (1, 0),
+            products[2].pk: (0, 2),
+            products[3].pk: (4, 0),
+        }, STARTED_AT)
+        build_popular(top=2, now=STARTED_AT)
+        response = self.client.get('/api/v1/products/popular/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(
+            [product['name'] for product in response.data['results']],
+            ['test_product_2', 'test_product_3'],
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
@@ -0,0 +1,94 @@
+import shutil
+import tempfile
+from http import HTTPStatus
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from shop.models import ProductCart, RelatedProduct
+from shop.related import build_related
+from shop.tests.utils import create_category, create_product
+from users.models import User
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class RelatedProductsTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.cat_1 = create_category()
+        cls.products = [
+            create_product(cls.cat_1, number, price=10 * (number + 1))
+            for number in range(4)
+        ]
+        a, b, c, d = cls.products
+        # a и b лежат вместе во всех четырёх корзинах, c — в трёх,
+        # d — только в самой большой.
+        baskets = [(a, b), (a, b, c), (a, b, c), (a, b, c, d)]
+        for number, basket in enumerate(baskets):
+            user = User.objects.create_user(
+                username=f'testuser{number}',
+                email=f'test{number}@example.com',
+            )
+            ProductCart.objects.bulk_create([
+                ProductCart(cart=user.cart, product=product, quantity=1)
+                for product in basket
+            ])
+
+    def related(self, product):
+        return list(RelatedProduct.objects.filter(
+            product=product,
+        ).order_by('rank').values_list('related_id', 'score'))
+
+    def test_products_ranked_by_shared_carts(self):
+        """Проверка порядка рекомендаций по числу общих корзин."""
+        a, b, c, d = RelatedProductsTestCase.products
+        self.assertEqual(build_related(top=10, max_cart_size=10), 12)
+        self.assertEqual(
+            self.related(a), [(b.pk, 4), (c.pk, 3), (d.pk, 1)],
+        )
+        self.assertEqual(
+            self.related(c), [(a.pk, 3), (b.pk, 3), (d.pk, 1)],
+        )
+
+    def test_top_and_cart_size_limits(self):
+        """Проверка ограничения числа рекомендаций и размера корзин."""
+        a, b, c, d = RelatedProductsTestCase.products
+        build_related(top=1, max_cart_size=3)
+        self.assertEqual(self.related(a), [(b.pk, 3)])
+        self.assertEqual(self.related(d), [])
+
+    def test_rebuild_replaces_recommendations(self):
+        """Проверка замены рекомендаций при пересборке."""
+        a, b, c, d = RelatedProductsTestCase.products
+        build_related(top=10, max_cart_size=10)
+        ProductCart.objects.filter(product=b).delete()
+        build_related(top=10, max_cart_size=10)
+        self.assertEqual(self.related(a), [(c.pk, 3), (d.pk, 1)])
+
+    def test_related_action_uses_one_query(self):
+        """Проверка выдачи рекомендаций одним запросом."""
+        a, b, c, d = RelatedProductsTestCase.products
+        build_related(top=10, max_cart_size=10)
+        client = APIClient()
+        with self.assertNumQueries(1):
+            response = client.get(f'/api/v1/products/{a.pk}/related/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(
+            [(item['id'], item['name'], item['score'])
+             for item in response.data],
+            [(b.pk, 'test_product_1', 4), (c.pk, 'test_product_2', 3),
+             (d.pk, 'test_product_3', 1)],
+        )
+        response = client.get('/api/v1/products/999/related/')
+        self.assertEqual(response.data, [])
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
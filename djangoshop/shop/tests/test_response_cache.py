@@ -0,0 +1,183 @@
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from api.response_cache import ResponseCache
+from shop.catalog_cache import bump_catalog_version
+from shop.checks import check_response_cache
+from shop.models import Product
+from shop.tests.utils import create_category, create_product
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+CACHE_SETTINGS = {
+    'CACHES': {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'response-cache-tests',
+        }
+    },
+    'RESPONSE_CACHE_TIMEOUT': 60,
+    'RESPONSE_CACHE_STALE': 30,
+    'RESPONSE_CACHE_WAIT': 5,
+}
+
+
+@override_settings(**CACHE_SETTINGS)
+class ResponseCacheTestCase(SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.store = ResponseCache()
+        self.calls = 0
+        self.calls_lock = threading.Lock()
+
+    def compute(self, value='value', delay=0):
+        def compute():
+            with self.calls_lock:
+                self.calls += 1
+            time.sleep(delay)
+            return value
+        return compute
+
+    def expire(self, key, stale_for):
+        entry = cache.get(key)
+        entry['fresh_until'] = time.time() - 1
+        entry['stale_until'] = time.time() + stale_for
+        cache.set(key, entry)
+
+    def test_concurrent_misses_computed_once(self):
+        """Проверка одного вычисления при одновременных промахах."""
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(
+                lambda _: self.store.get_or_compute(
+                    'key', self.compute(delay=0.3),
+                ),
+                range(8),
+            ))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual([value for value, _ in results], ['value'] * 8)
+        self.assertEqual(
+            sorted(state for _, state in results),
+            ['computed'] + ['fresh'] * 7,
+        )
+
+    def test_expired_lock_not_released_by_old_holder(self):
+        """
+        Проверка, что вычисление дольше RESPONSE_CACHE_LOCK_TIMEOUT
+        не снимает блокировку, которую после него взял другой процесс.
+        """
+        def compute():
+            # Блокировка истекла, и её взял другой воркер.
+            cache.set('key:lock', 'other-worker')
+            return 'value'
+
+        self.store.get_or_compute('key', compute)
+        self.assertEqual(cache.get('key:lock'), 'other-worker')
+
+    def test_stale_value_served_while_refreshing(self):
+        """Проверка устаревшего значения на время обновления."""
+        self.store.get_or_compute('key', self.compute('old'))
+        self.expire('key', stale_for=30)
+        cache.add('key:lock', 'other-worker')
+        self.assertEqual(
+            self.store.get_or_compute('key', self.compute('new')),
+            ('old', 'stale'),
+        )
+        cache.delete('key:lock')
+        self.assertEqual(
+            self.store.get_or_compute('key', self.compute('new')),
+            ('new', 'computed'),
+        )
+        self.assertEqual(self.calls, 2)
+
+    @override_settings(RESPONSE_CACHE_WAIT=0)
+    def test_staleness_is_bounded(self):
+        """Проверка, что слишком старое значение не отдаётся."""
+        self.store.get_or_compute('key', self.compute('old'))
+        self.expire('key', stale_for=-1)
+        cache.add('key:lock', 'other-worker')
+        self.assertEqual(
+            self.store.get_or_compute('key', self.compute('new')),
+            ('new', 'computed'),
+        )
+
+    def test_response_cache_requires_shared_cache(self):
+        """Проверка ошибки настроек кеша ответов в кеше процесса."""
+        self.assertEqual(
+            [error.id for error in check_response_cache(None)],
+            ['shop.E003'],
+        )
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': 'redis://localhost:6379/0',
+        }}):
+            self.assertEqual(check_response_cache(None), [])
+        with override_settings(RESPONSE_CACHE_TIMEOUT=0):
+            self.assertEqual(check_response_cache(None), [])
+
+    def test_catalog_change_makes_value_stale(self):
+        """Проверка устаревания значения после изменения каталога."""
+        self.store.get_or_compute('key', self.compute('old'))
+        bump_catalog_version()
+        cache.add('key:lock', 'other-worker')
+        self.assertEqual(
+            self.store.get_or_compute('key', self.compute('new')),
+            ('old', 'stale'),
+        )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, **CACHE_SETTINGS)
+class CachedCatalogViewsTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.cat_1 = create_category()
+        cls.product_1 = create_product(cls.cat_1, price=123)
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.anon_client = APIClient()
+
+    def test_catalog_response_served_from_cache(self):
+        """Проверка ответа из кеша без запросов к БД."""
+        product = CachedCatalogViewsTestCase.product_1
+        address = f'/api/v1/products/{product.pk}/'
+        response = self.anon_client.get(address)
+        self.assertEqual(response['X-Response-Cache'], 'computed')
+        with self.assertNumQueries(0):
+            response = self.anon_client.get(address)
+        self.assertEqual(response['X-Response-Cache'], 'fresh')
+        self.assertEqual(response.data['price'], 123)
+
+    def test_catalog_change_refreshes_response(self):
+        """Проверка пересчёта ответа после изменения каталога."""
+        self.anon_client.get('/api/v1/products/')
+        Product.objects.update(price=50)
+        bump_catalog_version()
+        response = self.anon_client.get('/api/v1/products/')
+        self.assertEqual(response['X-Response-Cache'], 'computed')
+        self.assertEqual(response.data['results'][0]['price'], 50)
+
+    def test_missing_object_not_cached(self):
+        """Проверка, что ошибка 404 не попадает в кеш."""
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                response = self.anon_client.get('/api/v1/products/999/')
+            self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
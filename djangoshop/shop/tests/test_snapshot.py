@@ -0,0 +1,156 @@
+import json
+import os
+import shutil
+import tempfile
+from http import HTTPStatus
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from api import snapshot
+from api.snapshot import CatalogSnapshot, build_snapshot, get_snapshot
+from shop.catalog_cache import bump_catalog_version
+from shop.checks import check_catalog_snapshot
+from shop.models import Product, ProductImage
+from shop.tests.utils import (
+    create_category, create_product, create_subcategory, image_file,
+)
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SNAPSHOT_PATH = os.path.join(TEMP_MEDIA_ROOT, 'catalog.snapshot')
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    CATALOG_SNAPSHOT_PATH=SNAPSHOT_PATH,
+    CATALOG_SNAPSHOT_CHECK_INTERVAL=0,
+    CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'snapshot-tests',
+    }},
+)
+class CatalogSnapshotTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.cat_1 = create_category()
+        cls.subcat_1 = create_subcategory(cls.cat_1)
+        cls.products = [
+            create_product(
+                cls.cat_1, number, price=100 + number,
+                subcategory=cls.subcat_1,
+            )
+            for number in range(3)
+        ]
+        ProductImage.objects.create(
+            product=cls.products[0], image=image_file(),
+        )
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.anon_client = APIClient()
+        build_snapshot(SNAPSHOT_PATH)
+
+    def fetch(self, address, **settings_overrides):
+        with override_settings(CATALOG_SNAPSHOT_PATH='',
+                               **settings_overrides):
+            return self.anon_client.get(address)
+
+    def test_snapshot_matches_api(self):
+        """Проверка совпадения ответов из снимка и через ORM."""
+        product = CatalogSnapshotTestCase.products[0]
+        for address in (
+            f'/api/v1/products/{product.pk}/',
+            f'/api/v1/categories/{CatalogSnapshotTestCase.cat_1.pk}/',
+            f'/api/v1/subcategories/{CatalogSnapshotTestCase.subcat_1.pk}/',
+            '/api/v1/products/?limit=2&offset=1',
+            '/api/v1/products/?count=none&limit=2',
+            '/api/v1/categories/',
+        ):
+            with self.subTest(address=address):
+                response = self.anon_client.get(address)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertEqual(
+                    json.loads(response.content),
+                    json.loads(self.fetch(address).content),
+                )
+
+    def test_snapshot_served_without_queries(self):
+        """Проверка ответа из снимка без запросов к БД."""
+        product = CatalogSnapshotTestCase.products[0]
+        with self.assertNumQueries(0):
+            response = self.anon_client.get(f'/api/v1/products/{product.pk}/')
+            self.anon_client.get('/api/v1/products/')
+        data = json.loads(response.content)
+        self.assertEqual(data['price'], 100)
+        self.assertTrue(
+            data['images'][0]['image'].startswith('http://testserver/')
+        )
+
+    def test_lookup_by_slug(self):
+        """Проверка поиска объектов снимка по slug."""
+        catalog = CatalogSnapshot(SNAPSHOT_PATH)
+        for product in CatalogSnapshotTestCase.products:
+            fragment = catalog.get_by_slug('products', product.slug)
+            self.assertEqual(json.loads(fragment)['id'], product.pk)
+        self.assertIsNone(catalog.get_by_slug('products', 'missing'))
+        self.assertIsNone(catalog.get('products', 999))
+
+    def test_outdated_snapshot_not_used(self):
+        """Проверка обычного ответа, пока снимок не пересобран."""
+        product = CatalogSnapshotTestCase.products[0]
+        address = f'/api/v1/products/{product.pk}/'
+        Product.objects.filter(pk=product.pk).update(price=50)
+        bump_catalog_version()
+        self.assertIsNone(get_snapshot())
+        self.assertEqual(self.anon_client.get(address).data['price'], 50)
+        build_snapshot(SNAPSHOT_PATH)
+        with self.assertNumQueries(0):
+            response = self.anon_client.get(address)
+        self.assertEqual(json.loads(response.content)['price'], 50)
+
+    def test_rebuilt_snapshot_replaces_open_one(self):
+        """Проверка подмены снимка без закрытия открытого."""
+        product = CatalogSnapshotTestCase.products[0]
+        opened = get_snapshot()
+        fragment = opened.get('products', product.pk)
+        Product.objects.filter(pk=product.pk).update(price=70)
+        bump_catalog_version()
+        build_snapshot(SNAPSHOT_PATH)
+        self.assertEqual(opened.get('products', product.pk), fragment)
+        self.assertIsNot(get_snapshot(), opened)
+        self.assertEqual(
+            json.loads(get_snapshot().get('products', product.pk))['price'],
+            70,
+        )
+        self.assertEqual(
+            [name for name in os.listdir(TEMP_MEDIA_ROOT)
+             if name.startswith('.snapshot-')],
+            [],
+        )
+
+    def test_missing_object_falls_back_to_orm(self):
+        """Проверка ответа 404 для объекта, которого нет в снимке."""
+        response = self.anon_client.get('/api/v1/products/999/')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_snapshot_requires_shared_cache(self):
+        """Проверка ошибки настроек снимка без общего кеша."""
+        errors = check_catalog_snapshot(None)
+        self.assertEqual([error.id for error in errors], ['shop.E001'])
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': 'redis://localhost:6379/0',
+        }}):
+            self.assertEqual(check_catalog_snapshot(None), [])
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        snapshot._current = snapshot._current_key = None
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
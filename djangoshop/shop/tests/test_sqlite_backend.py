@@ -0,0 +1,64 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import SimpleTestCase
+
+from shop.backends.sqlite3.base import DatabaseWrapper
+
+
+class SQLiteBackendTestCase(SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.name = os.path.join(self.directory, 'db.sqlite3')
+        self.wrapper = DatabaseWrapper({
+            **connection.settings_dict,
+            'NAME': self.name,
+            'OPTIONS': {
+                'timeout': 1,
+                'transaction_mode': 'immediate',
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;PRAGMA synchronous=NORMAL;'
+                ),
+            },
+        })
+
+    def test_pragmas_applied_on_connect(self):
+        """Проверка выполнения init_command на новом подключении."""
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_transaction_takes_write_lock_immediately(self):
+        """Проверка, что транзакция сразу берёт блокировку записи."""
+        self.wrapper.ensure_connection()
+        self.wrapper._start_transaction_under_autocommit()
+        other = sqlite3.connect(self.name, timeout=0, isolation_level=None)
+        try:
+            with self.assertRaisesMessage(
+                sqlite3.OperationalError, 'database is locked'
+            ):
+                other.execute('BEGIN IMMEDIATE')
+        finally:
+            other.close()
+            self.wrapper.connection.rollback()
+
+    def test_unknown_transaction_mode_rejected(self):
+        """Проверка ошибки конфигурации при неизвестном режиме."""
+        self.wrapper.settings_dict['OPTIONS']['transaction_mode'] = 'lazy'
+        with self.assertRaisesMessage(
+            ImproperlyConfigured, 'transaction_mode'
+        ):
+            self.wrapper.ensure_connection()
+
+    def tearDown(self):
+        super().tearDown()
+        self.wrapper.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
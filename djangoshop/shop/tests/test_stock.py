@@ -0,0 +1,189 @@
+import shutil
+import tempfile
+from datetime import timedelta
+from http import HTTPStatus
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from shop.models import Reservation, StockShard
+from shop.stock import (
+    available_stock, guest_owner, release, release_expired, reserve,
+    set_stock, transfer, user_owner,
+)
+from shop.tests.utils import create_category, create_product, create_user
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'stock-tests',
+        }
+    },
+)
+class StockTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.cat_1 = create_category()
+        cls.product_1 = create_product(cls.cat_1, price=123)
+        cls.product_2 = create_product(cls.cat_1, 2)
+        cls.user = create_user()
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(StockTestCase.user)
+        self.owner = user_owner(StockTestCase.user)
+
+    def test_reserve_within_stock(self):
+        """Проверка резерва в пределах остатка и отказа сверх него."""
+        product = StockTestCase.product_1
+        set_stock(product.pk, 5)
+        self.assertTrue(reserve('a', product.pk, 3))
+        self.assertFalse(reserve('b', product.pk, 3))
+        self.assertTrue(reserve('b', product.pk, 2))
+        self.assertEqual(available_stock(product.pk), 0)
+        self.assertFalse(Reservation.objects.filter(
+            owner='b', quantity=3,
+        ).exists())
+
+    def test_replace_reservation(self):
+        """Проверка замены резерва с возвратом разницы на остаток."""
+        product = StockTestCase.product_1
+        set_stock(product.pk, 5)
+        reserve('a', product.pk, 4)
+        self.assertTrue(reserve('a', product.pk, 1, replace=True))
+        self.assertEqual(available_stock(product.pk), 4)
+        self.assertFalse(reserve('a', product.pk, 6, replace=True))
+        self.assertEqual(
+            Reservation.objects.get(owner='a').quantity, 1,
+        )
+
+    def test_concurrent_first_reservation(self):
+        """
+        Проверка первого резерва, который одновременно создала другая
+        транзакция.
+        """
+        product = StockTestCase.product_1
+        set_stock(product.pk, 5)
+        reserve('a', product.pk, 2)
+        first = QuerySet.first
+        missed = []
+
+        def first_missing(queryset):
+            # Строку другой транзакции первый поиск ещё не видит.
+            if not missed:
+                missed.append(queryset)
+                return None
+            return first(queryset)
+
+        with mock.patch.object(QuerySet, 'first', first_missing):
+            self.assertTrue(reserve('a', product.pk, 1))
+        self.assertEqual(Reservation.objects.get(owner='a').quantity, 3)
+        self.assertEqual(available_stock(product.pk), 2)
+
+    def test_unlimited_product_not_reserved(self):
+        """Проверка, что продукт без остатка не резервируется."""
+        self.assertTrue(reserve('a', StockTestCase.product_2.pk, 1000))
+        self.assertIsNone(available_stock(StockTestCase.product_2.pk))
+        self.assertFalse(Reservation.objects.exists())
+
+    def test_sharded_stock(self):
+        """Проверка резерва из остатка, разнесённого по частям."""
+        product = StockTestCase.product_1
+        set_stock(product.pk, 10, shards=4)
+        self.assertEqual(
+            sorted(StockShard.objects.values_list('available', flat=True)),
+            [2, 2, 3, 3],
+        )
+        self.assertTrue(reserve('a', product.pk, 7))
+        self.assertTrue(reserve('b', product.pk, 3))
+        self.assertFalse(reserve('c', product.pk, 1))
+        release('a')
+        self.assertEqual(available_stock(product.pk), 7)
+
+    def test_expired_reservations_released_in_batches(self):
+        """Проверка возврата просроченных резервов пачками."""
+        product = StockTestCase.product_1
+        set_stock(product.pk, 10)
+        for owner in 'abc':
+            reserve(owner, product.pk, 2)
+        Reservation.objects.exclude(owner='c').update(
+            expires_at=timezone.now() - timedelta(seconds=1),
+        )
+        self.assertEqual(release_expired(batch_size=1), 1)
+        self.assertEqual(release_expired(batch_size=1), 1)
+        self.assertEqual(release_expired(batch_size=1), 0)
+        self.assertEqual(available_stock(product.pk), 8)
+        self.assertEqual(
+            list(Reservation.objects.values_list('owner', flat=True)),
+            ['c'],
+        )
+
+    def test_transfer_reservations(self):
+        """Проверка переноса резервов гостевой корзины."""
+        product = StockTestCase.product_1
+        set_stock(product.pk, 10)
+        reserve('guest:1', product.pk, 2)
+        reserve(self.owner, product.pk, 3)
+        transfer('guest:1', self.owner)
+        self.assertEqual(
+            list(Reservation.objects.values_list('owner', 'quantity')),
+            [(self.owner, 5)],
+        )
+        self.assertEqual(available_stock(product.pk), 5)
+
+    def test_cart_reserves_stock(self):
+        """Проверка резерва при изменении корзины через API."""
+        product = StockTestCase.product_1
+        address = f'/api/v1/products/{product.pk}/cart/'
+        set_stock(product.pk, 3)
+        response = self.client.post(address, data={'quantity': 2})
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        response = self.client.post(address, data={'quantity': 2})
+        self.assertEqual(response.status_code, HTTPStatus.CONFLICT)
+        response = self.client.patch(address, data={'quantity': 3})
+        self.assertEqual(response.status_code, HTTPStatus.PARTIAL_CONTENT)
+        self.assertEqual(available_stock(product.pk), 0)
+        self.client.delete(address)
+        self.assertEqual(available_stock(product.pk), 3)
+        self.assertFalse(Reservation.objects.exists())
+
+    def test_guest_reservations_move_on_login(self):
+        """Проверка переноса резервов гостя при входе."""
+        product = StockTestCase.product_1
+        set_stock(product.pk, 3)
+        guest_client = APIClient()
+        response = guest_client.post(
+            f'/api/v1/guest-cart/products/{product.pk}/',
+            data={'quantity': 2},
+        )
+        cart_id = response[settings.GUEST_CART_HEADER].split(':')[0]
+        self.assertTrue(Reservation.objects.filter(
+            owner=guest_owner(cart_id),
+        ).exists())
+        guest_client.post('/api-token-auth/', data={
+            'username': 'testuser', 'password': 'testpassword1',
+        })
+        self.assertEqual(
+            list(Reservation.objects.values_list('owner', 'quantity')),
+            [(self.owner, 2)],
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
@@ -0,0 +1,126 @@
+import io
+import os
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from shop.images import variant_name
+from shop.media import release
+from shop.models import Category, Product, ProductImage
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def make_image(name, color=(200, 10, 10)):
+    content = BytesIO()
+    Image.new('RGB', (10, 10), color=color).save(content, 'PNG')
+    return SimpleUploadedFile(name, content.getvalue(),
+                              content_type='image/png')
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    MEDIA_GC_GRACE_SECONDS=0,
+    IMAGE_VARIANT_WIDTHS=[200],
+    IMAGE_VARIANTS_ASYNC=False,
+)
+class ContentAddressedStorageTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        self.category = Category.objects.create(
+            name='test_category_1',
+            slug='testcat1',
+            image=make_image('banner.png'),
+        )
+        self.product = Product.objects.create(
+            name='test_product_1',
+            slug='testprod1',
+            price=123,
+            category=self.category,
+        )
+
+    def media_path(self, name):
+        return os.path.join(TEMP_MEDIA_ROOT, name)
+
+    def test_identical_uploads_share_one_file(self):
+        """Проверка дедупликации одинаковых загрузок в разных моделях."""
+        product_image = ProductImage.objects.create(
+            image=make_image('photo.png'), product=self.product,
+        )
+        self.assertEqual(product_image.image.name, self.category.image.name)
+        self.assertTrue(self.category.image.name.startswith('cas/'))
+        directory = os.path.dirname(self.media_path(product_image.image.name))
+        self.assertEqual(len(os.listdir(directory)), 1)
+
+    def test_different_content_stored_separately(self):
+        """Проверка, что разные файлы получают разные имена."""
+        product_image = ProductImage.objects.create(
+            image=make_image('banner.png', color=(0, 0, 0)),
+            product=self.product,
+        )
+        self.assertNotEqual(
+            product_image.image.name, self.category.image.name
+        )
+
+    def test_file_removed_after_last_reference(self):
+        """Проверка удаления файла и его копий после удаления
+        последней ссылки."""
+        name = self.category.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            product_image = ProductImage.objects.create(
+                image=make_image('photo.png'), product=self.product,
+            )
+        variant = self.media_path(variant_name(name, 200, 'webp'))
+        self.assertTrue(os.path.exists(variant))
+        with self.captureOnCommitCallbacks(execute=True):
+            product_image.delete()
+        self.assertTrue(os.path.exists(self.media_path(name)))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.delete()
+        self.assertFalse(os.path.exists(self.media_path(name)))
+        self.assertFalse(os.path.exists(variant))
+
+    def test_replaced_image_released(self):
+        """Проверка освобождения файла после замены изображения."""
+        old_name = self.category.image.name
+        self.category.image = make_image('new.png', color=(0, 255, 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.save()
+        self.assertFalse(os.path.exists(self.media_path(old_name)))
+
+    def test_release_respects_grace_period(self):
+        """Проверка, что свежие файлы без ссылок не удаляются."""
+        name = self.category.image.name
+        Category.objects.filter(pk=self.category.pk).delete()
+        report = release([name], grace=3600)
+        self.assertEqual(report.removed, 0)
+        self.assertTrue(os.path.exists(self.media_path(name)))
+
+    def test_gc_command_removes_unreferenced_files(self):
+        """Проверка сборки мусора командой gc_media."""
+        kept_name = self.category.image.name
+        orphan = ProductImage.objects.create(
+            image=make_image('orphan.png', color=(1, 2, 3)),
+            product=self.product,
+        )
+        orphan_name = orphan.image.name
+        ProductImage.objects.filter(pk=orphan.pk).delete()
+        out = io.StringIO()
+        call_command('gc_media', '--grace', '0', stdout=out)
+        self.assertIn('Удалено файлов: 1', out.getvalue())
+        self.assertTrue(os.path.exists(self.media_path(kept_name)))
+        self.assertFalse(os.path.exists(self.media_path(orphan_name)))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
@@ -9,7 +9,7 @@ from rest_framework.test import APIClient
 
 from shop.models import (
     Product, ProductCart, ProductImage,
-    Cart, Category, SubCategory,
+    Category, SubCategory,
 )
 from users.models import User
 
@@ -60,9 +60,7 @@ class ShopUrlsTestCase(TestCase):
             email='test@example.com',
             password='testpassword1',
         )
-        cls.cart = Cart.objects.create(
-            user=cls.user,
-        )
+        cls.cart = cls.user.cart
         cls.product_1_cart = ProductCart.objects.create(
             cart=cls.cart,
             product=cls.product_1,
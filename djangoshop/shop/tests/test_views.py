@@ -1,16 +1,19 @@
+from datetime import timedelta
 from http import HTTPStatus
 import tempfile
 import shutil
 
 from django.conf import settings
 from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.core.files.uploadedfile import SimpleUploadedFile
 from rest_framework.test import APIClient
 from rest_framework.utils.json import loads, dumps
 
 from shop.models import (
-    Product, ProductCart, ProductImage,
-    Cart, Category, SubCategory,
+    DeletedProduct, Product, ProductCart, ProductImage,
+    Category, SubCategory,
 )
 from users.models import User
 
@@ -203,9 +206,7 @@ class ProductsViewsTestCase(TestCase):
             email='test@example.com',
             password='testpassword1',
         )
-        cls.cart = Cart.objects.create(
-            user=cls.user,
-        )
+        cls.cart = cls.user.cart
 
     def setUp(self):
         super().setUp()
@@ -345,9 +346,7 @@ class CartViewsTestCase(TestCase):
             email='test@example.com',
             password='testpassword1',
         )
-        cls.cart = Cart.objects.create(
-            user=cls.user,
-        )
+        cls.cart = cls.user.cart
         cls.product_1_cart = ProductCart.objects.create(
             cart=cls.cart,
             product=cls.product_1,
@@ -394,6 +393,34 @@ class CartViewsTestCase(TestCase):
         }
         self.assertEqual(response_data, expected_data)
 
+    def test_cart_read_query_count_is_fixed(self):
+        """Проверка постоянного числа запросов при чтении корзины."""
+        products = Product.objects.bulk_create(
+            Product(
+                name=f'bulk_product_{number}',
+                slug=f'bulkprod{number}',
+                price=1,
+                category=CartViewsTestCase.cat_1,
+            )
+            for number in range(500)
+        )
+        address = '/api/v1/cart/'
+        for size in (1, 10, 500):
+            with self.subTest(size=size):
+                ProductCart.objects.all().delete()
+                ProductCart.objects.bulk_create(
+                    ProductCart(
+                        cart=CartViewsTestCase.cart,
+                        product=product,
+                        quantity=2,
+                    )
+                    for product in products[:size]
+                )
+                with self.assertNumQueries(1):
+                    response = self.authorized_client.get(address)
+                self.assertEqual(len(response.data['products']), size)
+                self.assertEqual(response.data['full_price'], 2 * size)
+
     def test_flush_cart(self):
         """Проверка возможности полностью очистить корзину."""
         address = '/api/v1/cart/'
@@ -412,3 +439,281 @@ class CartViewsTestCase(TestCase):
 
     def tearDown(self):
         super().tearDown()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ProductExportViewsTestCase(TestCase):
+
+    test_image_bytes = (
+        b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9\x04'
+        b'\x01\x0a\x00\x01\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02'
+        b'\x02\x4c\x01\x00\x3b'
+    )
+    test_image = SimpleUploadedFile(
+        'test_image.gif',
+        test_image_bytes,
+        content_type='image/gif'
+    )
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.cat_1 = Category.objects.create(
+            name='test_category_1',
+            slug='testcat1',
+            image=cls.test_image,
+        )
+        cls.products = [
+            Product.objects.create(
+                name=f'test_product_{num}',
+                slug=f'testprod{num}',
+                price=num,
+                category=cls.cat_1,
+            )
+            for num in range(1, 4)
+        ]
+        ProductImage.objects.create(
+            image=cls.test_image,
+            product=cls.products[0],
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.anon_client = APIClient()
+
+    def get_lines(self, response):
+        content = b''.join(response.streaming_content).decode()
+        return [loads(line) for line in content.splitlines()]
+
+    def test_export_streams_all_products(self):
+        """Проверка выгрузки всех продуктов построчно в NDJSON."""
+        response = self.anon_client.get('/api/v1/products/export/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertIn('X-Export-Started-At', response)
+        lines = self.get_lines(response)
+        self.assertEqual(
+            [line['slug'] for line in lines],
+            ['testprod1', 'testprod2', 'testprod3'],
+        )
+        self.assertEqual(len(lines[0]['images']), 1)
+        self.assertEqual(lines[0]['category']['slug'], 'testcat1')
+
+    def since_now(self):
+        """Значение since для изменений после этого момента."""
+        Product.objects.update(updated_at=timezone.now() - timedelta(days=1))
+        return timezone.now().strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+    def export_since(self, since):
+        return self.get_lines(self.anon_client.get(
+            '/api/v1/products/export/', {'since': since}
+        ))
+
+    @override_settings(EXPORT_SINCE_MARGIN=0)
+    def test_export_since_returns_changed_products(self):
+        """Проверка инкрементальной выгрузки по времени изменения."""
+        response = self.anon_client.get('/api/v1/products/export/')
+        since = response['X-Export-Started-At']
+        self.get_lines(response)
+        product = ProductExportViewsTestCase.products[1]
+        product.price = 100
+        product.save()
+        response = self.anon_client.get(
+            '/api/v1/products/export/', {'since': since}
+        )
+        lines = self.get_lines(response)
+        self.assertEqual([line['slug'] for line in lines], ['testprod2'])
+
+    def test_export_since_value_has_margin(self):
+        """
+        Проверка запаса в значении since для следующей выгрузки: строки,
+        зафиксированные позже с более ранним updated_at, не теряются.
+        """
+        margin = timedelta(seconds=settings.EXPORT_SINCE_MARGIN)
+        before = timezone.now()
+        response = self.anon_client.get('/api/v1/products/export/')
+        after = timezone.now()
+        self.get_lines(response)
+        since = parse_datetime(response['X-Export-Started-At'])
+        self.assertLessEqual(before - margin, since)
+        self.assertLessEqual(since, after - margin)
+
+    def test_export_since_returns_products_with_changed_relations(self):
+        """
+        Проверка выгрузки продуктов после изменения их изображений
+        и категории.
+        """
+        since = self.since_now()
+        product = ProductExportViewsTestCase.products[1]
+        ProductImage.objects.create(image=self.test_image, product=product)
+        self.assertEqual(
+            [line['slug'] for line in self.export_since(since)],
+            ['testprod2'],
+        )
+        since = self.since_now()
+        category = ProductExportViewsTestCase.cat_1
+        category.name = 'renamed_category'
+        category.save()
+        lines = self.export_since(since)
+        self.assertEqual(
+            [line['slug'] for line in lines],
+            ['testprod1', 'testprod2', 'testprod3'],
+        )
+        self.assertEqual(lines[0]['category']['name'], 'renamed_category')
+
+    def test_export_since_reports_deleted_products(self):
+        """Проверка строк об удалённых продуктах в выгрузке с since."""
+        product = Product.objects.create(
+            name='deleted_product', slug='deletedprod', price=1,
+            category=ProductExportViewsTestCase.cat_1,
+        )
+        product_id = product.pk
+        since = self.since_now()
+        product.delete()
+        self.assertEqual(
+            self.export_since(since), [{'id': product_id, 'deleted': True}],
+        )
+        response = self.anon_client.get('/api/v1/products/export/')
+        self.assertNotIn(
+            product_id, [line['id'] for line in self.get_lines(response)],
+        )
+
+    def test_export_since_rejected_after_deletions_pruned(self):
+        """
+        Проверка удаления старых записей об удалённых продуктах и отказа
+        в выгрузке с since раньше срока их хранения.
+        """
+        old = timezone.now() - timedelta(
+            days=settings.EXPORT_DELETED_DAYS, seconds=1,
+        )
+        DeletedProduct.objects.create(product_id=1000, deleted_at=old)
+        Product.objects.create(
+            name='deleted_product', slug='deletedprod', price=1,
+        ).delete()
+        self.assertFalse(
+            DeletedProduct.objects.filter(product_id=1000).exists()
+        )
+        response = self.anon_client.get(
+            '/api/v1/products/export/',
+            {'since': old.strftime('%Y-%m-%dT%H:%M:%S.%fZ')},
+        )
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_export_rejects_invalid_since(self):
+        """Проверка ошибки при некорректном параметре since."""
+        response = self.anon_client.get(
+            '/api/v1/products/export/', {'since': 'yesterday'}
+        )
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ProductBatchViewsTestCase(TestCase):
+
+    test_image_bytes = (
+        b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9\x04'
+        b'\x01\x0a\x00\x01\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02'
+        b'\x02\x4c\x01\x00\x3b'
+    )
+    test_image = SimpleUploadedFile(
+        'test_image.gif',
+        test_image_bytes,
+        content_type='image/gif'
+    )
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.cat_1 = Category.objects.create(
+            name='test_category_1',
+            slug='testcat1',
+            image=cls.test_image,
+        )
+        cls.subcat_1 = SubCategory.objects.create(
+            name='test_subcategory_1',
+            slug='testsubcat1',
+            image=cls.test_image,
+            category=cls.cat_1,
+        )
+        cls.products = [
+            Product.objects.create(
+                name=f'test_product_{num}',
+                slug=f'testprod{num}',
+                price=num,
+                category=cls.cat_1,
+                subcategory=cls.subcat_1,
+            )
+            for num in range(1, 51)
+        ]
+        ProductImage.objects.bulk_create(
+            ProductImage(image='products/test.gif', product=product)
+            for product in cls.products
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.anon_client = APIClient()
+
+    def test_batch_by_ids_keeps_order(self):
+        """Проверка вывода продуктов по id в порядке запроса."""
+        products = ProductBatchViewsTestCase.products
+        ids = [products[2].pk, products[0].pk, products[1].pk]
+        response = self.anon_client.get(
+            '/api/v1/products/batch/',
+            {'ids': ','.join(map(str, ids))},
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(
+            [product['id'] for product in response.data['results']], ids,
+        )
+        self.assertEqual(response.data['not_found'], [])
+        self.assertEqual(len(response.data['results'][0]['images']), 1)
+
+    def test_batch_by_slugs_reports_missing(self):
+        """Проверка списка ненайденных slug'ов."""
+        response = self.anon_client.post(
+            '/api/v1/products/batch/',
+            data={'slugs': ['testprod5', 'missing', 'testprod4']},
+            format='json',
+        )
+        self.assertEqual(
+            [product['slug'] for product in response.data['results']],
+            ['testprod5', 'testprod4'],
+        )
+        self.assertEqual(response.data['not_found'], ['missing'])
+
+    def test_batch_query_count_is_fixed(self):
+        """Проверка постоянного числа запросов при любом размере пачки."""
+        for size in (1, 50):
+            ids = [
+                product.pk
+                for product in ProductBatchViewsTestCase.products[:size]
+            ]
+            with self.subTest(size=size), self.assertNumQueries(2):
+                response = self.anon_client.post(
+                    '/api/v1/products/batch/', data={'ids': ids},
+                    format='json',
+                )
+                self.assertEqual(len(response.data['results']), size)
+
+    def test_batch_rejects_invalid_requests(self):
+        """Проверка ошибок при неверном или слишком большом запросе."""
+        too_many = ','.join(str(pk) for pk in range(1, 102))
+        for params in ({}, {'ids': 'a,b'}, {'ids': too_many},
+                       {'ids': '1', 'slugs': 'testprod1'}):
+            with self.subTest(params=params):
+                response = self.anon_client.get(
+                    '/api/v1/products/batch/', params,
+                )
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.BAD_REQUEST)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
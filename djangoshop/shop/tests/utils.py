@@ -0,0 +1,60 @@
+"""
+Общие данные тестов: тестовое изображение и каталог из одной категории,
+подкатегории и продуктов с предсказуемыми названиями и slug,
+покупатель testuser.
+"""
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from shop.models import Category, Product, SubCategory
+from users.models import User
+
+
+TEST_IMAGE_BYTES = (
+    b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9\x04'
+    b'\x01\x0a\x00\x01\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02'
+    b'\x02\x4c\x01\x00\x3b'
+)
+
+
+def image_file(name='test_image.gif'):
+    """Загружаемый файл с GIF 1×1."""
+    return SimpleUploadedFile(name, TEST_IMAGE_BYTES, content_type='image/gif')
+
+
+def create_category(number=1, **fields):
+    return Category.objects.create(
+        name=f'test_category_{number}',
+        slug=f'testcat{number}',
+        image=image_file(),
+        **fields,
+    )
+
+
+def create_subcategory(category, number=1, **fields):
+    return SubCategory.objects.create(
+        name=f'test_subcategory_{number}',
+        slug=f'testsubcat{number}',
+        image=image_file(),
+        category=category,
+        **fields,
+    )
+
+
+def create_product(category, number=1, price=10, **fields):
+    return Product.objects.create(
+        name=f'test_product_{number}',
+        slug=f'testprod{number}',
+        price=price,
+        category=category,
+        **fields,
+    )
+
+
+def create_user(**fields):
+    fields = {
+        'username': 'testuser',
+        'email': 'test@example.com',
+        'password': 'testpassword1',
+        **fields,
+    }
+    return User.objects.create_user(**fields)
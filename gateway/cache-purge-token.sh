@@ -0,0 +1,18 @@
+#!/bin/sh
+# Writes the purge token into the map of gateway/nginx.conf. Without
+# CACHE_PURGE_TOKEN the map stays empty and no request refreshes the
+# cache, Django does not send purges either.
+set -e
+
+conf=/etc/nginx/cache_purge_token.conf
+if [ -z "${CACHE_PURGE_TOKEN:-}" ]; then
+    : > "$conf"
+    exit 0
+fi
+case "$CACHE_PURGE_TOKEN" in
+    *[!A-Za-z0-9_-]*)
+        echo "$0: CACHE_PURGE_TOKEN may only contain letters, digits, _ and -" >&2
+        exit 1
+        ;;
+esac
+printf '"%s" 1;\n' "$CACHE_PURGE_TOKEN" > "$conf"